@@ -0,0 +1,48 @@
+"""
+Benchmark for :py:func:`~dff_node_stats.widgets.visualizers.get_nodes_and_edges`
+on synthetic stats with the given numbers of rows::
+
+    python benchmarks/get_nodes_and_edges.py --rows 1000000 10000000
+
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.widgets.visualizers import get_nodes_and_edges
+
+
+def make_stats(rows: int, turns_per_context: int = 20, flows: int = 10, nodes_per_flow: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    contexts = max(rows // turns_per_context, 1)
+    context_ids = rng.integers(0, contexts, rows)
+    flow_ids = rng.integers(0, flows, rows)
+    node_ids = rng.integers(0, nodes_per_flow, rows)
+    return pd.DataFrame(
+        {
+            "context_id": pd.Categorical.from_codes(context_ids, [f"ctx{i}" for i in range(contexts)]),
+            "history_id": rng.integers(0, turns_per_context, rows),
+            "start_time": pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 10**9, rows), unit="ms"),
+            "duration_time": rng.random(rows),
+            "flow_label": pd.Categorical.from_codes(flow_ids, [f"flow{i}" for i in range(flows)]),
+            "node_label": pd.Categorical.from_codes(node_ids, [f"node{i}" for i in range(nodes_per_flow)]),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    args = parser.parse_args()
+    for rows in args.rows:
+        df = make_stats(rows)
+        started = time.perf_counter()
+        result = get_nodes_and_edges(df)
+        elapsed = time.perf_counter() - started
+        print(f"{rows:>12,} rows: {elapsed:.2f}s, {result['edge'].cat.categories.size:,} distinct edges")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Analytics
+***********
+| Markov-chain analytics over the node transitions, backed by sparse matrices.
+| :py:func:`~dff_node_stats.analytics.get_markov_chain` turns the stats dataframe into a
+| :py:class:`~dff_node_stats.analytics.MarkovChain`, which answers questions like
+| "what fraction of the dialogs starting at `root:start` reach `root:fallback`"
+| or "how many turns does it take to reach a node".
+| All the computations use :py:mod:`scipy.sparse`, so scripts with tens of thousands of nodes are fine.
+| The `scipy` package is required to use this module.
+
+Every turn either moves a dialog to the next node or ends it. The chain keeps both outcomes:
+the probability to leave a node for each of its successors, and the probability to end the dialog there.
+
+"""
+from typing import Iterable, NamedTuple, Union
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import MatrixRankWarning, spsolve
+
+from dff_node_stats.transitions import get_transitions
+from dff_node_stats.utils import DffStatsException, cached_transform, requires_columns
+
+
+class MarkovChain(NamedTuple):
+    """
+    The transition counts between the nodes along with the number of turns that started and visited each node.
+    Node ids are the node codes of :py:class:`~dff_node_stats.transitions.Transitions`.
+
+    Attributes:
+        nodes: Node names ("flow_label:node_label"), indexed by node ids.
+
+        counts: Sparse CSR matrix, `counts[i, j]` is the number of transitions from node `i` to node `j`.
+
+        visits: The number of turns that reached each node.
+
+        starts: The number of dialogs that started at each node.
+
+    """
+
+    nodes: pd.Index
+    counts: sparse.csr_matrix
+    visits: np.ndarray
+    starts: np.ndarray
+
+    def probabilities(self) -> sparse.csr_matrix:
+        """
+        The transition matrix normalized by the outgoing transitions of each node.
+        Rows of the nodes without outgoing transitions are zero.
+        """
+        outgoing = np.asarray(self.counts.sum(axis=1)).ravel()
+        return sparse.diags(_inverse(outgoing)) @ self.counts
+
+    def end_probabilities(self) -> np.ndarray:
+        """The probability for a dialog to end at each node."""
+        outgoing = np.asarray(self.counts.sum(axis=1)).ravel()
+        return np.clip(self.visits - outgoing, 0, None) * _inverse(self.visits)
+
+    def absorbing_nodes(self) -> pd.Index:
+        """The nodes that are never left for another node once reached."""
+        others = self.counts - sparse.diags(self.counts.diagonal())
+        leaving = np.asarray(others.sum(axis=1)).ravel()
+        return self.nodes[(leaving == 0) & (self.visits > 0)]
+
+    def stationary_distribution(self) -> pd.Series:
+        """
+        | The long-run share of turns spent at each node, assuming that every ended dialog
+        | is replaced by a new one started like the collected dialogs.
+        | It is proportional to the expected number of visits of each node per dialog,
+        | which solve the sparse system `v = v Q + s`, `Q` being the steps between nodes and `s` the starts.
+        """
+        if self.starts.sum() == 0:
+            return pd.Series(np.zeros(len(self.nodes)), index=self.nodes)
+        restart = self.starts / self.starts.sum()
+        visits = _solve(self._step_matrix().T.tocsr(), restart)
+        return pd.Series(visits / visits.sum(), index=self.nodes)
+
+    def hitting_probabilities(self, targets: Union[str, Iterable[str]]) -> pd.Series:
+        """
+        The probability for a dialog at each node to reach any of the `targets` before it ends.
+
+        Parameters
+        ----------
+
+        targets: Union[str, Iterable[str]]
+            Names of the target nodes.
+        """
+        probs, _, _ = self._hitting(targets)
+        return pd.Series(probs, index=self.nodes)
+
+    def expected_steps(self, targets: Union[str, Iterable[str]]) -> pd.Series:
+        """
+        The expected number of turns for a dialog at each node to reach any of the `targets`,
+        among the dialogs that reach them. It is infinite for the nodes the targets cannot be reached from.
+
+        Parameters
+        ----------
+
+        targets: Union[str, Iterable[str]]
+            Names of the target nodes.
+        """
+        probs, transient, inner = self._hitting(targets)
+        # the steps k conditioned on reaching the targets satisfy m = h + Q m with m = h * k
+        weighted = _solve(inner, np.where(transient, probs, 0.0))
+        steps = np.divide(weighted, probs, out=np.full(len(probs), np.inf), where=probs > 0)
+        steps[~transient] = 0.0
+        return pd.Series(steps, index=self.nodes)
+
+    def node_ids(self, names: Union[str, Iterable[str]]) -> np.ndarray:
+        """
+        Return the ids of the named nodes.
+
+        Parameters
+        ----------
+
+        names: Union[str, Iterable[str]]
+            Node names ("flow_label:node_label").
+        """
+        names = [names] if isinstance(names, str) else list(names)
+        ids = self.nodes.get_indexer(names)
+        if (ids < 0).any():
+            unknown = [name for name, node_id in zip(names, ids) if node_id < 0]
+            raise DffStatsException(f"Unknown nodes: {', '.join(unknown)}")
+        return ids
+
+    def _step_matrix(self) -> sparse.csr_matrix:
+        """The probabilities to move from node to node, the remaining probability of each row ends the dialog."""
+        return sparse.diags(_inverse(self.visits)) @ self.counts
+
+    def _hitting(self, targets: Union[str, Iterable[str]]):
+        """
+        Solve `h = Q h + b` for the hitting probabilities `h`, `Q` being the steps between non-target nodes
+        and `b` the probability to step into a target.
+        """
+        step = self._step_matrix()
+        transient = np.ones(len(self.nodes), dtype=bool)
+        transient[self.node_ids(targets)] = False
+        keep = sparse.diags(transient.astype(np.float64))
+        inner = (step @ keep).tocsr()  # steps that do not enter a target
+        into_targets = np.asarray((step @ sparse.diags((~transient).astype(np.float64))).sum(axis=1)).ravel()
+        probs = _solve(inner, np.where(transient, into_targets, 0.0))
+        probs[~transient] = 1.0
+        return np.clip(probs, 0.0, 1.0), transient, inner
+
+
+def _solve(matrix: sparse.csr_matrix, rhs: np.ndarray) -> np.ndarray:
+    """
+    | Solve `x = matrix @ x + rhs` directly with a sparse LU factorization of `I - matrix`.
+    | The matrix is sub-stochastic because dialogs end, so the system has a single solution.
+    | Iterating `x = matrix @ x + rhs` instead would need as many iterations as the longest dialogs
+    | have turns, e.g. on a node that loops on itself thousands of times.
+    """
+    system = (sparse.identity(matrix.shape[0], format="csc") - matrix).tocsc()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", MatrixRankWarning)
+        try:
+            solution = np.atleast_1d(spsolve(system, rhs))
+        except MatrixRankWarning:
+            solution = np.full(len(rhs), np.nan)
+    if not np.isfinite(solution).all():
+        raise DffStatsException("The transition system is singular: some dialogs never end")
+    return solution
+
+
+def _inverse(values: np.ndarray) -> np.ndarray:
+    """Elementwise `1 / values`, zero where the values are zero."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.divide(1.0, values, out=np.zeros_like(values), where=values > 0)
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+@cached_transform
+def get_markov_chain(df: pd.DataFrame) -> MarkovChain:
+    """
+    Build the Markov chain of the node transitions of the stats dataframe.
+    The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe. `history_id` or `start_time` define the order of the turns if present.
+    """
+    transitions = get_transitions(df)
+    n = len(transitions.nodes)
+    src, dst = transitions.edges()
+    counts = sparse.coo_matrix((np.ones(len(src)), (src, dst)), shape=(n, n)).tocsr()  # duplicates are summed
+    reached = transitions.node_codes >= 0
+    visits = np.bincount(transitions.node_codes[reached], minlength=n).astype(np.float64)
+    started = reached & (transitions.prev_codes < 0)
+    starts = np.bincount(transitions.node_codes[started], minlength=n).astype(np.float64)
+    return MarkovChain(pd.Index(transitions.nodes, dtype=object), counts, visits, starts)
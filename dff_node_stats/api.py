@@ -6,13 +6,25 @@ API
 | should have this signature.
 
 """
-from typing import Callable, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Union
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
 import pandas as pd
 import uvicorn
 
-from dff_node_stats.utils import requires_transform, requires_columns, transform_once
+from dff_node_stats.frame import LazyFrame
+from dff_node_stats.live import LiveMetrics
+from dff_node_stats.sequences import get_sequences
+from dff_node_stats.sketches import (
+    SketchSet,
+    SpaceSaving,
+    count_contexts,
+    get_edge_duration_sketches,
+    get_node_duration_sketches,
+    heavy_hitters,
+)
+from dff_node_stats.transitions import get_transitions
+from dff_node_stats.utils import DffStatsException, requires_transform, requires_columns
 
 RouteType = Callable[[FastAPI, Optional[pd.DataFrame]], FastAPI]
 """
@@ -22,7 +34,11 @@ RouteType = Callable[[FastAPI, Optional[pd.DataFrame]], FastAPI]
 """
 
 
-def add_default_routes(app: FastAPI, df: pd.DataFrame) -> FastAPI:
+def add_default_routes(
+    app: FastAPI,
+    df: Union[pd.DataFrame, LazyFrame],
+    sketches: Optional[Union[SketchSet, Callable[[], SketchSet]]] = None,
+) -> FastAPI:
     """
     | Add a standard set of routes to the FastAPI object, using the provided dataframe
 
@@ -31,56 +47,181 @@ def add_default_routes(app: FastAPI, df: pd.DataFrame) -> FastAPI:
 
     api: :py:class:`~fastapi.FastAPI`
         The FastAPI object to which the endpoints should be atached.
-    df: :py:class:`~pandas.DataFrame`
-        The dataframe to retrieve data from.
+    df: Union[:py:class:`~pandas.DataFrame`, :py:class:`~dff_node_stats.frame.LazyFrame`]
+        The dataframe to retrieve data from. A lazy frame only loads the columns the routes need.
+    sketches: Optional[Union[:py:class:`~dff_node_stats.sketches.SketchSet`, Callable]]
+        The sketches persisted for the same data, see :py:meth:`~dff_node_stats.stats.Stats.load_sketches`.
+        The sketch metrics are read from them, instead of being computed from the dataframe.
+        A sketch set is a snapshot that does not follow the refreshes of a lazy frame:
+        pass a function such as `stats.load_sketches` to load the current sketches on each request.
     """
 
-    @requires_columns(["flow_label", "node_label"])
-    def transitions(df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
-        df["node"] = df.apply(lambda row: f"{row.flow_label}:{row.node_label}", axis=1)
-        df = df.drop(["flow_label", "node_label"], axis=1)
-        df = df.sort_values(["context_id"], kind="stable")
-        df["next_node"] = df.node.shift()
-        df = df[df.history_id != 0]
-        transitions = df.apply(lambda row: f"{row.node}->{row.next_node}", axis=1)
-        return transitions.value_counts()
+    def saved_sketches() -> Optional[SketchSet]:
+        return sketches() if callable(sketches) else sketches
+
+    @requires_columns(["context_id", "history_id", "flow_label", "node_label"])
+    def transitions(df: pd.DataFrame) -> pd.Series:
+        return get_transitions(df).counts()
 
     @requires_transform(transitions)
     def transition_counts(df) -> Dict[str, int]:
         return {k: int(v) for k, v in dict(df).items()}
 
+    @requires_columns(["context_id", "history_id", "flow_label", "node_label"])
+    def top_transitions(df: pd.DataFrame, top_k: int) -> SpaceSaving:
+        return heavy_hitters(df, "edge", top_k)
+
+    def saved_top_transitions(df: Union[pd.DataFrame, LazyFrame], top_k: int) -> SpaceSaving:
+        saved = saved_sketches()
+        if saved is not None and "top/edges" in saved and top_k <= saved["top/edges"].capacity:
+            return saved["top/edges"]
+        return top_transitions(df, top_k)
+
+    def top_transition_counts(df: Union[pd.DataFrame, LazyFrame], top_k: int) -> Dict[str, int]:
+        return {k: int(v) for k, v in saved_top_transitions(df, top_k).top(top_k).items()}
+
     @app.get("/api/v1/stats/transition-counts", response_model=Dict[str, int])
-    async def get_transition_counts():
-        return transition_counts(df)
+    async def get_transition_counts(top_k: Optional[int] = Query(None, ge=1)):
+        """
+        The number of times each transition occurred. With `top_k`, only the `top_k` most frequent
+        transitions are returned, tracked in bounded memory by a SpaceSaving summary that monitors
+        `capacity` transitions: a count may be overestimated by at most the `floor` of the summary,
+        which is at most the number of transitions divided by the capacity.
+        The "top/edges" summary persisted by the collecting processes is served if there is one,
+        its capacity is the `top_capacity` of the :py:class:`~dff_node_stats.stats.Stats`.
+        A summary is computed from the dataframe with a capacity of `10 * top_k` otherwise,
+        or if `top_k` is above the capacity of the persisted one.
+        """
+        return transition_counts(df) if top_k is None else top_transition_counts(df, top_k)
 
     @requires_transform(transitions)
     def transition_probs(df) -> Dict[str, float]:
-        tc = {k: int(v) for k, v in dict(df).items()}
-        return {k: v / sum(tc.values(), 0) for k, v in tc.items()}
+        return {k: float(v) for k, v in (df / df.sum()).items()}
+
+    def top_transition_probs(df: Union[pd.DataFrame, LazyFrame], top_k: int) -> Dict[str, float]:
+        summary = saved_top_transitions(df, top_k)
+        return {k: int(v) / summary.total for k, v in summary.top(top_k).items()}
 
     @app.get("/api/v1/stats/transition-probs", response_model=Dict[str, float])
-    async def get_transition_probs():
-        return transition_probs(df)
+    async def get_transition_probs(top_k: Optional[int] = Query(None, ge=1)):
+        """
+        The share of each transition among all the transitions.
+        With `top_k`, only the `top_k` most frequent transitions are returned, see `transition-counts`.
+        """
+        return transition_probs(df) if top_k is None else top_transition_probs(df, top_k)
+
+    @requires_columns(["context_id", "history_id", "flow_label", "node_label"])
+    def paths(df: pd.DataFrame, length: int, top_k: int) -> Dict[str, int]:
+        return {k: int(v) for k, v in get_sequences(df).ngram_counts(length, top_k).items()}
+
+    @app.get("/api/v1/stats/paths", response_model=Dict[str, int])
+    async def get_paths(length: int = Query(3, ge=1), top_k: int = Query(20, ge=1)):
+        return paths(df, length, top_k)
+
+    @requires_columns(["context_id", "history_id", "flow_label", "node_label"])
+    def funnel(df: pd.DataFrame, steps: List[str]) -> Dict[str, int]:
+        return {k: int(v) for k, v in get_sequences(df).funnel(steps).items()}
+
+    @app.get("/api/v1/stats/funnel", response_model=Dict[str, int])
+    async def get_funnel(steps: List[str] = Query(...)):
+        try:
+            return funnel(df, steps)
+        except DffStatsException as error:
+            raise HTTPException(status_code=400, detail=str(error))
+
+    @requires_columns(["context_id", "history_id", "flow_label", "node_label", "duration_time"])
+    def duration_percentiles(df: pd.DataFrame, by: str, q: List[float]) -> Dict[str, Dict[str, float]]:
+        sketches = get_node_duration_sketches(df) if by == "node" else get_edge_duration_sketches(df)
+        return sketches.quantiles(q).to_dict(orient="index")
+
+    @app.get("/api/v1/stats/duration-percentiles", response_model=Dict[str, Dict[str, float]])
+    async def get_duration_percentiles(
+        by: str = Query("node", regex="^(node|edge)$"), q: List[float] = Query([0.5, 0.95, 0.99], ge=0, le=1)
+    ):
+        """
+        The `duration_time` percentiles of each node or transition, computed from mergeable sketches.
+        Each percentile is within 1% of the exact value.
+        The persisted sketches are used if there are any.
+        """
+        saved = saved_sketches()
+        saved = saved.prefixed(f"duration/{by}/") if saved is not None else None
+        return saved.quantiles(q).to_dict(orient="index") if saved else duration_percentiles(df, by, q)
+
+    @requires_columns(["context_id", "history_id", "flow_label", "node_label"])
+    def unique_dialogs(df: pd.DataFrame, by: str, exact: Optional[bool]) -> Dict[str, int]:
+        return {k: int(v) for k, v in count_contexts(df, by, exact).items()}
+
+    def saved_unique_dialogs(by: str) -> Optional[Dict[str, int]]:
+        saved = saved_sketches()
+        saved = saved.prefixed(f"contexts/{by}/") if saved is not None else None
+        return {k: int(v) for k, v in saved.distinct_counts().items()} if saved else None
+
+    @app.get("/api/v1/stats/unique-dialogs", response_model=Dict[str, int])
+    async def get_unique_dialogs(by: str = Query("node", regex="^(node|flow)$"), exact: Optional[bool] = None):
+        """
+        The number of distinct contexts of each node or flow, estimated with HyperLogLog sketches
+        (1.6% standard error). The counts are exact for small data or if `exact` is set.
+        The persisted sketches are used if there are any, unless `exact` is set.
+        """
+        saved = None if exact else saved_unique_dialogs(by)
+        return unique_dialogs(df, by, exact) if saved is None else saved
+
+    return app
+
+
+def add_live_routes(app: FastAPI, live: LiveMetrics) -> FastAPI:
+    """
+    | Add the routes of the sliding-window metrics to the FastAPI object.
+
+    Parameters
+    ----------
+
+    app: FastAPI
+        The application to add the routes to.
+    live: :py:class:`~dff_node_stats.live.LiveMetrics`
+        The metrics updated by the :py:class:`~dff_node_stats.stats.Stats` collecting the turns.
+    """
+
+    @app.get("/api/v1/live/metrics", response_model=Dict[str, Any])
+    async def get_live_metrics(window: int = Query(300, ge=1), top_k: int = Query(10, ge=1)):
+        """
+        The turns per second, the fallback rate, the `duration_time` percentiles and the most visited nodes
+        of the turns collected during the last `window` seconds.
+        """
+        if window not in live.windows:
+            raise HTTPException(status_code=400, detail=f"Unknown window: {window}, expected one of {live.windows}")
+        return live.metrics(window, top_k)._asdict()
 
     return app
 
 
-def api_run(df: pd.DataFrame, routes: Optional[RouteType] = None, port: int = 8000) -> None:
+def api_run(
+    df: Union[pd.DataFrame, LazyFrame],
+    routes: Optional[RouteType] = None,
+    port: int = 8000,
+    live: Optional[LiveMetrics] = None,
+    sketches: Optional[Union[SketchSet, Callable[[], SketchSet]]] = None,
+) -> None:
     """
     | Run a FastAPI server with a user-provided dataframe
 
     Parameters
     ----------
 
-    df: :py:class:`~pandas.DataFrame`
+    df: Union[:py:class:`~pandas.DataFrame`, :py:class:`~dff_node_stats.frame.LazyFrame`]
         The dataframe to retrieve data from.
     routes: :py:const:`RouteType <dff_node_stats.api.RouteType>`
         Optional function that attaches the user-defined endpoints to the API,
         overriding the default ones.
     port: int
         The port the API will listen to.
+    live: Optional[:py:class:`~dff_node_stats.live.LiveMetrics`]
+        If set, the routes of the sliding-window metrics are added as well.
+    sketches: Optional[Union[:py:class:`~dff_node_stats.sketches.SketchSet`, Callable]]
+        The sketches persisted for the same data, or a function that loads them, passed to the default routes.
     """
     app = FastAPI()
-    app = add_default_routes(app, df) if not routes else routes(app, df)
+    app = add_default_routes(app, df, sketches) if not routes else routes(app, df)
+    if live is not None:
+        app = add_live_routes(app, live)
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,369 @@
+"""
+Chunked
+***********
+| Out-of-core aggregation for storages that do not fit into memory.
+| :py:class:`~dff_node_stats.chunked.ChunkedAggregator` consumes the chunks yielded by
+| :py:meth:`~dff_node_stats.savers.saver.Saver.iter_load` one at a time and keeps partial aggregates only:
+| node and transition counts, transition durations and the per-context session state.
+| The last node of each context is carried over to the next chunk, so the transitions that cross
+| a chunk boundary are counted as well. The peak memory depends on the chunk size
+| and on the number of distinct nodes, transitions and contexts, not on the number of rows.
+| Rows are expected in the order they were saved, i.e. the turns of a context never go back in time
+| from one chunk to the next.
+
+Example::
+
+    aggregator = aggregate_chunks(saver, chunksize=100000)
+    aggregator.transition_counts()
+    aggregator.sessions()
+    aggregator = aggregate_chunks(saver, aggregator=aggregator)  # only reads the rows saved since
+
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.savers import Saver, Watermark
+from dff_node_stats.sessions import FALLBACK_PATTERN, SOURCE_COLUMNS
+from dff_node_stats.transitions import turn_order
+from dff_node_stats.utils import DffStatsException
+
+_EDGE_SHIFT = 32
+"""
+Transitions are accumulated as `src << _EDGE_SHIFT | dst` integer keys.
+
+"""
+
+
+class ChunkedAggregator:
+    """
+    | Accumulates the aggregates of the built-in transforms over a stream of stats chunks.
+    | The results follow the layout of their in-memory counterparts in
+    | :py:class:`~dff_node_stats.transitions.Transitions` and :py:func:`~dff_node_stats.sessions.summarize_sessions`.
+
+    Parameters
+    ----------
+
+    fallback_pattern: str
+        Nodes with this substring in their `node_label` (case-insensitive) count as fallback nodes.
+    """
+
+    def __init__(self, fallback_pattern: str = FALLBACK_PATTERN) -> None:
+        self.fallback_pattern = fallback_pattern
+        self.watermark: Optional[Watermark] = None
+        self.rows = 0
+        self._nodes: Dict[str, int] = {}
+        self._flows: Dict[str, int] = {}
+        self._node_counts = np.zeros(0, dtype=np.int64)
+        self._edges = pd.DataFrame({"count": pd.Series(dtype=np.int64), "duration_sum": pd.Series(dtype=np.float64)})
+        self._edge_durations = pd.Series(dtype=np.int64)  # the number of transitions with a known duration
+        self._contexts: Dict[object, int] = {}
+        self._state: Dict[str, np.ndarray] = {
+            "turns": np.zeros(0, dtype=np.int64),
+            "first_node": np.zeros(0, dtype=np.int64),
+            "last_node": np.zeros(0, dtype=np.int64),
+            "fallback": np.zeros(0, dtype=bool),
+            "flows": np.zeros(0, dtype=np.uint64),
+            "duration_total": np.zeros(0, dtype=np.float64),
+            "duration_count": np.zeros(0, dtype=np.int64),
+            "first_duration": np.zeros(0, dtype=np.float64),
+            "start_time": np.zeros(0, dtype="datetime64[ns]"),
+        }
+        self._extra_flows: Dict[int, set] = {}  # flows beyond the 64 that fit into the bitmask
+        self._optional_columns: set = set()  # the optional columns seen in the chunks
+
+    def update(self, chunk: pd.DataFrame) -> "ChunkedAggregator":
+        """
+        Add a chunk of stats to the aggregates. Returns the aggregator.
+
+        Parameters
+        ----------
+
+        chunk: pd.DataFrame
+            A chunk with the `context_id`, `flow_label` and `node_label` columns.
+            `history_id` or `start_time` define the order of the turns, `duration_time` is used if present.
+        """
+        missing = {"context_id", "flow_label", "node_label"} - set(chunk.columns)
+        if missing:
+            raise DffStatsException(f"Required columns missing: {', '.join(sorted(missing))}")
+        self.rows += len(chunk)
+        self._optional_columns |= {"duration_time", "start_time"} & set(chunk.columns)
+        local_contexts, context_ids = pd.factorize(chunk["context_id"])
+        order = turn_order(chunk, local_contexts)
+        order = order[local_contexts[order] >= 0]
+        contexts = self._codes(self._contexts, context_ids)[local_contexts[order]]
+        self._grow(len(self._contexts))
+        nodes, flows = self._node_codes(chunk)
+        nodes, flows = nodes[order], flows[order]
+
+        # the previous node of the first turn of a context in this chunk comes from the earlier chunks
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = contexts[1:] != contexts[:-1]
+        last = np.append(first[1:], True)
+        prev = np.roll(nodes, 1)
+        prev[first] = self._state["last_node"][contexts[first]]
+
+        known = nodes >= 0
+        self._node_counts += np.bincount(nodes[known], minlength=len(self._node_counts))
+        durations = None
+        if "duration_time" in chunk.columns:
+            durations = chunk["duration_time"].to_numpy(dtype=np.float64)[order]
+        self._add_edges(prev, nodes, durations)
+        self._add_sessions(contexts, nodes, flows, first, last, durations, chunk, order)
+        return self
+
+    def merge(self, other: "ChunkedAggregator") -> "ChunkedAggregator":
+        """
+        | Add the aggregates of another aggregator to this one. Returns this aggregator.
+        | The rows of `other` are taken to come after the rows of this aggregator,
+        | so the transitions from the last node of a context here to its first node in `other` are counted.
+        | Aggregators over disjoint sets of contexts can be merged in any order.
+
+        Parameters
+        ----------
+
+        other: :py:class:`~dff_node_stats.chunked.ChunkedAggregator`
+            The aggregator to merge.
+        """
+        node_map = np.append(self._codes(self._nodes, list(other._nodes)), -1)  # -1 maps to -1
+        flow_map = self._codes(self._flows, list(other._flows))
+        self._node_counts = np.append(self._node_counts, np.zeros(len(self._nodes) - len(self._node_counts), np.int64))
+        self._node_counts[node_map[:-1]] += other._node_counts
+        keys = other._edges.index.to_numpy(dtype=np.int64)
+        src, dst = node_map[keys >> _EDGE_SHIFT], node_map[keys & ((1 << _EDGE_SHIFT) - 1)]
+        edges = other._edges.set_axis(src << _EDGE_SHIFT | dst)
+        self._edges = self._edges.add(edges, fill_value=0).astype({"count": np.int64})
+        keys = other._edge_durations.index.to_numpy(dtype=np.int64)
+        src, dst = node_map[keys >> _EDGE_SHIFT], node_map[keys & ((1 << _EDGE_SHIFT) - 1)]
+        edge_durations = other._edge_durations.set_axis(src << _EDGE_SHIFT | dst)
+        self._edge_durations = self._edge_durations.add(edge_durations, fill_value=0).astype(np.int64)
+
+        n_other = len(other._contexts)
+        contexts = self._codes(self._contexts, list(other._contexts))
+        self._grow(len(self._contexts))
+        state = self._state
+        theirs = {name: values[:n_other] for name, values in other._state.items()}
+        first_node, last_node = node_map[theirs["first_node"]], node_map[theirs["last_node"]]
+        new = state["turns"][contexts] == 0
+        bridged = ~new & (theirs["turns"] > 0)
+        durations = theirs["first_duration"][bridged] if "duration_time" in other._optional_columns else None
+        self._add_edges(state["last_node"][contexts[bridged]], first_node[bridged], durations)
+
+        state["turns"][contexts] += theirs["turns"]
+        state["first_node"][contexts[new]] = first_node[new]
+        state["first_duration"][contexts[new]] = theirs["first_duration"][new]
+        seen = theirs["turns"] > 0
+        state["last_node"][contexts[seen]] = last_node[seen]
+        state["fallback"][contexts] |= theirs["fallback"]
+        for bit, flow in enumerate(flow_map[:64]):
+            has_flow = (theirs["flows"] >> np.uint64(bit)) & np.uint64(1) == 1
+            if flow < 64:
+                state["flows"][contexts[has_flow]] |= np.uint64(1) << np.uint64(flow)
+            else:
+                for context in contexts[has_flow]:
+                    self._extra_flows.setdefault(int(context), set()).add(int(flow))
+        for context, extra in other._extra_flows.items():
+            for flow in flow_map[list(extra)]:
+                if flow < 64:
+                    state["flows"][contexts[context]] |= np.uint64(1) << np.uint64(flow)
+                else:
+                    self._extra_flows.setdefault(int(contexts[context]), set()).add(int(flow))
+        state["duration_total"][contexts] += theirs["duration_total"]
+        state["duration_count"][contexts] += theirs["duration_count"]
+        unset = np.isnat(state["start_time"][contexts])
+        state["start_time"][contexts[unset]] = theirs["start_time"][unset]
+
+        self.rows += other.rows
+        self._optional_columns |= other._optional_columns
+        self.watermark = other.watermark if other.watermark is not None else self.watermark
+        return self
+
+    def node_counts(self) -> pd.Series:
+        """The number of turns that reached each node."""
+        counts = pd.Series(self._node_counts, index=pd.Index(list(self._nodes), dtype=object))
+        return counts.sort_values(ascending=False, kind="stable")
+
+    def transition_counts(self) -> pd.Series:
+        """The number of times each transition occurred, indexed by "src->dst"."""
+        counts = self._edges["count"].set_axis(self._edge_names(self._edges.index))
+        return counts.sort_values(ascending=False, kind="stable")
+
+    def transition_probabilities(self) -> pd.Series:
+        """The probability of each transition given its source node, indexed by "src->dst"."""
+        counts = self._edges["count"]
+        src = counts.index.to_numpy() >> _EDGE_SHIFT
+        outgoing = np.bincount(src, weights=counts.to_numpy(), minlength=len(self._nodes))
+        probs = pd.Series(counts.to_numpy() / outgoing[src], index=self._edge_names(counts.index))
+        return probs.sort_values(ascending=False, kind="stable")
+
+    def mean_durations(self) -> pd.Series:
+        """
+        The mean `duration_time` of the turns completing each transition, indexed by "src->dst".
+        Unlike the in-memory version, the turns with a missing `duration_time` are left out of the mean.
+        """
+        counts = self._edge_durations.reindex(self._edges.index, fill_value=0).to_numpy()
+        means = self._edges["duration_sum"].to_numpy() / np.maximum(counts, 1)
+        return pd.Series(means, index=self._edge_names(self._edges.index))
+
+    def sessions(self) -> pd.DataFrame:
+        """The session table in the layout of :py:func:`~dff_node_stats.sessions.summarize_sessions`."""
+        state = self._state
+        n_contexts = len(self._contexts)
+        nodes = pd.Index(list(self._nodes), dtype=object)
+        result = pd.DataFrame(index=pd.Index(list(self._contexts), name="context_id"))
+        result["turns"] = state["turns"][:n_contexts]
+        result["first_node"] = pd.Categorical.from_codes(state["first_node"][:n_contexts], categories=nodes)
+        result["last_node"] = pd.Categorical.from_codes(state["last_node"][:n_contexts], categories=nodes)
+        result["fallback"] = state["fallback"][:n_contexts]
+        result["n_flows"], result["flows"] = self._flow_names(state["flows"][:n_contexts])
+        if "duration_time" in self._optional_columns:
+            counts = state["duration_count"][:n_contexts]
+            totals = state["duration_total"][:n_contexts]
+            result["duration_total"] = np.where(counts > 0, totals, np.nan)
+            result["duration_mean"] = np.divide(totals, counts, out=np.full(n_contexts, np.nan), where=counts > 0)
+        if "start_time" in self._optional_columns:
+            result["start_time"] = state["start_time"][:n_contexts]
+        return result
+
+    @staticmethod
+    def _codes(mapping: Dict, values) -> np.ndarray:
+        """Map the values to their codes, giving new codes to the unseen values."""
+        for value in values:
+            if value not in mapping:
+                mapping[value] = len(mapping)
+        return np.fromiter((mapping[value] for value in values), dtype=np.int64, count=len(values))
+
+    def _node_codes(self, chunk: pd.DataFrame):
+        """Return the global node code and the global flow code of each row of the chunk."""
+        flow_codes, flows = pd.factorize(chunk["flow_label"])
+        label_codes, labels = pd.factorize(chunk["node_label"])
+        has_node = (flow_codes >= 0) & (label_codes >= 0)
+        pair_codes, pairs = pd.factorize(flow_codes[has_node].astype(np.int64) * len(labels) + label_codes[has_node])
+        names = [f"{flows[pair // len(labels)]}:{labels[pair % len(labels)]}" for pair in pairs]
+        node_codes = self._codes(self._nodes, names)
+        self._node_counts = np.append(self._node_counts, np.zeros(len(self._nodes) - len(self._node_counts), np.int64))
+        global_flows = self._codes(self._flows, [str(flow) for flow in flows])
+
+        nodes = np.full(len(chunk), -1, dtype=np.int64)
+        nodes[has_node] = node_codes[pair_codes]
+        flows_of_rows = np.full(len(chunk), -1, dtype=np.int64)
+        flows_of_rows[flow_codes >= 0] = global_flows[flow_codes[flow_codes >= 0]]
+        return nodes, flows_of_rows
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._state["turns"])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)  # amortized growth
+        for name, values in self._state.items():
+            fill = {"first_node": -1, "last_node": -1, "first_duration": np.nan, "start_time": np.datetime64("NaT")}
+            fill = fill.get(name, 0)
+            extension = np.full(capacity - len(values), fill, dtype=values.dtype)
+            self._state[name] = np.concatenate([values, extension])
+
+    def _add_edges(self, prev: np.ndarray, nodes: np.ndarray, durations: Optional[np.ndarray]) -> None:
+        mask = (prev >= 0) & (nodes >= 0)
+        keys, inverse = np.unique(prev[mask] << _EDGE_SHIFT | nodes[mask], return_inverse=True)
+        inverse = inverse.ravel()
+        partial = pd.DataFrame(
+            {
+                "count": np.bincount(inverse, minlength=len(keys)),
+                "duration_sum": np.zeros(len(keys)),
+            },
+            index=keys,
+        )
+        if durations is not None:
+            edge_durations = durations[mask]
+            timed = ~np.isnan(edge_durations)
+            partial["duration_sum"] = np.bincount(inverse[timed], weights=edge_durations[timed], minlength=len(keys))
+            timed_counts = pd.Series(np.bincount(inverse[timed], minlength=len(keys)), index=keys)
+            self._edge_durations = self._edge_durations.add(timed_counts, fill_value=0).astype(np.int64)
+        self._edges = self._edges.add(partial, fill_value=0).astype({"count": np.int64})
+
+    def _add_sessions(self, contexts, nodes, flows, first, last, durations, chunk, order) -> None:
+        state = self._state
+        starts = np.flatnonzero(first)
+        chunk_contexts = contexts[starts]
+        new = state["turns"][chunk_contexts] == 0
+        state["turns"][chunk_contexts] += np.diff(np.append(starts, len(contexts)))
+        state["first_node"][chunk_contexts[new]] = nodes[starts[new]]
+        state["last_node"][contexts[last]] = nodes[last]
+
+        fallback_nodes = np.array(
+            [self.fallback_pattern.lower() in name.partition(":")[2].lower() for name in self._nodes], dtype=bool
+        )
+        is_fallback = np.append(fallback_nodes, False)[nodes]
+        state["fallback"][chunk_contexts] |= np.logical_or.reduceat(is_fallback, starts) if len(starts) else False
+
+        small = (flows >= 0) & (flows < 64)
+        np.bitwise_or.at(state["flows"], contexts[small], np.left_shift(np.uint64(1), flows[small].astype(np.uint64)))
+        for context, flow in zip(contexts[flows >= 64], flows[flows >= 64]):
+            self._extra_flows.setdefault(int(context), set()).add(int(flow))
+
+        if durations is not None:
+            state["first_duration"][chunk_contexts[new]] = durations[starts[new]]
+            timed = ~np.isnan(durations)
+            np.add.at(state["duration_total"], contexts[timed], durations[timed])
+            np.add.at(state["duration_count"], contexts[timed], 1)
+        if "start_time" in chunk.columns:
+            start_times = pd.to_datetime(chunk["start_time"]).to_numpy(dtype="datetime64[ns]")[order]
+            unset = np.isnat(state["start_time"][chunk_contexts])
+            state["start_time"][chunk_contexts[unset]] = start_times[starts[unset]]
+
+    def _flow_names(self, masks: np.ndarray):
+        """Decode the flow bitmasks of the contexts into the flow counts and the sorted flow lists."""
+        flows = np.asarray(list(self._flows), dtype=object)
+        bits = np.arange(min(len(flows), 64), dtype=np.uint64)
+        mask_codes, unique_masks = pd.factorize(masks)
+        names = [sorted(flows[:64][(mask >> bits) & np.uint64(1) == 1]) for mask in np.asarray(unique_masks)]
+        n_flows = np.array([len(flow_names) for flow_names in names] + [0], dtype=np.int64)[mask_codes]
+        joined = [",".join(flow_names) for flow_names in names]
+        if not self._extra_flows:
+            return n_flows, pd.Categorical.from_codes(mask_codes, categories=pd.Index(joined, dtype=object))
+        values = [joined[code] for code in mask_codes]
+        for context, extra in self._extra_flows.items():
+            context_flows = sorted(set(values[context].split(",")) - {""} | {flows[flow] for flow in extra})
+            values[context], n_flows[context] = ",".join(context_flows), len(context_flows)
+        return n_flows, pd.Categorical(values)
+
+    def _edge_names(self, keys: pd.Index) -> pd.Index:
+        nodes = np.asarray(list(self._nodes), dtype=object)
+        keys = keys.to_numpy(dtype=np.int64)
+        return pd.Index(nodes[keys >> _EDGE_SHIFT] + "->" + nodes[keys & ((1 << _EDGE_SHIFT) - 1)], dtype=object)
+
+
+def aggregate_chunks(
+    saver: Saver,
+    column_types: Optional[Dict[str, str]] = None,
+    chunksize: int = 100000,
+    aggregator: Optional[ChunkedAggregator] = None,
+) -> ChunkedAggregator:
+    """
+    | Stream the stats from the saver in chunks of `chunksize` rows and aggregate them.
+    | If an `aggregator` returned by an earlier call is passed, only the rows saved since are read,
+    | unless the storage has been rewritten in between.
+
+    Parameters
+    ----------
+
+    saver: :py:class:`~dff_node_stats.savers.saver.Saver`
+        The saver to read the stats from.
+    column_types: Optional[Dict[str, str]]
+        The columns to read and their types. Defaults to :py:data:`~dff_node_stats.sessions.SOURCE_COLUMNS`,
+        which are all collected by the default collectors along with the
+        :py:class:`~dff_node_stats.collectors.NodeLabelCollector`.
+    chunksize: int
+        The number of rows per chunk.
+    aggregator: Optional[:py:class:`~dff_node_stats.chunked.ChunkedAggregator`]
+        The aggregator to resume.
+    """
+    column_types = column_types or SOURCE_COLUMNS
+    parse_dates = [col for col, _type in column_types.items() if _type.startswith("datetime64")]
+    watermark = aggregator.watermark if aggregator is not None else None
+    for chunk, chunk_watermark in saver.iter_load(column_types, parse_dates, chunksize, watermark):
+        if aggregator is None or (chunk_watermark.start == 0 and aggregator.watermark is not None):
+            aggregator = ChunkedAggregator() if aggregator is None else ChunkedAggregator(aggregator.fallback_pattern)
+        aggregator.update(chunk)
+        aggregator.watermark = chunk_watermark
+    return aggregator if aggregator is not None else ChunkedAggregator()
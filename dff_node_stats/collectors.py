@@ -27,7 +27,10 @@ class Collector(Protocol):
     @property
     def column_dtypes(self) -> Dict[str, str]:
         """
-        String names and string pandas types for the collected data
+        String names and string pandas types for the collected data.
+        Use the "category" type for columns with a small number of distinct values:
+        they are dictionary-encoded on loading with categories shared across all the batches of a saver
+        (see :py:class:`~dff_node_stats.utils.CategoryDictionary`).
         """
         return None
 
@@ -76,8 +79,8 @@ class NodeLabelCollector(Collector):
     @property
     def column_dtypes(self) -> Dict[str, str]:
         return {
-            "flow_label": "str",
-            "node_label": "str",
+            "flow_label": "category",
+            "node_label": "category",
         }
 
     @property
@@ -0,0 +1,148 @@
+"""
+Cube
+***********
+| The summary cube of a stats dataframe: everything the dashboards plot, aggregated in one pass.
+| :py:func:`~dff_node_stats.cube.get_summary_cube` is cached for each dataframe, so the dashboards build
+| the cube once per data version and filter state and draw all the plots from it,
+| instead of aggregating the rows again for each plot.
+
+Example::
+
+    cube = get_summary_cube(df)
+    cube.nodes["count"]
+
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.rollups import rollup
+from dff_node_stats.sketches import DDSketch, SketchSet, count_contexts, get_duration_sketch, get_node_duration_sketches
+from dff_node_stats.transitions import MIXED, get_transitions
+from dff_node_stats.utils import cached_transform, requires_columns
+
+FREQUENCIES = ["1min", "5min", "1h", "1d"]
+"""
+The bucket sizes of the time series, from which :py:func:`~dff_node_stats.cube.pick_freq` chooses.
+
+"""
+
+MAX_BUCKETS = 500
+"""
+The largest number of time buckets :py:func:`~dff_node_stats.cube.pick_freq` aims for.
+
+"""
+
+
+class SummaryCube(NamedTuple):
+    """
+    The aggregates of a stats dataframe used by the dashboards.
+
+    Attributes:
+        nodes: The nodes indexed by "flow_label:node_label", with their `flow_label`, `node_label`,
+            the number of turns that reached them (`count`) and the number of distinct contexts (`contexts`).
+            If `history_id` was collected, `start` tells the nodes reached by a turn without a history (-1).
+
+        edges: The transitions indexed by "src->dst", with their `source` and `target` nodes, `edge_type`
+            (the flow label for transitions inside a flow, "MIXED" otherwise), `count` and mean `duration_time`.
+
+        duration: The sketch of the `duration_time` of all the turns, if it was collected.
+
+        node_durations: The sketches of the `duration_time` of each node, if it was collected.
+
+        series: The rollup of the turns by flow, see :py:func:`~dff_node_stats.rollups.rollup`,
+            if `start_time` and `duration_time` were collected.
+
+        totals: The rollup of all the turns, if `start_time` and `duration_time` were collected.
+
+        freq: The bucket size of the rollups.
+
+    """
+
+    nodes: pd.DataFrame
+    edges: pd.DataFrame
+    duration: Optional[DDSketch] = None
+    node_durations: Optional[SketchSet] = None
+    series: Optional[pd.DataFrame] = None
+    totals: Optional[pd.DataFrame] = None
+    freq: Optional[str] = None
+
+
+def pick_freq(times: pd.Series) -> str:
+    """
+    Return the smallest of :py:data:`~dff_node_stats.cube.FREQUENCIES` that gives
+    at most :py:data:`~dff_node_stats.cube.MAX_BUCKETS` buckets over the span of the times.
+
+    Parameters
+    ----------
+
+    times: pd.Series
+        The `start_time` column.
+    """
+    times = pd.to_datetime(times)
+    span = (times.max() - times.min()) if len(times) else pd.Timedelta(0)
+    return next((freq for freq in FREQUENCIES[:-1] if span / pd.Timedelta(freq) <= MAX_BUCKETS), FREQUENCIES[-1])
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+@cached_transform
+def get_summary_cube(df: pd.DataFrame) -> SummaryCube:
+    """
+    | Transform function that returns the summary cube of the stats dataframe.
+    | The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+    | The parts that need `duration_time` or `start_time` are `None` if these columns are missing.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe.
+    """
+    transitions = get_transitions(df)
+    flows, nodes = transitions.flows, transitions.nodes
+    node_flows = flows[transitions.node_flows].astype(object)
+    labels = [node[len(flow) + 1 :] for node, flow in zip(nodes, node_flows)]
+    counts = np.bincount(transitions.node_codes[transitions.node_codes >= 0], minlength=len(nodes))
+    contexts = count_contexts(df, by="node").reindex(nodes, fill_value=0)
+    node_table = pd.DataFrame(
+        {"flow_label": node_flows, "node_label": labels, "count": counts, "contexts": contexts.to_numpy()},
+        index=pd.Index(nodes, dtype=object, name="node"),
+    )
+    if "history_id" in df.columns:
+        starts = transitions.node_codes[(df["history_id"] == -1).to_numpy() & (transitions.node_codes >= 0)]
+        node_table["start"] = np.bincount(starts, minlength=len(nodes)) > 0
+
+    # the transitions are kept in the order they first occur in, like the categories of the rows
+    src, dst = transitions.edges()
+    edge_ids, first, inverse = np.unique(src * len(nodes) + dst, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    edge_ids, inverse = edge_ids[order], np.argsort(order)[inverse]
+    src, dst = edge_ids // len(nodes), edge_ids % len(nodes)
+    edge_table = pd.DataFrame(
+        {
+            "source": nodes[src],
+            "target": nodes[dst],
+            "edge_type": np.where(
+                transitions.node_flows[src] == transitions.node_flows[dst], flows[transitions.node_flows[dst]], MIXED
+            ),
+            "count": np.bincount(inverse, minlength=len(edge_ids)),
+        },
+        index=pd.Index(nodes[src] + "->" + nodes[dst], dtype=object, name="edge"),
+    )
+    edge_table["edge_type"] = edge_table["edge_type"].astype(object)
+    if transitions.durations is not None:
+        durations = transitions.durations[transitions.has_edge]
+        known = ~np.isnan(durations)
+        sums = np.bincount(inverse[known], weights=durations[known], minlength=len(edge_ids))
+        totals = np.bincount(inverse[known], minlength=len(edge_ids))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            edge_table["duration_time"] = sums / totals  # NaN for transitions without a known duration
+
+    if "duration_time" not in df.columns:
+        return SummaryCube(node_table, edge_table)
+    cube = SummaryCube(node_table, edge_table, get_duration_sketch(df), get_node_duration_sketches(df))
+    if "start_time" not in df.columns:
+        return cube
+    freq = pick_freq(df["start_time"])
+    return cube._replace(series=rollup(df, freq), totals=rollup(df, freq, by_flow=False), freq=freq)
@@ -0,0 +1,148 @@
+"""
+Frame
+**********
+| Provides :py:class:`~dff_node_stats.frame.LazyFrame`, a read-only dataframe proxy
+| returned by :py:meth:`~dff_node_stats.stats.Stats.lazy_dataframe`.
+| The columns are fetched from the saver on first access, so that the plots and routes
+| that only need a couple of columns never load the large text or object ones.
+
+"""
+from typing import Dict, List, Optional, Union
+import threading
+
+import pandas as pd
+
+
+class LazyFrame:
+    """
+    | A read-only proxy that looks like a :py:class:`~pandas.DataFrame`, but loads its columns
+    | from the saver one request at a time and caches each of them afterwards.
+    | The rows are pinned by the first load: rows saved later are not included.
+    | Each load also fetches the `key` columns and is joined on them to the pinned rows,
+    | so the columns stay aligned whatever order the saver returns the rows in.
+
+    Visualizers and API routes decorated with :py:func:`~dff_node_stats.utils.requires_columns`
+    or :py:func:`~dff_node_stats.utils.requires_transform` accept the proxy as is and materialize
+    only the columns they declare.
+
+    Parameters
+    ----------
+
+    saver: :py:class:`~dff_node_stats.savers.Saver`
+        The saver to load the columns from.
+    column_types: Dict[str, str]
+        String names and string pandas types of the available columns.
+    parse_dates: List[str]
+        Names of the columns that should be parsed as dates.
+    key: List[str]
+        | Names of the columns that tell the rows apart, e.g. :py:data:`~dff_node_stats.savers.saver.WATERMARK_KEY`.
+        | Without them, the loads are aligned by position.
+    """
+
+    def __init__(
+        self,
+        saver,
+        column_types: Dict[str, str],
+        parse_dates: Optional[List[str]] = None,
+        key: Optional[List[str]] = None,
+    ) -> None:
+        self._saver = saver
+        self._column_types = column_types
+        self._parse_dates = parse_dates or []
+        self._cache: Dict[str, pd.Series] = {}
+        self._length: Optional[int] = None
+        self._rows: Optional[pd.MultiIndex] = None
+        self._key: List[str] = key if key and set(key) <= set(column_types) else []
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self) -> pd.Index:
+        return pd.Index(list(self._column_types))
+
+    @property
+    def loaded_columns(self) -> List[str]:
+        """Names of the columns that have already been loaded."""
+        return list(self._cache)
+
+    @property
+    def shape(self):
+        return len(self), len(self._column_types)
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self.select(self.columns[:1].tolist())
+        return self._length
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._column_types
+
+    def __getitem__(self, key: Union[str, List[str]]) -> Union[pd.Series, pd.DataFrame]:
+        if isinstance(key, str):
+            return self.select([key])[key]
+        return self.select(list(key))
+
+    def __getattr__(self, name: str) -> pd.Series:
+        if name.startswith("_") or name not in self._column_types:
+            raise AttributeError(f"{type(self).__name__} has no attribute {name}")
+        return self[name]
+
+    def select(self, columns: List[str]) -> pd.DataFrame:
+        """
+        Return a dataframe with the requested columns, loading the missing ones in a single saver call.
+        The selections are kept in :py:data:`~dff_node_stats.utils.transform_cache` along with the transform results,
+        so repeated selections of the same columns return the same dataframe, and the results cached for it are reused,
+        until the cache evicts the selection to stay within its memory limit.
+
+        Parameters
+        ----------
+
+        columns: List[str]
+            Names of the columns to return.
+        """
+        unknown = [col for col in columns if col not in self._column_types]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        from .utils import transform_cache  # the utils depend on this module
+
+        return transform_cache.get_or_compute(lambda _: self._select(columns), self, name=("select", tuple(columns)))
+
+    def _select(self, columns: List[str]) -> pd.DataFrame:
+        with self._lock:
+            missing = [col for col in dict.fromkeys(columns) if col not in self._cache]
+            if missing:
+                loaded = self._load(missing)
+                for col in missing:
+                    self._cache[col] = loaded[col]
+            return pd.DataFrame({col: self._cache[col] for col in columns}, columns=columns)
+
+    def _load(self, columns: List[str]) -> pd.DataFrame:
+        """Load the columns in a single saver call, with the rows in the pinned order."""
+        types = {col: self._column_types[col] for col in dict.fromkeys(self._key + columns)}
+        dates = [col for col in self._parse_dates if col in types]
+        loaded = self._saver.load(column_types=types, parse_dates=dates)
+        if not self._key:
+            if self._length is None:
+                self._length = len(loaded)
+            return loaded.iloc[: self._length].reset_index(drop=True)
+        rows = pd.MultiIndex.from_frame(loaded[self._key].astype(object))
+        if self._rows is None:
+            self._rows, self._length = rows, len(rows)
+            for col in self._key:  # the key columns come with every load
+                self._cache.setdefault(col, loaded[col].reset_index(drop=True))
+            return loaded.reset_index(drop=True)
+        unique = ~rows.duplicated()
+        loaded = loaded[unique].set_axis(rows[unique]).reindex(self._rows)
+        return loaded.reset_index(drop=True)
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Load all the columns and return them as a regular dataframe."""
+        return self.select(self.columns.tolist())
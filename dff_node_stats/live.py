@@ -0,0 +1,201 @@
+"""
+Live
+***********
+| Rolling metrics over the last minutes or hours of the collected turns, for on-call dashboards.
+| :py:class:`~dff_node_stats.live.LiveMetrics` is fed by :py:class:`~dff_node_stats.stats.Stats`
+| on each turn and keeps a ring buffer of per-second buckets. Each window keeps running totals:
+| a bucket is added to them when a turn is collected and subtracted when it leaves the window,
+| so neither the updates nor the queries depend on the number of turns in the window.
+
+Example::
+
+    live = LiveMetrics(windows=[300, 3600])
+    stats = Stats(saver, collectors=[NodeLabelCollector()], live=live)
+    ...
+    live.metrics(300).fallback_rate
+
+"""
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+import heapq
+import math
+import threading
+import time
+
+from dff_node_stats.sessions import FALLBACK_PATTERN
+from dff_node_stats.sketches import DDSketch
+from dff_node_stats.utils import DffStatsException
+
+QUANTILES = [0.5, 0.95, 0.99]
+"""
+The `duration_time` quantiles reported by :py:meth:`~dff_node_stats.live.LiveMetrics.metrics`.
+
+"""
+
+
+class WindowMetrics(NamedTuple):
+    """
+    The metrics of the turns collected during the last `window` seconds.
+
+    Attributes:
+        window: The length of the window in seconds.
+
+        turns: The number of turns.
+
+        turns_per_second: The number of turns divided by the length of the window.
+
+        fallback_rate: The share of the turns that reached a fallback node, `None` without turns.
+
+        durations: The approximate "p50", "p95" and "p99" of `duration_time`, `None` without turns.
+
+        top_nodes: The most visited nodes and their number of turns.
+
+    """
+
+    window: int
+    turns: int
+    turns_per_second: float
+    fallback_rate: Optional[float]
+    durations: Dict[str, Optional[float]]
+    top_nodes: Dict[str, int]
+
+
+class _Bucket:
+    """The totals of the turns collected during one second, or of a whole window."""
+
+    __slots__ = ("second", "turns", "fallbacks", "durations", "nodes")
+
+    def __init__(self, second: int, relative_accuracy: float) -> None:
+        self.second = second
+        self.turns = 0
+        self.fallbacks = 0
+        self.durations = DDSketch(relative_accuracy)
+        self.nodes: Dict[str, int] = {}
+
+    def add(self, node: str, duration: float, fallback: bool) -> None:
+        self.turns += 1
+        self.fallbacks += fallback
+        self.durations.add(duration)
+        self.nodes[node] = self.nodes.get(node, 0) + 1
+
+    def subtract(self, other: "_Bucket") -> None:
+        self.turns -= other.turns
+        self.fallbacks -= other.fallbacks
+        self.durations.subtract(other.durations)
+        for node, count in other.nodes.items():
+            left = self.nodes[node] - count
+            if left > 0:
+                self.nodes[node] = left
+            else:
+                del self.nodes[node]
+
+
+class LiveMetrics:
+    """
+    | Keeps the metrics of the turns collected during the last seconds, for several window lengths.
+    | The memory holds one bucket per second of the longest window, each with a duration sketch
+    | and the counts of the nodes visited during that second.
+
+    Parameters
+    ----------
+
+    windows: Iterable[int]
+        The lengths of the windows in seconds, e.g. 5 minutes and 1 hour.
+    relative_accuracy: float
+        The relative error guarantee of the `duration_time` percentiles.
+    fallback_pattern: str
+        Nodes with this substring in their `node_label` (case-insensitive) count as fallback nodes.
+    clock: Callable[[], float]
+        Returns the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        windows: Iterable[int] = (300, 3600),
+        relative_accuracy: float = 0.01,
+        fallback_pattern: str = FALLBACK_PATTERN,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.windows = sorted({int(window) for window in windows})
+        if not self.windows or self.windows[0] < 1:
+            raise DffStatsException("The windows should be at least one second long")
+        self.relative_accuracy = relative_accuracy
+        self.fallback_pattern = fallback_pattern.lower()
+        self.clock = clock
+        self._size = self.windows[-1]
+        self._reset(None)
+        self._lock = threading.Lock()
+
+    def add(self, flow_label: str, node_label: str, duration: float) -> None:
+        """
+        Add a turn collected now.
+
+        Parameters
+        ----------
+
+        flow_label: str
+            The flow label of the turn.
+        node_label: str
+            The node label of the turn.
+        duration: float
+            The `duration_time` of the turn.
+        """
+        node = f"{flow_label}:{node_label}"
+        fallback = self.fallback_pattern in str(node_label).lower()
+        with self._lock:
+            second = self._advance()
+            bucket = self._buckets[second % self._size]
+            if bucket is None:
+                bucket = self._buckets[second % self._size] = _Bucket(second, self.relative_accuracy)
+            bucket.add(node, duration, fallback)
+            for total in self._totals.values():
+                total.add(node, duration, fallback)
+
+    def metrics(self, window: int, top_k: int = 10) -> WindowMetrics:
+        """
+        Return the metrics of the turns collected during the last `window` seconds.
+
+        Parameters
+        ----------
+
+        window: int
+            One of the window lengths the metrics were created with.
+        top_k: int
+            The number of nodes to report.
+        """
+        if window not in self._totals:
+            raise DffStatsException(f"Unknown window: {window}, expected one of {self.windows}")
+        with self._lock:
+            self._advance()
+            total = self._totals[window]
+            durations = total.durations.quantiles(QUANTILES) if total.turns else [None] * len(QUANTILES)
+            return WindowMetrics(
+                window=window,
+                turns=total.turns,
+                turns_per_second=total.turns / window,
+                fallback_rate=total.fallbacks / total.turns if total.turns else None,
+                durations={f"p{q * 100:g}": _optional(value) for q, value in zip(QUANTILES, durations)},
+                top_nodes=dict(heapq.nlargest(top_k, total.nodes.items(), key=lambda item: item[1])),
+            )
+
+    def _advance(self) -> int:
+        """Move the windows to the current second, subtracting the buckets that have left them."""
+        second = math.floor(self.clock())
+        if self._second is None or second - self._second >= self._size:
+            self._reset(second)
+        for current in range(self._second + 1, second + 1):
+            for window, total in self._totals.items():
+                expired = self._buckets[(current - window) % self._size]
+                if expired is not None and expired.second == current - window:
+                    total.subtract(expired)
+            self._buckets[current % self._size] = None  # its second has left the longest window
+        self._second = max(self._second, second)
+        return self._second
+
+    def _reset(self, second: Optional[int]) -> None:
+        self._second = second
+        self._buckets = [None] * self._size
+        self._totals = {window: _Bucket(-1, self.relative_accuracy) for window in self.windows}
+
+
+def _optional(value: Optional[float]) -> Optional[float]:
+    return None if value is None or math.isnan(value) else float(value)
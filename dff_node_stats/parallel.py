@@ -0,0 +1,354 @@
+"""
+Parallel
+***********
+| Runs the transforms on a pool of processes.
+| Transitions never cross contexts, so the stats are hash-partitioned by `context_id`
+| and each partition is processed independently.
+| The partitions are passed to the workers through :py:class:`~multiprocessing.shared_memory.SharedMemory`
+| blocks instead of being pickled: string and categorical columns are sent as integer codes.
+| Each partition gets its own block and is submitted as soon as it is written,
+| so the workers process the first partitions while the next ones are copied.
+
+Example::
+
+    with ParallelExecutor(processes=8) as executor:
+        aggregator = executor.aggregate(df)
+        sessions = executor.map(df, summarize_sessions, combine=pd.concat)
+
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import os
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.chunked import ChunkedAggregator
+from dff_node_stats.savers import Saver
+from dff_node_stats.sessions import FALLBACK_PATTERN, SOURCE_COLUMNS
+from dff_node_stats.sketches import hash_values
+from dff_node_stats.utils import DffStatsException
+
+_ALIGNMENT = 8
+
+
+class SharedFrame(NamedTuple):
+    """
+    Describes a dataframe whose columns are stored in a shared memory block.
+    The rows are grouped by partition, the rows of partition `i` are `bounds[i]:bounds[i + 1]`.
+
+    Attributes:
+    name: str
+        The name of the shared memory block.
+    columns: List[Tuple[str, str, int, Optional[Any]]]
+        The name, the numpy dtype and the offset of each column in the block.
+        Encoded columns also carry their categories, or their unique values for non-categorical columns.
+    bounds: List[int]
+        The offsets of the partitions in the rows.
+    """
+
+    name: str
+    columns: List[Tuple[str, str, int, Optional[Any]]]
+    bounds: List[int]
+
+
+def partition_codes(context_ids: pd.Series, partitions: int) -> np.ndarray:
+    """
+    Return the partition of each row, based on the hash of its `context_id`.
+    The same context always falls into the same partition.
+
+    Parameters
+    ----------
+
+    context_ids: pd.Series
+        The `context_id` column.
+    partitions: int
+        The number of partitions.
+    """
+    codes, uniques = pd.factorize(context_ids)
+    hashes = np.append(hash_values(np.asarray(uniques)) % np.uint64(partitions), np.uint64(0))
+    return hashes[codes].astype(np.int64)
+
+
+def share_frame(df: pd.DataFrame, partitions: Optional[np.ndarray] = None) -> Tuple[SharedMemory, SharedFrame]:
+    """
+    Copy the dataframe to a new shared memory block, with the rows grouped by partition.
+    The caller owns the block and should close and unlink it once the workers are done.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The dataframe to share.
+    partitions: Optional[np.ndarray]
+        The partition of each row, e.g. from :py:func:`~dff_node_stats.parallel.partition_codes`.
+        Defaults to a single partition.
+    """
+    encoded = [(col,) + _encode(df[col]) for col in df.columns]
+    if partitions is None:
+        return _share_rows(encoded, None, [0, len(df)])
+    order = np.argsort(partitions, kind="stable")
+    bounds = [0] + np.cumsum(np.bincount(partitions, minlength=partitions.max(initial=0) + 1)).tolist()
+    return _share_rows(encoded, order, bounds)
+
+
+def share_partitions(df: pd.DataFrame, partitions: np.ndarray) -> Iterator[Tuple[SharedMemory, SharedFrame]]:
+    """
+    | Copy each partition of the dataframe to its own shared memory block, in the order of the partitions.
+    | The blocks are yielded one at a time, so a partition can be handed to a worker before the next one is copied.
+    | The caller owns the blocks and should close and unlink them once the workers are done.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The dataframe to share.
+    partitions: np.ndarray
+        The partition of each row, e.g. from :py:func:`~dff_node_stats.parallel.partition_codes`.
+    """
+    order = np.argsort(partitions, kind="stable")
+    bounds = np.cumsum(np.bincount(partitions, minlength=partitions.max(initial=0) + 1))
+    for start, stop in zip(np.concatenate([[0], bounds[:-1]]), bounds):
+        # the columns are encoded per partition, so the encoding of the strings is overlapped too
+        part = df.iloc[order[start:stop]]
+        yield _share_rows([(col,) + _encode(part[col]) for col in part.columns], None, [0, int(stop - start)])
+
+
+def _share_rows(
+    encoded: List[Tuple[str, np.ndarray, Optional[Any]]], rows: Optional[np.ndarray], bounds: List[int]
+) -> Tuple[SharedMemory, SharedFrame]:
+    """Copy the rows of the encoded columns to a new shared memory block, taking them straight into the block."""
+    columns, size = [], 0
+    for col, values, categories in encoded:
+        columns.append((col, values.dtype.str, size, categories))
+        size += -(-values.dtype.itemsize * bounds[-1] // _ALIGNMENT) * _ALIGNMENT
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for (_, values, _), (_, _, offset, _) in zip(encoded, columns):
+        view = np.ndarray(bounds[-1], values.dtype, buffer=shm.buf, offset=offset)
+        if rows is None:
+            view[:] = values
+        else:
+            np.take(values, rows, out=view)
+        del view  # the block cannot be closed while it is referenced
+    return shm, SharedFrame(shm.name, columns, bounds)
+
+
+def read_shared_frame(frame: SharedFrame, partition: int = 0) -> pd.DataFrame:
+    """
+    Copy a partition of a shared dataframe into a new dataframe.
+
+    Parameters
+    ----------
+
+    frame: :py:class:`~dff_node_stats.parallel.SharedFrame`
+        The shared dataframe.
+    partition: int
+        The partition to read.
+    """
+    start, stop = frame.bounds[partition], frame.bounds[partition + 1]
+    total = frame.bounds[-1]
+    shm = SharedMemory(name=frame.name)
+    try:
+        data = {}
+        for col, dtype, offset, categories in frame.columns:
+            view = np.ndarray(total, np.dtype(dtype), buffer=shm.buf, offset=offset)
+            data[col] = _decode(view[start:stop].copy(), categories)
+            del view  # the block cannot be closed while it is referenced
+    finally:
+        shm.close()
+    return pd.DataFrame(data)
+
+
+def _encode(column: pd.Series) -> Tuple[np.ndarray, Optional[Any]]:
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.cat.categories
+    if isinstance(column.dtype, np.dtype) and column.dtype.kind in "biufmM":
+        return column.to_numpy(), None
+    codes, uniques = pd.factorize(column)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def _decode(values: np.ndarray, categories: Optional[Any]) -> Any:
+    if categories is None:
+        return values
+    if isinstance(categories, pd.Index):
+        return pd.Categorical.from_codes(values, categories=categories)
+    return np.append(categories, np.nan).astype(object)[values]  # -1 is a missing value
+
+
+def _apply(func: Callable[[pd.DataFrame], Any], frame: SharedFrame, partition: int) -> Any:
+    return func(read_shared_frame(frame, partition))
+
+
+def _aggregate(df: pd.DataFrame, fallback_pattern: str = FALLBACK_PATTERN) -> ChunkedAggregator:
+    return ChunkedAggregator(fallback_pattern).update(df)
+
+
+class ParallelExecutor:
+    """
+    | Runs the transforms on the context-hash partitions of the stats in a pool of processes
+    | and merges the results. The pool is started on first use and reused until
+    | :py:meth:`~dff_node_stats.parallel.ParallelExecutor.shutdown`.
+    | The functions passed to the executor should be importable by the workers,
+    | e.g. module-level functions rather than lambdas.
+
+    Parameters
+    ----------
+
+    processes: Optional[int]
+        The number of worker processes. Defaults to the number of cores.
+        With a single process the transforms run in the calling process.
+    partitions: Optional[int]
+        The number of partitions of a dataframe. Defaults to the number of processes.
+    """
+
+    def __init__(self, processes: Optional[int] = None, partitions: Optional[int] = None) -> None:
+        self.processes: int = processes or os.cpu_count() or 1
+        self.partitions: int = partitions or self.processes
+        if self.processes < 1 or self.partitions < 1:
+            raise DffStatsException("The number of processes and partitions should be positive")
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "ParallelExecutor":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def map(
+        self,
+        df: pd.DataFrame,
+        func: Callable[[pd.DataFrame], Any],
+        combine: Optional[Callable[[List[Any]], Any]] = None,
+    ) -> Any:
+        """
+        Apply the function to each context-hash partition of the dataframe.
+        Returns the list of the partition results, or the output of `combine` on that list.
+
+        Parameters
+        ----------
+
+        df: pd.DataFrame
+            The stats dataframe with the `context_id` column.
+        func: Callable[[pd.DataFrame], Any]
+            The transform to apply. It should only depend on the rows of the contexts it is given,
+            like :py:func:`~dff_node_stats.sessions.summarize_sessions`.
+        combine: Optional[Callable[[List[Any]], Any]]
+            Merges the results of the partitions, e.g. :py:func:`pandas.concat`.
+        """
+        if "context_id" not in df.columns:
+            raise DffStatsException("Required columns missing: context_id")
+        if self.processes == 1 or self.partitions == 1:
+            partitions = partition_codes(df["context_id"], self.partitions)
+            parts = [df[partitions == partition].reset_index(drop=True) for partition in range(self.partitions)]
+            results = [func(part) for part in parts]
+        else:
+            blocks, futures = [], []
+            try:
+                pool = self._get_pool()
+                for shm, frame in share_partitions(df, partition_codes(df["context_id"], self.partitions)):
+                    blocks.append(shm)
+                    futures.append(pool.submit(_apply, func, frame, 0))
+                results = [future.result() for future in futures]
+            finally:
+                for future in futures:
+                    future.cancel()
+                for shm in blocks:
+                    shm.close()
+                    shm.unlink()
+        return results if combine is None else combine(results)
+
+    def aggregate(self, df: pd.DataFrame, fallback_pattern: str = FALLBACK_PATTERN) -> ChunkedAggregator:
+        """
+        Aggregate the dataframe with a :py:class:`~dff_node_stats.chunked.ChunkedAggregator` per partition
+        and merge the partial aggregates.
+
+        Parameters
+        ----------
+
+        df: pd.DataFrame
+            The stats dataframe.
+        fallback_pattern: str
+            Nodes with this substring in their `node_label` (case-insensitive) count as fallback nodes.
+        """
+        aggregator = ChunkedAggregator(fallback_pattern)
+        for part in self.map(df, partial(_aggregate, fallback_pattern=fallback_pattern)):
+            aggregator.merge(part)
+        return aggregator
+
+    def aggregate_chunks(
+        self,
+        saver: Saver,
+        column_types: Optional[Dict[str, str]] = None,
+        chunksize: int = 100000,
+        aggregator: Optional[ChunkedAggregator] = None,
+    ) -> ChunkedAggregator:
+        """
+        | The parallel version of :py:func:`~dff_node_stats.chunked.aggregate_chunks`.
+        | The chunks are read in the calling process and aggregated by the workers,
+        | the partial aggregates are merged in the order of the chunks.
+        | At most two chunks per process are held in memory at a time.
+
+        Parameters
+        ----------
+
+        saver: :py:class:`~dff_node_stats.savers.saver.Saver`
+            The saver to read the stats from.
+        column_types: Optional[Dict[str, str]]
+            The columns to read and their types. Defaults to :py:data:`~dff_node_stats.sessions.SOURCE_COLUMNS`.
+        chunksize: int
+            The number of rows per chunk.
+        aggregator: Optional[:py:class:`~dff_node_stats.chunked.ChunkedAggregator`]
+            The aggregator to resume.
+        """
+        column_types = column_types or SOURCE_COLUMNS
+        parse_dates = [col for col, _type in column_types.items() if _type.startswith("datetime64")]
+        watermark = aggregator.watermark if aggregator is not None else None
+        result = aggregator if aggregator is not None else ChunkedAggregator()
+        pending = deque()
+
+        def merge_next():
+            shm, future, chunk_watermark = pending.popleft()
+            try:
+                part = future.result()
+            finally:
+                shm.close()
+                shm.unlink()
+            part.watermark = chunk_watermark
+            return part
+
+        try:
+            for chunk, chunk_watermark in saver.iter_load(column_types, parse_dates, chunksize, watermark):
+                if chunk_watermark.start == 0 and result.watermark is not None:
+                    result = ChunkedAggregator(result.fallback_pattern)  # the storage has been rewritten
+                if self.processes == 1:
+                    result.update(chunk)
+                    result.watermark = chunk_watermark
+                    continue
+                shm, frame = share_frame(chunk)
+                func = partial(_aggregate, fallback_pattern=result.fallback_pattern)
+                pending.append((shm, self._get_pool().submit(_apply, func, frame, 0), chunk_watermark))
+                if len(pending) >= 2 * self.processes:
+                    result.merge(merge_next())
+            while pending:
+                result.merge(merge_next())
+        finally:
+            for shm, future, _ in pending:
+                future.cancel()
+                shm.close()
+                shm.unlink()
+        return result
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        return self._pool
@@ -0,0 +1,223 @@
+"""
+Query
+***********
+| An embedded `DuckDB <https://duckdb.org>`_ query engine over the stats files.
+| :py:class:`~dff_node_stats.query.QueryEngine` registers the saved stats (csv files, parquet partitions,
+| a saver or a dataframe) as a view and computes the built-in transforms in SQL, using window functions
+| to link each turn to the previous turn of its context. The queries run in-process on all cores,
+| without loading the files into pandas first. Custom SQL returns dataframes.
+| The `duckdb` package is required to use this module.
+
+Example::
+
+    engine = QueryEngine("stats/*.parquet")
+    engine.transition_counts()
+    engine.duration_stats(by="edge")
+    engine.sql("SELECT flow_label, COUNT(DISTINCT context_id) FROM dff_stats GROUP BY 1")
+
+"""
+from typing import Any, Dict, List, Optional, Union
+import pathlib
+
+import duckdb
+import pandas as pd
+
+from dff_node_stats.savers import Saver
+from dff_node_stats.savers.csv import CsvSaver
+from dff_node_stats.utils import DffStatsException
+
+QUANTILES = [0.25, 0.5, 0.75, 0.95, 0.99]
+"""
+The quantiles reported by :py:meth:`~dff_node_stats.query.QueryEngine.duration_stats`.
+
+"""
+
+
+class QueryEngine:
+    """
+    | Runs SQL over the stats in an in-process DuckDB database.
+    | The stats are registered as a view, so the files are scanned anew by each query
+    | and the results always reflect the rows saved so far.
+
+    Parameters
+    ----------
+
+    source: Union[str, pathlib.Path, :py:class:`~dff_node_stats.savers.saver.Saver`, pd.DataFrame, None]
+        The stats to register as the `table` view, see :py:meth:`~dff_node_stats.query.QueryEngine.register`.
+    table: str
+        The name of the view. Defaults to "dff_stats".
+    database: str
+        The DuckDB database file. Defaults to an in-memory database.
+    threads: Optional[int]
+        The number of threads DuckDB may use. Defaults to the number of cores.
+    """
+
+    def __init__(
+        self,
+        source: Union[str, pathlib.Path, Saver, pd.DataFrame, None] = None,
+        table: str = "dff_stats",
+        database: str = ":memory:",
+        threads: Optional[int] = None,
+    ) -> None:
+        self.table = table
+        self.connection = duckdb.connect(database)
+        if threads is not None:
+            self.connection.execute(f"SET threads TO {int(threads)}")
+        if source is not None:
+            self.register(source, table)
+
+    def register(self, source: Union[str, pathlib.Path, Saver, pd.DataFrame], name: Optional[str] = None) -> None:
+        """
+        Register the stats as a view.
+
+        Parameters
+        ----------
+
+        source: Union[str, pathlib.Path, :py:class:`~dff_node_stats.savers.saver.Saver`, pd.DataFrame]
+            | A path or a glob pattern of csv or parquet files, e.g. "stats/*.csv" or "stats/**/*.parquet".
+            | Files matched by one pattern are combined by column name.
+            | A csv saver is registered by its path, other savers are loaded into a dataframe first.
+        name: Optional[str]
+            The name of the view. Defaults to the `table` of the engine.
+        """
+        name = name or self.table
+        if isinstance(source, CsvSaver):
+            source = source.path
+        elif not isinstance(source, (str, pathlib.Path, pd.DataFrame)):
+            source = source.load()
+        if isinstance(source, pd.DataFrame):
+            self.connection.register(f"{name}_frame", source)
+            self.connection.execute(f'CREATE OR REPLACE VIEW "{name}" AS SELECT * FROM "{name}_frame"')
+            return
+        path = str(source).replace("'", "''")
+        if path.endswith(".parquet"):
+            scan = f"read_parquet('{path}', union_by_name=true)"
+        elif path.endswith(".csv"):
+            scan = f"read_csv_auto('{path}', header=true, union_by_name=true)"
+        else:
+            raise DffStatsException(f"Cannot register {source}: expected a csv or parquet file")
+        self.connection.execute(f'CREATE OR REPLACE VIEW "{name}" AS SELECT * FROM {scan}')
+
+    def sql(self, query: str, params: Optional[Union[List[Any], Dict[str, Any]]] = None) -> pd.DataFrame:
+        """
+        Run a query and return the result as a dataframe.
+
+        Parameters
+        ----------
+
+        query: str
+            The query. The registered views can be referred to by name.
+        params: Optional[Union[List[Any], Dict[str, Any]]]
+            The values of the `?` or `$name` placeholders of the query.
+        """
+        return self.connection.execute(query, params).df() if params else self.connection.execute(query).df()
+
+    def columns(self) -> List[str]:
+        """The columns of the stats view."""
+        return self.sql(f'DESCRIBE "{self.table}"')["column_name"].tolist()
+
+    def node_counts(self) -> pd.Series:
+        """The number of turns that reached each node."""
+        self._check_columns()
+        result = self.sql(
+            f"SELECT {self._node('')} AS node, count FROM (SELECT flow_label, node_label, COUNT(*) AS count "
+            f'FROM "{self.table}" WHERE flow_label IS NOT NULL AND node_label IS NOT NULL GROUP BY ALL) '
+            "ORDER BY count DESC, node"
+        )
+        return self._series(result, "node", "count")
+
+    def transition_counts(self) -> pd.Series:
+        """The number of times each transition occurred, indexed by "src->dst"."""
+        result = self.sql(
+            f"SELECT {self._edge()} AS edge, count FROM ({self._edges_query()}) ORDER BY count DESC, edge"
+        )
+        return self._series(result, "edge", "count")
+
+    def transition_probabilities(self) -> pd.Series:
+        """The probability of each transition given its source node, indexed by "src->dst"."""
+        result = self.sql(
+            f"SELECT {self._edge()} AS edge, "
+            "count / SUM(count) OVER (PARTITION BY prev_flow_label, prev_node_label) AS probability "
+            f"FROM ({self._edges_query()}) ORDER BY probability DESC, edge"
+        )
+        return self._series(result, "edge", "probability")
+
+    def duration_stats(self, by: str = "node") -> pd.DataFrame:
+        """
+        | The count, mean, min, quantiles (see :py:data:`~dff_node_stats.query.QUANTILES`) and max
+        | of `duration_time` for each node or each transition.
+        | A transition takes the `duration_time` of the turn that completes it.
+
+        Parameters
+        ----------
+
+        by: str
+            "node" or "edge".
+        """
+        if by not in ("node", "edge"):
+            raise DffStatsException(f"Unknown grouping: {by}, expected 'node' or 'edge'")
+        self._check_columns(["duration_time"])
+        aggregates = [
+            "COUNT(duration_time) AS count",
+            "AVG(duration_time) AS mean",
+            "MIN(duration_time) AS min",
+        ]
+        aggregates += [f'QUANTILE_CONT(duration_time, {q}) AS "{q * 100:g}%"' for q in QUANTILES]
+        aggregates += ["MAX(duration_time) AS max"]
+        if by == "node":
+            labels = ["flow_label", "node_label"]
+            key, source = self._node(""), f'"{self.table}" WHERE flow_label IS NOT NULL AND node_label IS NOT NULL'
+        else:
+            labels = ["prev_flow_label", "prev_node_label", "flow_label", "node_label"]
+            key, source = self._edge(), f"({self._turns_query()}) WHERE {self._has_edge()}"
+        columns = ["count", "mean", "min"] + [f"{q * 100:g}%" for q in QUANTILES] + ["max"]
+        quoted = ", ".join(f'"{col}"' for col in columns)
+        result = self.sql(
+            f"SELECT {key} AS {by}, {quoted} "
+            f"FROM (SELECT {', '.join(labels + aggregates)} FROM {source} GROUP BY ALL) ORDER BY 1"
+        )
+        return result.set_index(by)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.connection.close()
+
+    def _check_columns(self, extra: Optional[List[str]] = None) -> List[str]:
+        columns = self.columns()
+        missing = {"context_id", "flow_label", "node_label", *(extra or [])} - set(columns)
+        if missing:
+            raise DffStatsException(f"Required columns missing: {', '.join(sorted(missing))}")
+        return columns
+
+    def _turns_query(self) -> str:
+        """The turns along with the flow and the node labels of the previous turn of the same context."""
+        columns = self._check_columns()
+        order = next((f"ORDER BY {col}" for col in ("history_id", "start_time") if col in columns), "")
+        window = f"OVER (PARTITION BY context_id {order})"
+        duration = ", duration_time" if "duration_time" in columns else ""
+        return (
+            f"SELECT LAG(flow_label) {window} AS prev_flow_label, LAG(node_label) {window} AS prev_node_label, "
+            f'flow_label, node_label{duration} FROM "{self.table}"'
+        )
+
+    def _edges_query(self) -> str:
+        return (
+            "SELECT prev_flow_label, prev_node_label, flow_label, node_label, COUNT(*) AS count "
+            f"FROM ({self._turns_query()}) WHERE {self._has_edge()} GROUP BY ALL"
+        )
+
+    @staticmethod
+    def _node(prefix: str) -> str:
+        return f"CAST({prefix}flow_label AS VARCHAR) || ':' || CAST({prefix}node_label AS VARCHAR)"
+
+    def _edge(self) -> str:
+        return f"{self._node('prev_')} || '->' || {self._node('')}"
+
+    @staticmethod
+    def _has_edge() -> str:
+        columns = ["prev_flow_label", "prev_node_label", "flow_label", "node_label"]
+        return " AND ".join(f"{col} IS NOT NULL" for col in columns)
+
+    @staticmethod
+    def _series(result: pd.DataFrame, index: str, values: str) -> pd.Series:
+        return pd.Series(result[values].to_numpy(), index=pd.Index(result[index], dtype=object))
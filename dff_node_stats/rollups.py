@@ -0,0 +1,214 @@
+"""
+Rollups
+***********
+| Time-bucketed rollups of the stats: the number of turns, the number of active contexts
+| and the percentiles of `duration_time` per time bucket, optionally broken down by flow.
+| :py:func:`~dff_node_stats.rollups.rollup` computes them from a dataframe,
+| and :py:meth:`~dff_node_stats.savers.saver.Saver.load_rollup` computes them on the database side.
+| A rollup built with `sketches=True` keeps a mergeable sketch of the durations and of the contexts of each bucket,
+| so that :py:func:`~dff_node_stats.rollups.merge_rollup` can coarsen it without the raw rows.
+| The database savers read these sketches from the ones persisted with the batches,
+| see :py:func:`~dff_node_stats.rollups.add_saved_sketches`.
+
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.sketches import (
+    DDSketch,
+    HyperLogLog,
+    SketchSet,
+    group_context_sketches,
+    group_duration_sketches,
+    hash_values,
+)
+from dff_node_stats.utils import requires_columns
+
+QUANTILES = (0.5, 0.95, 0.99)
+"""
+The percentiles of `duration_time` reported for each bucket.
+
+"""
+
+ROLLUP_COLUMNS = ["turns", "contexts"] + [f"duration_p{int(q * 100)}" for q in QUANTILES]
+"""
+The value columns of a rollup.
+
+"""
+
+SOURCE_COLUMNS = {
+    "context_id": "str",
+    "start_time": "datetime64[ns]",
+    "duration_time": "float64",
+    "flow_label": "category",
+}
+"""
+The stats columns used to build a rollup, along with their types.
+
+"""
+
+
+def bucket_seconds(freq: str) -> int:
+    """
+    Return the length of a time bucket in seconds.
+
+    Parameters
+    ----------
+
+    freq: str
+        A fixed pandas frequency, e.g. "1min", "15min" or "1h".
+    """
+    seconds = pd.Timedelta(freq).total_seconds()
+    if seconds < 1 or seconds != int(seconds):
+        raise ValueError(f"The bucket size should be a whole number of seconds, got {freq}")
+    return int(seconds)
+
+
+@requires_columns(["context_id", "start_time", "duration_time", "flow_label"])
+def rollup(df: pd.DataFrame, freq: str = "1min", by_flow: bool = True, sketches: bool = False) -> pd.DataFrame:
+    """
+    | Resample the stats on `start_time` into buckets of `freq`.
+    | Returns a dataframe with a `bucket` column (the start of the bucket), a `flow_label` column
+    | if `by_flow` is set, and the following values:
+
+    #. `turns`: the number of turns.
+    #. `contexts`: the number of distinct contexts active in the bucket.
+    #. `duration_p50`, `duration_p95`, `duration_p99`: the percentiles of `duration_time`.
+    #. `duration_sketch`, `contexts_sketch`: the :py:class:`~dff_node_stats.sketches.DDSketch` of `duration_time`
+       and the :py:class:`~dff_node_stats.sketches.HyperLogLog` of the contexts, if `sketches` is set.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe.
+    freq: str
+        A fixed pandas frequency, e.g. "1min", "15min" or "1h".
+    by_flow: bool
+        Whether to break the values down by `flow_label`.
+    sketches: bool
+        Whether to add the sketch columns.
+    """
+    keys: List[str] = ["bucket", "flow_label"] if by_flow else ["bucket"]
+    data = pd.DataFrame(
+        {
+            "bucket": pd.to_datetime(df["start_time"]).dt.floor(f"{bucket_seconds(freq)}s"),
+            "flow_label": df["flow_label"],
+            "context_id": df["context_id"],
+            "duration_time": df["duration_time"],
+        }
+    )
+    groups = data.groupby(keys, observed=True, sort=True)
+    result = pd.DataFrame({"turns": groups.size()})
+
+    # count the distinct (group, context) pairs in sorted order, which is several times faster than nunique
+    group_codes = groups.ngroup().to_numpy()
+    context_codes, context_ids = pd.factorize(data["context_id"])
+    known = (group_codes >= 0) & (context_codes >= 0)
+    width = max(len(context_ids), 1)
+    pairs = np.sort(group_codes[known].astype(np.int64) * width + context_codes[known])
+    distinct = pairs[np.diff(pairs, prepend=-1) != 0]
+    result["contexts"] = np.bincount(distinct // width, minlength=len(result))
+    quantiles = groups["duration_time"].quantile(list(QUANTILES)).unstack()
+    for q, col in zip(QUANTILES, ROLLUP_COLUMNS[2:]):
+        result[col] = quantiles[q] if len(quantiles.columns) else pd.Series(dtype="float64")
+    if sketches:
+        durations = group_duration_sketches(group_codes, len(result), data["duration_time"].to_numpy(np.float64))
+        contexts = group_context_sketches(group_codes, len(result), context_codes, hash_values(context_ids))
+        result["duration_sketch"] = [durations.get(code, DDSketch()) for code in range(len(result))]
+        result["contexts_sketch"] = [contexts.get(code, HyperLogLog()) for code in range(len(result))]
+    return result.reset_index()
+
+
+def merge_rollup(df: pd.DataFrame, freq: str, by_flow: Optional[bool] = None) -> pd.DataFrame:
+    """
+    | Merge the buckets of a rollup built with `sketches=True` into buckets of `freq`, e.g. minutes into days,
+    | and optionally merge the flows. The distinct contexts and the percentiles of the merged buckets
+    | are estimated from the merged sketches, see :py:mod:`~dff_node_stats.sketches` for the error bounds.
+    | Rollups of different dataframes, e.g. of the chunks of a large storage, can be concatenated and merged as well.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        A rollup with the sketch columns.
+    freq: str
+        A fixed pandas frequency that is a multiple of the frequency of the rollup.
+    by_flow: Optional[bool]
+        Whether to keep the values broken down by `flow_label`. Defaults to whether the rollup has this column.
+    """
+    by_flow = "flow_label" in df.columns if by_flow is None else by_flow
+    keys: List[str] = ["bucket", "flow_label"] if by_flow else ["bucket"]
+    data = df.assign(bucket=pd.to_datetime(df["bucket"]).dt.floor(f"{bucket_seconds(freq)}s"))
+    rows = []
+    for key, group in data.groupby(keys, observed=True, sort=True):
+        durations, contexts = DDSketch(), HyperLogLog()
+        for duration_sketch, contexts_sketch in zip(group["duration_sketch"], group["contexts_sketch"]):
+            durations.merge(duration_sketch)
+            contexts.merge(contexts_sketch)
+        values = [int(group["turns"].sum()), contexts.count] + durations.quantiles(QUANTILES).tolist()
+        rows.append(list(key if isinstance(key, tuple) else (key,)) + values + [durations, contexts])
+    return pd.DataFrame(rows, columns=keys + ROLLUP_COLUMNS + ["duration_sketch", "contexts_sketch"])
+
+
+def add_saved_sketches(df: pd.DataFrame, records: Iterable[Tuple[Any, str, str]], freq: str) -> pd.DataFrame:
+    """
+    | Add the sketch columns to a rollup loaded from a database, from the sketches saved
+    | by :py:class:`~dff_node_stats.stats.Stats` (see :py:meth:`~dff_node_stats.savers.saver.Saver.save_sketches`)
+    | for the time buckets of :py:data:`~dff_node_stats.stats.SKETCH_BUCKET`, which should not be longer than `freq`.
+    | The buckets without saved sketches get empty ones.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The rollup, in the layout of :py:func:`~dff_node_stats.rollups.as_rollup_frame`.
+    records: Iterable[Tuple[Any, str, str]]
+        The (batch time, key, JSON) triples of the saved sketches.
+    freq: str
+        The frequency of the rollup.
+    """
+    by_flow = "flow_label" in df.columns
+    seconds = bucket_seconds(freq)
+    groups: Dict[tuple, List[Tuple[str, str]]] = {}
+    for batch_time, key, payload in records:
+        if key.startswith("duration/node/"):
+            # the nodes are keyed by "flow_label:node_label"
+            name, flow = "duration", key[len("duration/node/") :].partition(":")[0]
+        elif by_flow and key.startswith("contexts/flow/"):
+            name, flow = "contexts", key[len("contexts/flow/") :]
+        elif not by_flow and key == "contexts/all":
+            name, flow = "contexts", None
+        else:
+            continue
+        bucket = pd.Timestamp(batch_time).floor(f"{seconds}s")
+        groups.setdefault((bucket, flow) if by_flow else (bucket,), []).append((name, payload))
+
+    sketches = {group: SketchSet.from_records(records) for group, records in groups.items()}
+    keys = zip(df["bucket"], df["flow_label"].astype(object)) if by_flow else zip(df["bucket"])
+    found = [sketches.get(key, SketchSet()) for key in keys]
+    df = df.copy()
+    df["duration_sketch"] = [part["duration"] if "duration" in part else DDSketch() for part in found]
+    df["contexts_sketch"] = [part["contexts"] if "contexts" in part else HyperLogLog() for part in found]
+    return df
+
+
+def as_rollup_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a rollup loaded from a database to the layout returned by :py:func:`~dff_node_stats.rollups.rollup`.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The rollup with a `bucket` column and an optional `flow_label` column.
+    """
+    df = df.copy()
+    df["bucket"] = pd.to_datetime(df["bucket"])
+    if "flow_label" in df.columns:
+        df["flow_label"] = df["flow_label"].astype("category")
+    df[["turns", "contexts"]] = df[["turns", "contexts"]].astype("int64")
+    df[ROLLUP_COLUMNS[2:]] = df[ROLLUP_COLUMNS[2:]].astype("float64")
+    return df
@@ -1 +1,2 @@
-from .saver import Saver
+from .saver import Saver, Watermark
+from .cache import LoadCache
@@ -0,0 +1,125 @@
+"""
+Cache
+---------------------------
+Provides :py:class:`~dff_node_stats.savers.cache.LoadCache`, an optional on-disk cache
+for the dataframes loaded by a :py:class:`~dff_node_stats.savers.saver.Saver`.
+The dataframes are stored in the Feather (Arrow IPC) format, so the `pyarrow` package is required to use it.
+
+"""
+from typing import Dict, List, Optional, Tuple, Union
+import hashlib
+import json
+import os
+import pathlib
+
+import pandas as pd
+
+from .saver import Watermark
+
+
+class LoadCache:
+    """
+    | Stores the typed dataframes returned by the savers in a local directory,
+    | so that a restarted process can skip parsing the source data.
+    | An entry is keyed by the saver location, the source fingerprint
+    | (see :py:meth:`~dff_node_stats.savers.saver.Saver.fingerprint`) and the requested column types,
+    | so any change to the source data makes the old entries unreachable.
+    | Least recently used entries are evicted once the directory exceeds `max_bytes`.
+
+    Pass an instance to :py:class:`~dff_node_stats.stats.Stats` to use it::
+
+        stats = Stats(saver=Saver("csv://examples/stats.csv"), cache=LoadCache("/tmp/dff_cache"))
+
+    Parameters
+    ----------
+
+    path: str
+        The directory to keep the cached dataframes in. It is created if missing.
+    max_bytes: int
+        The size limit of the cache directory. Defaults to 1 GiB.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1 << 30) -> None:
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def get(
+        self,
+        saver,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> Optional[Tuple[pd.DataFrame, Watermark]]:
+        """
+        Return the cached dataframe along with the watermark it was loaded up to,
+        or `None` if the source has changed since it was cached.
+        """
+        key = self._key(saver, column_types, parse_dates)
+        data_file, meta_file = self._files(key)
+        if not data_file.exists() or not meta_file.exists():
+            return None
+        try:
+            df = pd.read_feather(data_file)
+            watermark = Watermark(*json.loads(meta_file.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+        os.utime(data_file)  # mark as recently used
+        return saver.category_dictionary.encode(df, column_types), watermark
+
+    def put(
+        self,
+        saver,
+        df: pd.DataFrame,
+        watermark: Watermark,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> bool:
+        """
+        Store the dataframe loaded from the saver. Returns `False` if it could not be
+        serialized, e.g. because of columns with arbitrary python objects.
+        """
+        key = self._key(saver, column_types, parse_dates)
+        data_file, meta_file = self._files(key)
+        tmp_file = data_file.with_suffix(".tmp")
+        try:
+            df.reset_index(drop=True).to_feather(tmp_file)
+        except (ImportError, ValueError, TypeError):
+            tmp_file.unlink(missing_ok=True)
+            return False
+        meta_file.write_text(json.dumps(list(watermark)))
+        os.replace(tmp_file, data_file)
+        self._evict()
+        return True
+
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        for file in self.path.glob("*.feather"):
+            self._remove(file)
+
+    def _key(
+        self,
+        saver,
+        column_types: Optional[Dict[str, str]],
+        parse_dates: Union[List[str], bool],
+    ) -> str:
+        source = [type(saver).__name__, str(saver.path), getattr(saver, "table", ""), saver.fingerprint()]
+        dates = sorted(parse_dates) if isinstance(parse_dates, list) else parse_dates
+        params = [sorted((column_types or {}).items()), dates]
+        return hashlib.sha1(json.dumps([source, params]).encode("utf-8")).hexdigest()
+
+    def _files(self, key: str) -> Tuple[pathlib.Path, pathlib.Path]:
+        return self.path / f"{key}.feather", self.path / f"{key}.json"
+
+    def _evict(self) -> None:
+        files = sorted(self.path.glob("*.feather"), key=lambda file: file.stat().st_mtime)
+        total = sum(file.stat().st_size for file in files)
+        for file in files[:-1]:  # the newest entry is kept even if it exceeds the limit
+            if total <= self.max_bytes:
+                break
+            total -= file.stat().st_size
+            self._remove(file)
+
+    @staticmethod
+    def _remove(data_file: pathlib.Path) -> None:
+        data_file.unlink(missing_ok=True)
+        data_file.with_suffix(".json").unlink(missing_ok=True)
@@ -6,12 +6,44 @@ You don't need to interact with this class manually, as it will be automatically
 initialized when you construct a :py:class:`~dff_node_stats.savers.saver.Saver` with specific parameters.
 
 """
-from typing import List, Optional, Union, Dict
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union, Dict
+from io import BytesIO
+import datetime
+import itertools
+import json
 import pathlib
 import os
+import uuid
+import zlib
 
 import pandas as pd
 
+from .saver import Watermark
+from .. import aggregates, rollups, sessions
+from ..sketches import BloomFilter, SketchSet, hash_values
+from ..transitions import turn_order
+from ..utils import CategoryDictionary
+
+INDEX_BLOCK_ROWS = 10000
+"""
+The number of rows of a block of the context index of :py:class:`~dff_node_stats.savers.csv.CsvSaver`.
+
+"""
+
+CHECKSUM_BYTES = 4096
+"""
+The number of bytes before the offset of a :py:class:`~dff_node_stats.savers.saver.Watermark` of
+:py:class:`~dff_node_stats.savers.csv.CsvSaver` that are checksummed, to tell that the file has been rewritten.
+
+"""
+
+SKETCH_COMPACT_BYTES = 1 << 20
+"""
+The size from which the sketch file of :py:class:`~dff_node_stats.savers.csv.CsvSaver` is compacted:
+when it has grown to twice its size after the previous compaction, the sketches replaced by later saves are dropped.
+
+"""
+
 
 class CsvSaver:
     """
@@ -29,11 +61,29 @@ class CsvSaver:
         >>> CsvSaver("csv://foo/bar.csv")
     table: str
         Does not affect the class. Added for constructor uniformity.
+
+    | New rows are appended to the end of the file, so the byte offset of the last loaded row
+    | serves as a :py:class:`~dff_node_stats.savers.saver.Watermark` for incremental loading.
+    | The watermark keeps a checksum of the bytes before the offset: if the file has been truncated
+    | or rewritten since, it is loaded again from the start.
+    | Sketches are appended to a JSON lines file next to the csv file, e.g. `foo/bar.sketches.jsonl`,
+    | which is rewritten from time to time without the sketches that later saves have replaced
+    | (see :py:data:`~dff_node_stats.savers.csv.SKETCH_COMPACT_BYTES`).
+    | The contexts of each block of :py:data:`~dff_node_stats.savers.csv.INDEX_BLOCK_ROWS` rows are kept
+    | in a :py:class:`~dff_node_stats.sketches.BloomFilter` in another JSON lines file, e.g. `foo/bar.index.jsonl`,
+    | so that :py:meth:`~dff_node_stats.savers.csv.CsvSaver.load_contexts` only reads the blocks of the contexts.
+    | The index is extended by the lookups, with the rows saved since the previous one.
     """
 
     def __init__(self, path: str, table: str = "dff_stats") -> None:
         path = path.partition("://")[2]
         self.path = pathlib.Path(path)
+        self.sketches_path = self.path.with_name(f"{self.path.stem}.sketches.jsonl")
+        self.index_path = self.path.with_name(f"{self.path.stem}.index.jsonl")
+        self._index_schema: Optional[str] = None
+        self._index: List[Tuple[int, int, BloomFilter]] = []
+        self._sketches_compacted = 0
+        self.category_dictionary = CategoryDictionary()
 
     def save(
         self,
@@ -41,23 +91,258 @@ class CsvSaver:
         column_types: Optional[Dict[str, str]] = None,
         parse_dates: Union[List[str], bool] = False,
     ) -> None:
+        df = pd.concat(dfs)
 
-        if self.path.exists() and os.path.getsize(self.path) > 0:
-            saved_df = self.load(column_types=column_types, parse_dates=parse_dates)
-        else:
-            saved_df = pd.DataFrame()
-        pd.concat([saved_df] + dfs).to_csv(self.path, index=False)
+        if not self.path.exists() or os.path.getsize(self.path) == 0:
+            df.to_csv(self.path, index=False)
+            return
+
+        saved_columns = list(pd.read_csv(self.path, nrows=0).columns)
+        if set(saved_columns) == set(df.columns):
+            # append, so that the rows that have already been written keep their offsets
+            df[saved_columns].to_csv(self.path, mode="a", header=False, index=False)
+            return
+
+        # the set of columns has changed: the whole file has to be rewritten
+        saved_types = {k: v for k, v in (column_types or {}).items() if k in saved_columns}
+        saved_dates = [col for col in (parse_dates or []) if col in saved_columns]
+        saved_df = self.load(column_types=saved_types or None, parse_dates=saved_dates)
+        pd.concat([saved_df, df]).to_csv(self.path, index=False)
 
     def load(
         self,
         column_types: Optional[Dict[str, str]] = None,
         parse_dates: Union[List[str], bool] = False,
     ) -> pd.DataFrame:
-        if parse_dates and column_types:
-            true_types = {k: v for k, v in column_types.items() if k in (column_types.keys() - set(parse_dates))}
-        return pd.read_csv(
-            self.path,
-            usecols=column_types.keys(),
+        return self._read(self.path, column_types, parse_dates)
+
+    def load_since(
+        self,
+        watermark: Optional[Watermark] = None,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> Tuple[pd.DataFrame, Watermark]:
+        with self.path.open("rb") as file:
+            header = file.readline()
+            schema = header.decode("utf-8").strip()
+            start = self._resume(file, watermark, schema)
+            file.seek(max(start, len(header)))
+            body = file.read()
+            body = body[: body.rfind(b"\n") + 1]  # skip a line that is still being written
+            stop = max(start, len(header)) + len(body)
+            key = self._checksum(file, stop)
+        df = self._read(BytesIO(header + body), column_types, parse_dates)
+        return df, Watermark(schema, start, stop, key)
+
+    def iter_load(
+        self,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+        chunksize: int = 100000,
+        watermark: Optional[Watermark] = None,
+    ) -> Iterator[Tuple[pd.DataFrame, Watermark]]:
+        with self.path.open("rb") as file:
+            header = file.readline()
+            schema = header.decode("utf-8").strip()
+            start = self._resume(file, watermark, schema)
+            position = max(start, len(header))
+            file.seek(position)
+            while True:
+                lines = list(itertools.islice(iter(file.readline, b""), chunksize))
+                if lines and not lines[-1].endswith(b"\n"):
+                    lines.pop()  # skip a line that is still being written
+                if not lines:
+                    return
+                body = b"".join(lines)
+                df = self._read(BytesIO(header + body), column_types, parse_dates)
+                stop = position + len(body)
+                key = self._checksum(file, stop)
+                file.seek(stop)
+                yield df, Watermark(schema, position if position > len(header) else 0, stop, key)
+                position = stop
+
+    def _resume(self, file: BinaryIO, watermark: Optional[Watermark], schema: str) -> int:
+        """Return the offset the load resumes at: the stop of the watermark, unless the file has been rewritten."""
+        if watermark is None or watermark.schema != schema:
+            return 0
+        size = file.seek(0, os.SEEK_END)
+        if watermark.stop > size:  # the file has been truncated
+            return 0
+        if watermark.key is not None and self._checksum(file, watermark.stop) != watermark.key:
+            return 0  # the loaded rows have been overwritten
+        return watermark.stop
+
+    @staticmethod
+    def _checksum(file: BinaryIO, stop: int) -> str:
+        """The checksum of the :py:data:`~dff_node_stats.savers.csv.CHECKSUM_BYTES` bytes before `stop`."""
+        begin = max(stop - CHECKSUM_BYTES, 0)
+        file.seek(begin)
+        return format(zlib.crc32(file.read(stop - begin)), "08x")
+
+    def load_context(
+        self,
+        context_id: str,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> pd.DataFrame:
+        return self.load_contexts([context_id], column_types, parse_dates)
+
+    def load_contexts(
+        self,
+        context_ids: Iterable[str],
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> pd.DataFrame:
+        ids = pd.unique(pd.Series([str(context_id) for context_id in context_ids], dtype=object))
+        hashes = hash_values(ids)
+        with self.path.open("rb") as file:
+            header = file.readline()
+            stop = self._update_index(file, header)
+            parts = []
+            for start, end, bloom in self._index:
+                if bloom.contains_hashes(hashes).any():
+                    file.seek(start)
+                    parts.append(file.read(end - start))
+            file.seek(stop)
+            tail = file.read()
+        parts.append(tail[: tail.rfind(b"\n") + 1])  # the rows that are not indexed yet
+
+        read_types = column_types
+        if column_types and "context_id" not in column_types:
+            read_types = {**column_types, "context_id": "str"}
+        df = self._read(BytesIO(header + b"".join(parts)), read_types, parse_dates)
+        df = df[df["context_id"].astype(str).isin(ids)]
+        context_codes, _ = pd.factorize(df["context_id"].astype(str), sort=True)
+        df = df.iloc[turn_order(df, context_codes)].reset_index(drop=True)
+        return df[list(column_types)] if column_types else df
+
+    def _update_index(self, file: BinaryIO, header: bytes) -> int:
+        """Index the full blocks saved since the last lookup. Returns the offset of the rows that are not indexed."""
+        schema = header.decode("utf-8").strip()
+        if self._index_schema != schema:
+            self._index_schema, self._index = schema, self._read_index(schema)
+        stop = self._index[-1][1] if self._index else len(header)
+        if stop > os.fstat(file.fileno()).st_size:  # the file has been rewritten
+            self._index, stop = [], len(header)
+            self.index_path.unlink(missing_ok=True)
+
+        blocks = []
+        file.seek(stop)
+        while True:
+            lines = list(itertools.islice(iter(file.readline, b""), INDEX_BLOCK_ROWS))
+            if len(lines) < INDEX_BLOCK_ROWS or not lines[-1].endswith(b"\n"):
+                break
+            body = b"".join(lines)
+            contexts = pd.read_csv(BytesIO(header + body), usecols=["context_id"], dtype=str)["context_id"].unique()
+            bloom = BloomFilter(len(contexts))
+            bloom.update(contexts)
+            blocks.append((stop, stop + len(body), bloom))
+            stop += len(body)
+        if blocks:
+            lines = [
+                json.dumps({"schema": schema, "start": start, "stop": end, "bloom": bloom.to_dict()}) + "\n"
+                for start, end, bloom in blocks
+            ]
+            with self.index_path.open("a", encoding="utf-8") as index_file:
+                index_file.write("".join(lines))
+            self._index.extend(blocks)
+        return stop
+
+    def _read_index(self, schema: str) -> List[Tuple[int, int, BloomFilter]]:
+        if not self.index_path.exists():
+            return []
+        blocks = []
+        with self.index_path.open(encoding="utf-8") as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    break  # a block that is still being written
+                record = json.loads(line)
+                if record["schema"] != schema:  # the file has been rewritten with other columns
+                    self.index_path.unlink()
+                    return []
+                if record["start"] == (blocks[-1][1] if blocks else record["start"]):  # skip duplicate blocks
+                    blocks.append((record["start"], record["stop"], BloomFilter.from_dict(record["bloom"])))
+        return blocks
+
+    def fingerprint(self) -> str:
+        stat = os.stat(self.path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def load_sessions(self) -> pd.DataFrame:
+        saved_columns = list(pd.read_csv(self.path, nrows=0).columns)
+        column_types = {col: _type for col, _type in sessions.SOURCE_COLUMNS.items() if col in saved_columns}
+        parse_dates = [col for col in ["start_time"] if col in column_types]
+        return sessions.summarize_sessions(self._read(self.path, column_types, parse_dates))
+
+    def load_rollup(self, freq: str = "1min", by_flow: bool = True, sketches: bool = False) -> pd.DataFrame:
+        df = self._read(self.path, rollups.SOURCE_COLUMNS, ["start_time"])
+        return rollups.rollup(df, freq, by_flow, sketches)
+
+    def load_aggregates(self) -> pd.DataFrame:
+        saved_columns = list(pd.read_csv(self.path, nrows=0).columns)
+        column_types = {col: _type for col, _type in sessions.SOURCE_COLUMNS.items() if col in saved_columns}
+        parse_dates = [col for col in ["start_time"] if col in column_types]
+        return aggregates.aggregate_transitions(self._read(self.path, column_types, parse_dates))
+
+    def save_sketches(
+        self, sketches: SketchSet, bucket: Optional[datetime.datetime] = None, writer: Optional[str] = None
+    ) -> None:
+        batch_time = (bucket or datetime.datetime.now()).isoformat()
+        writer = writer or uuid.uuid4().hex
+        lines = [
+            json.dumps({"batch_time": batch_time, "key": key, "writer": writer, "sketch": json.loads(payload)}) + "\n"
+            for key, payload in sketches.to_records()
+        ]
+        with self.sketches_path.open("a", encoding="utf-8") as file:  # a single write per batch
+            file.write("".join(lines))
+        if self.sketches_path.stat().st_size >= max(2 * self._sketches_compacted, SKETCH_COMPACT_BYTES):
+            self._compact_sketches()
+
+    def load_sketches(
+        self, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None
+    ) -> SketchSet:
+        records = (
+            (record["key"], json.dumps(record["sketch"]))
+            for record in map(json.loads, self._latest_sketches().values())
+            if (since is None or datetime.datetime.fromisoformat(record["batch_time"]) >= since)
+            and (until is None or datetime.datetime.fromisoformat(record["batch_time"]) < until)
+        )
+        return SketchSet.from_records(records)
+
+    def _latest_sketches(self) -> Dict[tuple, str]:
+        """Return the last saved line of each key, bucket and writer."""
+        latest = {}
+        if not self.sketches_path.exists():
+            return latest
+        with self.sketches_path.open(encoding="utf-8") as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    continue  # a batch that is still being written
+                record = json.loads(line)
+                latest[record["batch_time"], record["key"], record["writer"]] = line
+        return latest
+
+    def _compact_sketches(self) -> None:
+        compacted = self.sketches_path.with_name(f"{self.sketches_path.name}.tmp")
+        with compacted.open("w", encoding="utf-8") as file:
+            file.write("".join(self._latest_sketches().values()))
+        os.replace(compacted, self.sketches_path)
+        self._sketches_compacted = self.sketches_path.stat().st_size
+
+    def _read(
+        self,
+        source: Union[pathlib.Path, BytesIO],
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> pd.DataFrame:
+        true_types = None
+        if column_types:
+            dates = set(parse_dates) if parse_dates else set()
+            true_types = {k: v for k, v in column_types.items() if k not in dates}
+        df = pd.read_csv(
+            source,
+            usecols=list(column_types.keys()) if column_types else None,
             dtype=true_types,
             parse_dates=parse_dates,
         )
+        return self.category_dictionary.encode(df, column_types)
@@ -7,12 +7,67 @@ On the other hand, it is also used to automatically construct the child classes
 depending on the input parameters. See the class documentation for more info.
 
 """
-from typing import Dict, List, Union, Optional
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple, Union, Optional
+import datetime
+import json
 import pathlib
 import importlib
 
 import pandas as pd
 
+from ..sketches import SketchSet
+
+
+class Watermark(NamedTuple):
+    """
+    Marks the part of the storage that has already been loaded.
+    Returned by :py:meth:`~dff_node_stats.savers.saver.Saver.load_since` alongside the loaded rows.
+
+    Attributes:
+        schema: A fingerprint of the storage layout (e.g. the column names).
+        When it changes, the previously loaded data is stale and the next load starts over.
+
+        start: The position the returned rows start at. A zero value means that the storage was read from the beginning.
+
+        stop: The position the next load should start at (a row count or a file offset, depending on the storage).
+
+        key: Where the next load resumes, for the storages that do not resume at `stop`: the JSON encoded
+        :py:data:`~dff_node_stats.savers.saver.WATERMARK_KEY` of the last loaded row for the databases,
+        the checksum of the bytes before `stop` for the csv files.
+
+    """
+
+    schema: str
+    start: int
+    stop: int
+    key: Optional[str] = None
+
+
+WATERMARK_KEY = ["start_time", "context_id", "history_id"]
+"""
+The columns the database savers order the rows by for incremental loading.
+They are collected by :py:class:`~dff_node_stats.collectors.DefaultCollector` and tell each turn apart,
+so the rows after a watermark are those with a greater key, whatever order the database returns the rows in.
+
+"""
+
+
+def watermark_key(df: pd.DataFrame) -> Optional[str]:
+    """
+    Return the JSON encoded :py:data:`~dff_node_stats.savers.saver.WATERMARK_KEY` of the last row
+    of a dataframe sorted by it, or `None` if the dataframe is empty or lacks the key columns.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The loaded rows.
+    """
+    if len(df) == 0 or not set(WATERMARK_KEY) <= set(df.columns):
+        return None
+    start_time, context_id, history_id = df[WATERMARK_KEY].iloc[-1]
+    return json.dumps([pd.Timestamp(start_time).isoformat(), str(context_id), int(history_id)])
+
 
 class Saver:
     """
@@ -20,6 +75,16 @@ class Saver:
 
     #. :py:meth:`~dff_node_stats.savers.saver.Saver.save`
     #. :py:meth:`~dff_node_stats.savers.saver.Saver.load`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.load_since`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.iter_load`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.load_context`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.load_contexts`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.fingerprint`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.load_sessions`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.load_rollup`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.load_aggregates`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.save_sketches`
+    #. :py:meth:`~dff_node_stats.savers.saver.Saver.load_sketches`
 
     | A call to Saver is needed to instantiate one of the predefined child classes.
     | The subclass is chosen depending on the `path` parameter value (see Parameters).
@@ -41,9 +106,13 @@ class Saver:
         and instantiate it.
         For instance, a call to `Saver("csv://...")` will eventually produce a :py:class:`~dff_node_stats.savers.csv.CsvSaver`,
         while a call to `Saver("clickhouse://...")` produces a :py:class:`~dff_node_stats.savers.clickhouse.ClickHouseSaver`
+        and a call to `Saver("sharded://csv://stats_{shard}.csv", shards=4)` produces
+        a :py:class:`~dff_node_stats.savers.sharded.ShardedSaver` that splits the stats between four csv files.
 
     table: str
         Sets the name of the db table to use, if necessary. Defaults to "dff_stats".
+    kwargs:
+        Passed to the child class, e.g. `aggregates=True` for the database savers.
     """
 
     _saver_mapping = {}
@@ -52,7 +121,7 @@ class Saver:
         super().__init_subclass__(**kwargs)
         cls._saver_mapping[storage_type] = cls.__name__
 
-    def __new__(cls, path: Optional[str] = None, table: str = "dff_stats"):
+    def __new__(cls, path: Optional[str] = None, table: str = "dff_stats", **kwargs):
         if not path:
             raise ValueError(
                 """
@@ -86,7 +155,7 @@ class Saver:
             subclass_name,
         )
         obj = object.__new__(subclass)
-        obj.__init__(str(path), table)
+        obj.__init__(str(path), table, **kwargs)
         return obj
 
     def save(
@@ -124,6 +193,161 @@ class Saver:
         """
         raise NotImplementedError
 
+    def load_since(
+        self,
+        watermark: Optional[Watermark] = None,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> Tuple[pd.DataFrame, Watermark]:
+        """
+        Load the rows that were added after the `watermark`.
+        If the watermark is missing or stale, all rows are loaded and the returned watermark starts at zero.
+
+        Parameters
+        ----------
+
+        watermark: Optional[Watermark] = None
+        column_types: Optional[Dict[str, str]] = None
+        parse_dates: Union[List[str], bool] = False
+        """
+        raise NotImplementedError
+
+    def iter_load(
+        self,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+        chunksize: int = 100000,
+        watermark: Optional[Watermark] = None,
+    ) -> Iterator[Tuple[pd.DataFrame, Watermark]]:
+        """
+        Load the data in chunks of at most `chunksize` rows, starting after the `watermark`, if it is still valid.
+        Each chunk is yielded with a watermark that can be used to resume loading right after it.
+
+        Parameters
+        ----------
+
+        column_types: Optional[Dict[str, str]] = None
+        parse_dates: Union[List[str], bool] = False
+        chunksize: int = 100000
+        watermark: Optional[Watermark] = None
+        """
+        raise NotImplementedError
+
+    def load_context(
+        self,
+        context_id: str,
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> pd.DataFrame:
+        """
+        Load the turns of a single context in their order, without reading the whole storage.
+
+        Parameters
+        ----------
+
+        context_id: str
+        column_types: Optional[Dict[str, str]] = None
+        parse_dates: Union[List[str], bool] = False
+        """
+        raise NotImplementedError
+
+    def load_contexts(
+        self,
+        context_ids: Iterable[str],
+        column_types: Optional[Dict[str, str]] = None,
+        parse_dates: Union[List[str], bool] = False,
+    ) -> pd.DataFrame:
+        """
+        Load the turns of several contexts, sorted by `context_id` and then in their order.
+        Database savers look the contexts up in an index of the `context_id` column,
+        the csv saver only reads the blocks of the file that may contain them.
+
+        Parameters
+        ----------
+
+        context_ids: Iterable[str]
+        column_types: Optional[Dict[str, str]] = None
+        parse_dates: Union[List[str], bool] = False
+        """
+        raise NotImplementedError
+
+    def fingerprint(self) -> str:
+        """
+        Return a cheap string that changes whenever the stored data changes,
+        e.g. the size and the modification time of a file.
+        """
+        raise NotImplementedError
+
+    def load_sessions(self) -> pd.DataFrame:
+        """
+        Load the session table: one row per `context_id`, in the layout of
+        :py:func:`~dff_node_stats.sessions.summarize_sessions`.
+        Database savers compute it on the server side and keep it in a view next to the stats table.
+        """
+        raise NotImplementedError
+
+    def load_rollup(self, freq: str = "1min", by_flow: bool = True, sketches: bool = False) -> pd.DataFrame:
+        """
+        Load the stats resampled into time buckets, in the layout of :py:func:`~dff_node_stats.rollups.rollup`.
+        Database savers aggregate on the server side, so that only the buckets are transferred,
+        and read the sketch columns from the persisted sketches
+        (see :py:func:`~dff_node_stats.rollups.add_saved_sketches`).
+
+        Parameters
+        ----------
+
+        freq: str = "1min"
+        by_flow: bool = True
+        sketches: bool = False
+            Whether to add the sketch columns, so that the rollup can be merged with
+            :py:func:`~dff_node_stats.rollups.merge_rollup`.
+        """
+        raise NotImplementedError
+
+    def load_aggregates(self) -> pd.DataFrame:
+        """
+        Load the transition table, in the layout of :py:func:`~dff_node_stats.aggregates.aggregate_transitions`.
+        Database savers created with `aggregates=True` read it from a table that is updated along with each insert,
+        the others aggregate the stats table.
+        """
+        raise NotImplementedError
+
+    def save_sketches(
+        self, sketches: SketchSet, bucket: Optional[datetime.datetime] = None, writer: Optional[str] = None
+    ) -> None:
+        """
+        Save the sketches of a time bucket next to the stats.
+        The sketches saved by a `writer` replace those it saved before for the same bucket,
+        so the storage holds one record per key, bucket and writer;
+        they are merged by :py:meth:`~dff_node_stats.savers.saver.Saver.load_sketches`.
+
+        Parameters
+        ----------
+
+        sketches: :py:class:`~dff_node_stats.sketches.SketchSet`
+        bucket: Optional[datetime.datetime] = None
+            The start of the time bucket. Defaults to the current time.
+        writer: Optional[str] = None
+            The identifier of the process that keeps the sketches of the bucket.
+            Defaults to a new one, so the sketches are added to those already saved.
+        """
+        raise NotImplementedError
+
+    def load_sketches(
+        self, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None
+    ) -> SketchSet:
+        """
+        Load the sketches of the time buckets between `since` (inclusive) and `until` (exclusive)
+        and merge them key by key. Returns an empty set if no sketches have been saved.
+
+        Parameters
+        ----------
+
+        since: Optional[datetime.datetime] = None
+        until: Optional[datetime.datetime] = None
+        """
+        raise NotImplementedError
+
 
 class ClickHouseSaver(Saver, storage_type="clickhouse"):
     """ClickHouseSaver Class prototype"""
@@ -141,3 +365,9 @@ class PostgresSaver(Saver, storage_type="postgresql"):
     """PostgresSaver Class prototype"""
 
     pass
+
+
+class ShardedSaver(Saver, storage_type="sharded"):
+    """ShardedSaver Class prototype"""
+
+    pass
@@ -0,0 +1,185 @@
+"""
+Sequences
+***********
+| Path and funnel analysis over the node sequences of the dialogs.
+| :py:func:`~dff_node_stats.sequences.get_sequences` sorts the turns by context and turn order once
+| and keeps the node codes as a flat integer array, where each context is a contiguous run.
+| :py:class:`~dff_node_stats.sequences.Sequences` counts the paths of `n` consecutive nodes (n-grams)
+| and evaluates conversion funnels over this array with vectorized numpy operations only.
+
+"""
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.transitions import get_transitions, turn_order
+from dff_node_stats.utils import DffStatsException, cached_transform, requires_columns
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+"""
+The multiplier of the n-gram hash, used when the exact n-gram key does not fit into 64 bits.
+
+"""
+
+
+class Sequences(NamedTuple):
+    """
+    The node sequences of all the dialogs, sorted by context and turn order.
+
+    Attributes:
+        nodes: Node names ("flow_label:node_label"), indexed by node codes.
+
+        codes: The node code of each turn, -1 if the labels are missing.
+
+        contexts: The context code of each turn. Turns of the same context are contiguous.
+
+        context_ids: The `context_id` values, indexed by context codes.
+
+        rows: The position of each turn in the dataframe.
+
+    """
+
+    nodes: np.ndarray
+    codes: np.ndarray
+    contexts: np.ndarray
+    context_ids: np.ndarray
+    rows: np.ndarray
+
+    @property
+    def n_contexts(self) -> int:
+        return len(self.context_ids)
+
+    def boundaries(self) -> np.ndarray:
+        """The position of the first turn of each context, followed by the total number of turns."""
+        starts = np.flatnonzero(np.diff(self.contexts, prepend=-1) != 0)
+        return np.append(starts, len(self.contexts))
+
+    def ngrams(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        | Return the start positions of all the paths of `n` consecutive turns inside a context
+        | along with an integer key of each path: equal paths have equal keys.
+        | The key is exact while `len(nodes) ** n` fits into 64 bits and a 64-bit hash otherwise.
+
+        Parameters
+        ----------
+
+        n: int
+            The path length in nodes.
+        """
+        if n < 1:
+            raise DffStatsException(f"The path length should be positive, got {n}")
+        size = len(self.codes) - n + 1
+        if size <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # a window is valid if it has no missing labels and does not cross a context boundary
+        missing = np.concatenate([[0], np.cumsum(self.codes < 0)])
+        valid = (missing[n:] - missing[:size] == 0) & (self.contexts[:size] == self.contexts[n - 1 :])
+        positions = np.flatnonzero(valid)
+
+        base = max(len(self.nodes), 1)
+        if n * np.log2(base) < 63:
+            keys = np.zeros(len(positions), dtype=np.int64)
+            for offset in range(n):
+                keys = keys * base + self.codes[positions + offset]
+        else:
+            keys = np.zeros(len(positions), dtype=np.uint64)
+            with np.errstate(over="ignore"):
+                for offset in range(n):
+                    keys = (keys ^ self.codes[positions + offset].astype(np.uint64)) * _MIX
+                    keys ^= keys >> np.uint64(29)
+        return positions, keys
+
+    def ngram_counts(self, n: int, top_k: Optional[int] = None) -> pd.Series:
+        """
+        The number of times each path of `n` consecutive nodes occurred, indexed by "node->node->...".
+
+        Parameters
+        ----------
+
+        n: int
+            The path length in nodes.
+        top_k: Optional[int]
+            If set, only the `top_k` most frequent paths are returned.
+        """
+        positions, keys = self.ngrams(n)
+        path_codes, _ = pd.factorize(keys)
+        counts = np.bincount(path_codes)
+        # factorize numbers the paths in order of appearance, so a path first occurs where the running maximum grows
+        running = np.maximum.accumulate(path_codes)
+        first = np.flatnonzero(np.diff(running, prepend=-1) > 0)
+        if top_k is not None and top_k < len(counts):
+            top = np.argpartition(-counts, top_k - 1)[:top_k]
+            counts, first = counts[top], first[top]
+        names = self._path_names(positions[first], n)
+        return pd.Series(counts, index=names).sort_values(ascending=False, kind="stable")
+
+    def funnel(self, steps: Iterable[str]) -> pd.Series:
+        """
+        | The number of contexts that passed the steps of the funnel in order, indexed by the steps.
+        | Other nodes may be visited between the steps.
+        | Each step is a single vectorized pass over the turns.
+
+        Parameters
+        ----------
+
+        steps: Iterable[str]
+            Node names ("flow_label:node_label") of the funnel steps.
+        """
+        steps = list(steps)
+        step_codes = self._node_codes(steps)
+        reached = np.ones(self.n_contexts, dtype=bool)
+        position = np.full(self.n_contexts, -1, dtype=np.int64)  # the turn that passed the previous step
+        counts: List[int] = []
+        for code in step_codes:
+            rows = np.flatnonzero(self.codes == code)
+            contexts = self.contexts[rows]
+            passed = reached[contexts] & (rows > position[contexts])
+            rows, contexts = rows[passed], contexts[passed]
+            # the rows are sorted by context and turn, so the first row of each context is its earliest turn
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = contexts[1:] != contexts[:-1]
+            reached = np.zeros(self.n_contexts, dtype=bool)
+            reached[contexts[first]] = True
+            position[contexts[first]] = rows[first]
+            counts.append(int(reached.sum()))
+        return pd.Series(counts, index=pd.Index(steps, dtype=object), dtype=np.int64)
+
+    def _node_codes(self, names: List[str]) -> np.ndarray:
+        codes = pd.Index(self.nodes).get_indexer(names)
+        if (codes < 0).any():
+            unknown = [name for name, code in zip(names, codes) if code < 0]
+            raise DffStatsException(f"Unknown nodes: {', '.join(unknown)}")
+        return codes
+
+    def _path_names(self, positions: np.ndarray, n: int) -> pd.Index:
+        names = self.nodes[self.codes[positions]].astype(object)
+        for offset in range(1, n):
+            names = names + "->" + self.nodes[self.codes[positions + offset]]
+        return pd.Index(names, dtype=object)
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+@cached_transform
+def get_sequences(df: pd.DataFrame) -> Sequences:
+    """
+    Sort the node codes of the stats dataframe into per-context sequences.
+    The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe. `history_id` or `start_time` define the order of the turns if present.
+    """
+    transitions = get_transitions(df)
+    context_codes, context_ids = pd.factorize(df["context_id"])
+    order = turn_order(df, context_codes)
+    order = order[context_codes[order] >= 0]  # turns without a context belong to no sequence
+    return Sequences(
+        transitions.nodes,
+        transitions.node_codes[order],
+        context_codes[order],
+        np.asarray(context_ids, dtype=object),
+        order,
+    )
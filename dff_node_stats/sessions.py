@@ -0,0 +1,153 @@
+"""
+Sessions
+***********
+| Reduces the raw stats to one row per dialog (`context_id`).
+| :py:func:`~dff_node_stats.sessions.summarize_sessions` computes the per-dialog KPIs
+| in a single pass over the turns sorted by :py:func:`~dff_node_stats.sequences.get_sequences`:
+| every aggregate is a `reduceat` over the contiguous runs of the contexts.
+| The SQL savers compute the same table on the server side,
+| see :py:meth:`~dff_node_stats.savers.saver.Saver.load_sessions`.
+
+"""
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.sequences import get_sequences
+from dff_node_stats.transitions import get_transitions
+from dff_node_stats.utils import cached_transform, requires_columns
+
+FALLBACK_PATTERN = "fallback"
+"""
+Nodes with this substring in their `node_label` (case-insensitive) count as fallback nodes.
+
+"""
+
+SOURCE_COLUMNS = {
+    "context_id": "str",
+    "history_id": "int64",
+    "start_time": "datetime64[ns]",
+    "duration_time": "float64",
+    "flow_label": "category",
+    "node_label": "category",
+}
+"""
+The stats columns used to build the session table, along with their types.
+
+"""
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+def summarize_sessions(df: pd.DataFrame, fallback_pattern: str = FALLBACK_PATTERN) -> pd.DataFrame:
+    """
+    | Return a dataframe indexed by `context_id` with the following columns:
+
+    #. `turns`: the number of turns.
+    #. `first_node`, `last_node`: the first and the last node reached ("flow_label:node_label").
+    #. `fallback`: whether a fallback node was reached.
+    #. `flows`: the comma-separated names of the visited flows, `n_flows`: their number.
+    #. `duration_total`, `duration_mean`: the total and the mean `duration_time`, if it was collected.
+    #. `start_time`: the start of the first turn, if it was collected.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe.
+    fallback_pattern: str
+        Nodes with this substring in their `node_label` (case-insensitive) count as fallback nodes.
+    """
+    sequences = get_sequences(df)
+    transitions = get_transitions(df)
+    bounds = sequences.boundaries()
+    starts, ends = bounds[:-1], bounds[1:]
+    codes = sequences.codes
+    nodes = pd.Index(sequences.nodes, dtype=object)
+
+    result = pd.DataFrame(index=pd.Index(sequences.context_ids, name="context_id"))
+    result["turns"] = np.diff(bounds)
+    result["first_node"] = pd.Categorical.from_codes(codes[starts], categories=nodes)
+    result["last_node"] = pd.Categorical.from_codes(codes[ends - 1], categories=nodes)
+
+    labels = pd.Series([node.partition(":")[2] for node in sequences.nodes], dtype=object)
+    fallback_nodes = labels.str.contains(fallback_pattern, case=False, regex=False).to_numpy(dtype=bool)
+    # the appended values are picked by the -1 codes of the turns without a node
+    is_fallback = np.append(fallback_nodes, False)[codes]
+    result["fallback"] = _reduce(np.logical_or, is_fallback, starts)
+
+    flow_codes = np.append(transitions.node_flows, -1)[codes]
+    result["n_flows"], result["flows"] = _visited_flows(sequences.contexts, flow_codes, transitions.flows, len(starts))
+
+    if "duration_time" in df.columns:
+        durations = df["duration_time"].to_numpy(dtype=np.float64)[sequences.rows]
+        known = ~np.isnan(durations)
+        totals = _reduce(np.add, np.where(known, durations, 0.0), starts)
+        counts = _reduce(np.add, known.astype(np.int64), starts)
+        result["duration_total"] = np.where(counts > 0, totals, np.nan)
+        result["duration_mean"] = np.divide(totals, counts, out=np.full(len(totals), np.nan), where=counts > 0)
+    if "start_time" in df.columns:
+        result["start_time"] = df["start_time"].iloc[sequences.rows[starts]].to_numpy()
+    return result
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+@cached_transform
+def get_sessions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    | Transform function that returns the session table of :py:func:`~dff_node_stats.sessions.summarize_sessions`
+    | with the default fallback pattern.
+    | The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    """
+    return summarize_sessions(df)
+
+
+def as_session_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a session table loaded from a storage to the layout returned by
+    :py:func:`~dff_node_stats.sessions.summarize_sessions`.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The session table with a `context_id` column.
+    """
+    df = df.set_index("context_id")
+    for col in ("first_node", "last_node", "flows"):
+        df[col] = df[col].astype("category")
+    df["fallback"] = df["fallback"].astype(bool)
+    for col in ("turns", "n_flows"):
+        df[col] = df[col].astype(np.int64)
+    if "start_time" in df.columns:
+        df["start_time"] = pd.to_datetime(df["start_time"])
+    return df
+
+
+def _reduce(ufunc: np.ufunc, values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Reduce the values of each context, the contexts being the runs that begin at `starts`."""
+    if len(starts) == 0:
+        return np.empty(0, dtype=values.dtype)
+    return ufunc.reduceat(values, starts)
+
+
+def _visited_flows(contexts: np.ndarray, flow_codes: np.ndarray, flows: np.ndarray, n_contexts: int):
+    """Return the number of distinct flows of each context and their comma-separated names."""
+    known = flow_codes >= 0
+    pairs = pd.unique(contexts[known].astype(np.int64) * max(len(flows), 1) + flow_codes[known])
+    pair_contexts, pair_flows = pairs // max(len(flows), 1), pairs % max(len(flows), 1)
+    counts = np.bincount(pair_contexts, minlength=n_contexts)
+
+    order = np.argsort(flows, kind="stable")  # flow names are listed alphabetically
+    rank = np.empty(len(flows), dtype=np.int64)
+    rank[order] = np.arange(len(flows))
+    if len(flows) <= 64:
+        # each set of flows is a bitmask, and the names are joined once per distinct set
+        masks = np.zeros(n_contexts, dtype=np.uint64)
+        np.bitwise_or.at(masks, pair_contexts, np.left_shift(np.uint64(1), rank[pair_flows].astype(np.uint64)))
+        mask_codes, unique_masks = pd.factorize(masks)
+        bits = np.arange(len(flows), dtype=np.uint64)
+        names = [",".join(flows[order][(mask >> bits) & np.uint64(1) == 1]) for mask in np.asarray(unique_masks)]
+        return counts, pd.Categorical.from_codes(mask_codes, categories=pd.Index(names, dtype=object))
+    pairs = pd.DataFrame({"context": pair_contexts, "rank": rank[pair_flows]}).sort_values(["context", "rank"])
+    joined = pd.Series(flows[order][pairs["rank"]]).groupby(pairs["context"].to_numpy()).agg(",".join)
+    return counts, pd.Categorical(joined.reindex(range(n_contexts), fill_value="").to_numpy())
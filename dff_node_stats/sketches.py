@@ -0,0 +1,1094 @@
+"""
+Sketches
+***********
+| Small mergeable summaries of the collected data, so that the percentiles of `duration_time`
+| can be answered without keeping all the raw rows.
+| :py:class:`~dff_node_stats.sketches.DDSketch` is a quantile sketch with a relative error guarantee:
+| for any quantile `q`, the returned value `v` satisfies `|v - x_q| <= relative_accuracy * x_q`,
+| `x_q` being the exact quantile of the added values. The guarantee holds for merged sketches as well.
+| :py:class:`~dff_node_stats.sketches.HyperLogLog` estimates the number of distinct contexts,
+| e.g. of the dialogs that reached a node, in constant memory.
+| :py:class:`~dff_node_stats.sketches.SpaceSaving` tracks the most frequent transitions or nodes
+| in bounded memory, however many distinct ones there are.
+| :py:class:`~dff_node_stats.sketches.BloomFilter` tells whether a value, e.g. a context, may have been added,
+| so that the blocks of a file that do not contain it can be skipped.
+| :py:class:`~dff_node_stats.sketches.SketchSet` keeps one sketch per key (e.g. per node)
+| and is what the savers store along with each batch of stats.
+
+Example::
+
+    sketch = DDSketch(relative_accuracy=0.01)
+    sketch.update(df["duration_time"])
+    sketch.quantile(0.99)  # within 1% of the exact p99
+
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import base64
+import json
+import math
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.transitions import get_transitions
+from dff_node_stats.utils import DffStatsException, cached_transform, requires_columns
+
+
+class DDSketch:
+    """
+    | A mergeable quantile sketch (see Masson et al., "DDSketch: A Fast and Fully-Mergeable Quantile Sketch
+    | with Relative-Error Guarantees", 2019) for non-negative values like `duration_time`.
+    | A value `x` is counted in the bin `ceil(log(x) / log(gamma))`, `gamma = (1 + a) / (1 - a)`,
+    | so the memory depends on the range of the values rather than on their number:
+    | with the default 1% accuracy, values from 1 microsecond to 1 hour take less than 1100 bins.
+    | Values below `min_value` are counted as zeros. When the number of bins exceeds `max_bins`,
+    | the lowest bins are collapsed, which only affects the accuracy of the lowest quantiles.
+
+    Parameters
+    ----------
+
+    relative_accuracy: float
+        The relative error guarantee of the quantiles, between 0 and 1.
+    max_bins: int
+        The maximum number of bins to keep.
+    min_value: float
+        The smallest value that is not counted as zero.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048, min_value: float = 1e-9) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"The relative accuracy should be between 0 and 1, got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        """Add a single value. Unlike :py:meth:`~dff_node_stats.sketches.DDSketch.update`, it avoids numpy overhead."""
+        if math.isnan(value):
+            return
+        if value > self.min_value:
+            key = math.ceil(math.log(value) / math.log(self.gamma))
+            self.bins[key] = self.bins.get(key, 0) + 1
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        else:
+            self.zero_count += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def update(self, values: Union[Iterable[float], np.ndarray, pd.Series]) -> None:
+        """
+        Add an array of values. Missing values are skipped.
+
+        Parameters
+        ----------
+
+        values: Union[Iterable[float], np.ndarray, pd.Series]
+            The values to add.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        positive = values > self.min_value
+        keys, counts = np.unique(self._keys(values[positive]), return_counts=True)
+        self._add_bins(keys, counts, int(len(values) - positive.sum()))
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        """
+        Add the values of another sketch with the same accuracy to this one. Returns this sketch.
+
+        Parameters
+        ----------
+
+        other: :py:class:`~dff_node_stats.sketches.DDSketch`
+            The sketch to merge.
+        """
+        if not math.isclose(other.gamma, self.gamma):
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        self._add_bins(other.bins.keys(), other.bins.values(), other.zero_count)
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def subtract(self, other: "DDSketch") -> "DDSketch":
+        """
+        | Remove the values of a sketch that was merged into this one, e.g. to slide a time window.
+        | Returns this sketch. The extremes are kept as bounds of the remaining values,
+        | so they no longer tighten the outer quantiles as much.
+
+        Parameters
+        ----------
+
+        other: :py:class:`~dff_node_stats.sketches.DDSketch`
+            The sketch to remove.
+        """
+        for key, count in list(other.bins.items()):
+            left = self.bins.get(key, 0) - count
+            if left > 0:
+                self.bins[key] = left
+            else:
+                self.bins.pop(key, None)
+        self.zero_count -= other.zero_count
+        self.count -= other.count
+        self.sum -= other.sum
+        if self.count <= 0:
+            self.bins, self.zero_count, self.count, self.sum = {}, 0, 0, 0.0
+            self.min, self.max = math.inf, -math.inf
+        return self
+
+    def quantile(self, q: float) -> float:
+        """
+        Return the approximate `q`-quantile, or NaN if the sketch is empty.
+
+        Parameters
+        ----------
+
+        q: float
+            The quantile, between 0 and 1.
+        """
+        return float(self.quantiles([q])[0])
+
+    def quantiles(self, qs: Iterable[float]) -> np.ndarray:
+        """
+        | Return the approximate quantiles for an array of `qs`.
+        | The `q`-quantile is the value of rank `floor(q * (count - 1))` among the sorted values.
+
+        Parameters
+        ----------
+
+        qs: Iterable[float]
+            The quantiles, between 0 and 1.
+        """
+        qs = np.asarray(list(qs), dtype=np.float64)
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        keys = np.array(sorted(self.bins), dtype=np.int64)
+        counts = np.array([self.bins[key] for key in keys], dtype=np.int64)
+        ranks = np.floor(np.clip(qs, 0, 1) * (self.count - 1))
+        values = np.zeros(len(qs))
+        nonzero = ranks >= self.zero_count
+        positions = np.searchsorted(self.zero_count + np.cumsum(counts), ranks[nonzero], side="right")
+        # the bin of key k holds the values in (gamma^(k-1), gamma^k], and its middle value has the least relative error
+        values[nonzero] = 2 * np.power(self.gamma, keys[positions].astype(np.float64)) / (self.gamma + 1)
+        # the exact extremes are known, and they tighten the estimate of the outer quantiles
+        return np.clip(values, self.min, self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable representation of the sketch."""
+        keys = sorted(self.bins)
+        return {
+            "type": "ddsketch",
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "min_value": self.min_value,
+            "keys": keys,
+            "counts": [self.bins[key] for key in keys],
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DDSketch":
+        """
+        Restore a sketch from :py:meth:`~dff_node_stats.sketches.DDSketch.to_dict`.
+
+        Parameters
+        ----------
+
+        data: dict
+            The serialized sketch.
+        """
+        sketch = cls(data["relative_accuracy"], data["max_bins"], data["min_value"])
+        sketch.bins = dict(zip(data["keys"], data["counts"]))
+        sketch.zero_count, sketch.count, sketch.sum = data["zero_count"], data["count"], data["sum"]
+        sketch.min = data["min"] if data["min"] is not None else math.inf
+        sketch.max = data["max"] if data["max"] is not None else -math.inf
+        return sketch
+
+    def _keys(self, values: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(values) / np.log(self.gamma)).astype(np.int64)
+
+    def _add_bins(self, keys: Iterable[int], counts: Iterable[int], zero_count: int) -> None:
+        self.zero_count += zero_count
+        for key, count in zip(keys, counts):
+            key = int(key)
+            self.bins[key] = self.bins.get(key, 0) + int(count)
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Merge the lowest bins into one, so that at most `max_bins` bins are left."""
+        keys = sorted(self.bins)
+        collapsed = keys[: len(keys) - self.max_bins + 1]
+        self.bins[collapsed[-1]] = sum(self.bins.pop(key) for key in collapsed)
+
+
+class HyperLogLog:
+    """
+    | A mergeable sketch of the number of distinct values, e.g. of the contexts that reached a node
+    | (see Flajolet et al., "HyperLogLog: the analysis of a near-optimal cardinality estimation algorithm", 2007).
+    | The sketch takes `2 ** precision` bytes whatever the number of values,
+    | and the relative standard error of the count is `1.04 / sqrt(2 ** precision)`:
+    | 1.6% with the default precision. Small counts are estimated by linear counting and are nearly exact.
+    | The values are hashed by their string representation with :py:func:`pandas.util.hash_array`,
+    | which does not depend on the process, so sketches built by different processes can be merged.
+
+    Parameters
+    ----------
+
+    precision: int
+        The number of hash bits that select a register, from 4 to 18.
+    """
+
+    def __init__(self, precision: int = 12) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError(f"The precision should be between 4 and 18, got {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+        self._pending: List[str] = []
+
+    def add(self, value: Any) -> None:
+        """Add a single value. The values are buffered and hashed in batches."""
+        self._pending.append(str(value))
+        if len(self._pending) >= 1024:
+            self._flush()
+
+    def update(self, values: Union[Iterable[Any], np.ndarray, pd.Series]) -> None:
+        """
+        Add an array of values.
+
+        Parameters
+        ----------
+
+        values: Union[Iterable[Any], np.ndarray, pd.Series]
+            The values to add.
+        """
+        self.update_hashes(hash_values(values))
+
+    def update_hashes(self, hashes: np.ndarray) -> None:
+        """
+        Add the values by their :py:func:`~dff_node_stats.sketches.hash_values`.
+
+        Parameters
+        ----------
+
+        hashes: np.ndarray
+            The 64-bit hashes of the values.
+        """
+        registers, ranks = self._registers_and_ranks(hashes)
+        np.maximum.at(self.registers, registers, ranks)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """
+        Add the values of another sketch with the same precision to this one. Returns this sketch.
+
+        Parameters
+        ----------
+
+        other: :py:class:`~dff_node_stats.sketches.HyperLogLog`
+            The sketch to merge.
+        """
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged")
+        self._flush()
+        other._flush()
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def count(self) -> int:
+        """The approximate number of distinct values."""
+        self._flush()
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * size and zeros > 0:
+            estimate = size * math.log(size / zeros)  # linear counting is more accurate for small counts
+        return int(round(estimate))
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable representation of the sketch."""
+        self._flush()
+        return {
+            "type": "hll",
+            "precision": self.precision,
+            "registers": base64.b64encode(zlib.compress(self.registers.tobytes())).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        """
+        Restore a sketch from :py:meth:`~dff_node_stats.sketches.HyperLogLog.to_dict`.
+
+        Parameters
+        ----------
+
+        data: dict
+            The serialized sketch.
+        """
+        sketch = cls(data["precision"])
+        registers = zlib.decompress(base64.b64decode(data["registers"]))
+        sketch.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+        return sketch
+
+    def _flush(self) -> None:
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self.update(pending)
+
+    def _registers_and_ranks(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The register of each hash (its top bits) and the position of the first set bit among the rest."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        registers = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes << np.uint64(self.precision)
+        ranks = np.minimum(_leading_zeros(rest) + 1, 64 - self.precision + 1).astype(np.uint8)
+        return registers, ranks
+
+
+class SpaceSaving:
+    """
+    | A mergeable summary of the most frequent values, e.g. of the transitions or the nodes
+    | (see Metwally et al., "Efficient Computation of Frequent and Top-k Elements in Data Streams", 2005,
+    | and Cafaro et al., "A parallel space saving algorithm for frequent items and the Hurwitz zeta distribution",
+    | 2016, for merging). At most `capacity` values are monitored, whatever the number of distinct values.
+    | With `N` values added, the summary guarantees that:
+
+    #. the count of a monitored value is overestimated by at most its error, so `count - error <= true count <= count`;
+    #. a value that is not monitored occurs at most :py:attr:`~dff_node_stats.sketches.SpaceSaving.floor` times,
+       and `floor <= N / capacity`, so every value that occurs more than `N / capacity` times is monitored.
+
+    | In particular, the top `k` values are exact as long as the `k`-th count minus its error
+    | is above the floor. A capacity of ten times the number of reported values is usually enough.
+
+    Parameters
+    ----------
+
+    capacity: int
+        The maximum number of monitored values.
+    """
+
+    def __init__(self, capacity: int = 1000) -> None:
+        if capacity < 1:
+            raise ValueError(f"The capacity should be positive, got {capacity}")
+        self.capacity = capacity
+        self.total = 0
+        self.counts = pd.Series(dtype=np.int64)
+        self.errors = pd.Series(dtype=np.int64)
+        self._pending: List[Any] = []
+
+    def add(self, value: Any) -> None:
+        """Add a single value. The values are buffered and added in batches."""
+        self._pending.append(value)
+        if len(self._pending) >= 1024:
+            self._flush()
+
+    def update(self, values: Union[Iterable[Any], np.ndarray, pd.Series]) -> None:
+        """
+        Add an array of values.
+
+        Parameters
+        ----------
+
+        values: Union[Iterable[Any], np.ndarray, pd.Series]
+            The values to add.
+        """
+        values = values if isinstance(values, (np.ndarray, pd.Series)) else list(values)
+        counts = pd.Series(values).value_counts(sort=False)
+        self._merge(counts.astype(np.int64), pd.Series(0, index=counts.index, dtype=np.int64), 0, len(values))
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """
+        Add the values of another summary to this one. Returns this summary.
+        The capacity of this summary is kept.
+
+        Parameters
+        ----------
+
+        other: :py:class:`~dff_node_stats.sketches.SpaceSaving`
+            The summary to merge.
+        """
+        self._flush()
+        other._flush()
+        self._merge(other.counts, other.errors, other.floor, other.total)
+        return self
+
+    @property
+    def floor(self) -> int:
+        """The maximum count of a value that is not monitored, zero until the summary is full."""
+        self._flush()
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def top(self, k: Optional[int] = None) -> pd.Series:
+        """
+        Return the estimated counts of the `k` most frequent values, or of all the monitored values.
+
+        Parameters
+        ----------
+
+        k: Optional[int]
+            The number of values.
+        """
+        self._flush()
+        order = np.argsort(-self.counts.to_numpy(), kind="stable")[:k]
+        return self.counts.iloc[order]
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable representation of the summary."""
+        self._flush()
+        return {
+            "type": "spacesaving",
+            "capacity": self.capacity,
+            "total": self.total,
+            "values": self.counts.index.tolist(),
+            "counts": self.counts.tolist(),
+            "errors": self.errors.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SpaceSaving":
+        """
+        Restore a summary from :py:meth:`~dff_node_stats.sketches.SpaceSaving.to_dict`.
+
+        Parameters
+        ----------
+
+        data: dict
+            The serialized summary.
+        """
+        sketch = cls(data["capacity"])
+        sketch.total = data["total"]
+        index = pd.Index(data["values"])
+        sketch.counts = pd.Series(data["counts"], index=index, dtype=np.int64)
+        sketch.errors = pd.Series(data["errors"], index=index, dtype=np.int64)
+        return sketch
+
+    def _flush(self) -> None:
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self.update(pending)
+
+    def _merge(self, counts: pd.Series, errors: pd.Series, floor: int, total: int) -> None:
+        """
+        Merge the counters of another summary: a value missing from one of the summaries
+        may have occurred there up to the floor of that summary, which is added to its count and its error.
+        Only the `capacity` largest counters are kept.
+        """
+        own_floor = int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+        index = self.counts.index.union(counts.index, sort=False) if len(self.counts) else counts.index
+        merged = self.counts.reindex(index, fill_value=own_floor) + counts.reindex(index, fill_value=floor)
+        merged_errors = self.errors.reindex(index, fill_value=own_floor) + errors.reindex(index, fill_value=floor)
+        if len(merged) > self.capacity:
+            keep = np.argsort(-merged.to_numpy(), kind="stable")[: self.capacity]
+            merged, merged_errors = merged.iloc[keep], merged_errors.iloc[keep]
+        self.counts, self.errors = merged.astype(np.int64), merged_errors.astype(np.int64)
+        self.total += total
+
+
+class BloomFilter:
+    """
+    | A set membership sketch (see Bloom, "Space/time trade-offs in hash coding with allowable errors", 1970).
+    | A value that was added is always found, a value that was not is found with a probability
+    | of about `(1 - exp(-hashes / bits_per_value)) ** hashes`: 0.05% with the defaults,
+    | as long as at most `capacity` distinct values are added.
+    | The values are hashed with :py:func:`~dff_node_stats.sketches.hash_values`,
+    | so filters built by different processes agree.
+
+    Parameters
+    ----------
+
+    capacity: int
+        The expected number of distinct values.
+    bits_per_value: int
+        The number of bits of the filter per expected value.
+    """
+
+    def __init__(self, capacity: int = 1000, bits_per_value: int = 16) -> None:
+        self.size = max(64, -(-capacity * bits_per_value // 64) * 64)
+        self.hashes = max(1, round(bits_per_value * math.log(2)))
+        self.bits = np.zeros(self.size // 8, dtype=np.uint8)
+
+    def add(self, value: Any) -> None:
+        """Add a single value."""
+        self.update([value])
+
+    def update(self, values: Union[Iterable[Any], np.ndarray, pd.Series]) -> None:
+        """
+        Add an array of values.
+
+        Parameters
+        ----------
+
+        values: Union[Iterable[Any], np.ndarray, pd.Series]
+            The values to add.
+        """
+        positions = self._positions(hash_values(values)).ravel()
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+
+    def contains(self, value: Any) -> bool:
+        """Whether the value may have been added."""
+        return bool(self.contains_hashes(hash_values([value]))[0])
+
+    def __contains__(self, value: Any) -> bool:
+        return self.contains(value)
+
+    def contains_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Return whether each value may have been added, given the :py:func:`~dff_node_stats.sketches.hash_values`.
+
+        Parameters
+        ----------
+
+        hashes: np.ndarray
+            The 64-bit hashes of the values.
+        """
+        positions = self._positions(hashes)
+        found = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return found.all(axis=1)
+
+    def merge(self, other: "BloomFilter") -> "BloomFilter":
+        """
+        Add the values of another filter of the same size to this one. Returns this filter.
+
+        Parameters
+        ----------
+
+        other: :py:class:`~dff_node_stats.sketches.BloomFilter`
+            The filter to merge.
+        """
+        if other.size != self.size or other.hashes != self.hashes:
+            raise ValueError("Only filters with the same size and number of hashes can be merged")
+        np.bitwise_or(self.bits, other.bits, out=self.bits)
+        return self
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable representation of the filter."""
+        return {
+            "type": "bloom",
+            "size": self.size,
+            "hashes": self.hashes,
+            "bits": base64.b64encode(zlib.compress(self.bits.tobytes())).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BloomFilter":
+        """
+        Restore a filter from :py:meth:`~dff_node_stats.sketches.BloomFilter.to_dict`.
+
+        Parameters
+        ----------
+
+        data: dict
+            The serialized filter.
+        """
+        sketch = cls.__new__(cls)
+        sketch.size, sketch.hashes = data["size"], data["hashes"]
+        sketch.bits = np.frombuffer(zlib.decompress(base64.b64decode(data["bits"])), dtype=np.uint8).copy()
+        return sketch
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        """The bits of each hash, derived from its two halves (Kirsch and Mitzenmacher, 2006)."""
+        hashes = np.asarray(hashes, dtype=np.uint64)[:, None]
+        first, second = hashes & np.uint64(0xFFFFFFFF), (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.hashes, dtype=np.uint64)[None, :]
+        return (first + steps * second) % np.uint64(self.size)
+
+
+def hash_values(values: Union[Iterable[Any], np.ndarray, pd.Series]) -> np.ndarray:
+    """
+    Return the 64-bit hashes of the string representations of the values, as used by
+    :py:class:`~dff_node_stats.sketches.HyperLogLog`.
+
+    Parameters
+    ----------
+
+    values: Union[Iterable[Any], np.ndarray, pd.Series]
+        The values to hash.
+    """
+    values = np.asarray(values if isinstance(values, (np.ndarray, pd.Series)) else list(values), dtype=object)
+    return pd.util.hash_array(values.astype(str).astype(object), categorize=False)
+
+
+def _leading_zeros(values: np.ndarray) -> np.ndarray:
+    """The number of leading zero bits of each 64-bit value."""
+    values = values.copy()
+    zeros = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        small = values < np.uint64(1 << (64 - shift))
+        zeros[small] += shift
+        values[small] <<= np.uint64(shift)
+    zeros[values == 0] = 64
+    return zeros
+
+
+_SKETCH_TYPES = {"ddsketch": DDSketch, "hll": HyperLogLog, "spacesaving": SpaceSaving, "bloom": BloomFilter}
+
+
+class SketchSet:
+    """
+    | A set of sketches keyed by strings, e.g. by node or by edge name.
+    | Sets are merged key by key, which is how the batches saved by different processes
+    | or in different time buckets are combined.
+    | A set may hold :py:class:`~dff_node_stats.sketches.DDSketch`, :py:class:`~dff_node_stats.sketches.HyperLogLog`
+    | and :py:class:`~dff_node_stats.sketches.SpaceSaving` sketches under different keys.
+
+    Parameters
+    ----------
+
+    sketches: Optional[Dict[str, Union[DDSketch, HyperLogLog, SpaceSaving]]]
+        The initial sketches.
+    relative_accuracy: float
+        The accuracy of the sketches created by :py:meth:`~dff_node_stats.sketches.SketchSet.update`.
+    factory: Optional[Callable[[str], Union[DDSketch, HyperLogLog, SpaceSaving]]]
+        Creates the sketch for a new key. Defaults to a :py:class:`~dff_node_stats.sketches.DDSketch`
+        with the `relative_accuracy`.
+    """
+
+    def __init__(
+        self,
+        sketches: Optional[Dict[str, Union[DDSketch, HyperLogLog, SpaceSaving]]] = None,
+        relative_accuracy: float = 0.01,
+        factory: Optional[Callable[[str], Union[DDSketch, HyperLogLog, SpaceSaving]]] = None,
+    ) -> None:
+        self.sketches: Dict[str, Union[DDSketch, HyperLogLog, SpaceSaving]] = dict(sketches or {})
+        self.relative_accuracy = relative_accuracy
+        self.factory = factory or (lambda key: DDSketch(self.relative_accuracy))
+
+    def __len__(self) -> int:
+        return len(self.sketches)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.sketches)
+
+    def __getitem__(self, key: str) -> Union[DDSketch, HyperLogLog, SpaceSaving]:
+        return self.sketches[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.sketches
+
+    def items(self):
+        return self.sketches.items()
+
+    def add(self, key: str, value: Any) -> None:
+        """
+        Add a single value to the sketch of the `key`, creating it if needed.
+
+        Parameters
+        ----------
+
+        key: str
+            The sketch key.
+        value: Any
+            The value to add.
+        """
+        if key not in self.sketches:
+            self.sketches[key] = self.factory(key)
+        self.sketches[key].add(value)
+
+    def update(self, key: str, values: Union[Iterable[Any], np.ndarray]) -> None:
+        """
+        Add the values to the sketch of the `key`, creating it if needed.
+
+        Parameters
+        ----------
+
+        key: str
+            The sketch key.
+        values: Union[Iterable[Any], np.ndarray]
+            The values to add.
+        """
+        if key not in self.sketches:
+            self.sketches[key] = self.factory(key)
+        self.sketches[key].update(values)
+
+    def merge(self, other: "SketchSet") -> "SketchSet":
+        """
+        Merge the sketches of another set into this one, key by key. Returns this set.
+
+        Parameters
+        ----------
+
+        other: :py:class:`~dff_node_stats.sketches.SketchSet`
+            The set to merge.
+        """
+        for key, sketch in other.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = type(sketch).from_dict(sketch.to_dict())
+        return self
+
+    def merged(self, keys: Optional[Iterable[str]] = None) -> Union[DDSketch, HyperLogLog, SpaceSaving]:
+        """
+        Return a single sketch with the values of all the sketches, or of the given `keys` only.
+        The sketches should be of the same type.
+
+        Parameters
+        ----------
+
+        keys: Optional[Iterable[str]]
+            The keys to merge. Defaults to all keys.
+        """
+        sketches = [self.sketches[key] for key in (self.sketches if keys is None else keys) if key in self.sketches]
+        if not sketches:
+            return self.factory("")
+        result = type(sketches[0]).from_dict(sketches[0].to_dict())
+        for sketch in sketches[1:]:
+            result.merge(sketch)
+        return result
+
+    def prefixed(self, prefix: str) -> "SketchSet":
+        """
+        Return the sketches whose keys start with the `prefix`, keyed by the rest of the key.
+
+        Parameters
+        ----------
+
+        prefix: str
+            The key prefix, e.g. "contexts/node/".
+        """
+        sketches = {key[len(prefix) :]: sketch for key, sketch in self.items() if key.startswith(prefix)}
+        return SketchSet(sketches, self.relative_accuracy, self.factory)
+
+    def quantiles(self, qs: Iterable[float] = (0.5, 0.95, 0.99)) -> pd.DataFrame:
+        """
+        Return a dataframe indexed by the keys, with the count and the approximate quantiles
+        of each :py:class:`~dff_node_stats.sketches.DDSketch`.
+
+        Parameters
+        ----------
+
+        qs: Iterable[float]
+            The quantiles, between 0 and 1.
+        """
+        qs = list(qs)
+        sketches = {key: sketch for key, sketch in self.items() if isinstance(sketch, DDSketch)}
+        columns = ["count"] + [f"p{q * 100:g}" for q in qs]
+        rows = [[sketch.count] + sketch.quantiles(qs).tolist() for sketch in sketches.values()]
+        result = pd.DataFrame(rows, index=pd.Index(list(sketches), dtype=object), columns=columns)
+        return result.astype({"count": np.int64})
+
+    def distinct_counts(self) -> pd.Series:
+        """The approximate number of distinct values of each :py:class:`~dff_node_stats.sketches.HyperLogLog`."""
+        counts = {key: sketch.count for key, sketch in self.items() if isinstance(sketch, HyperLogLog)}
+        return pd.Series(counts, index=pd.Index(list(counts), dtype=object), dtype=np.int64)
+
+    def to_records(self) -> List[Tuple[str, str]]:
+        """Return (key, JSON) pairs, the form in which the savers store the sketches."""
+        return [(key, json.dumps(sketch.to_dict())) for key, sketch in self.sketches.items()]
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, str]]) -> "SketchSet":
+        """
+        Restore a set from (key, JSON) pairs, merging the sketches with equal keys.
+
+        Parameters
+        ----------
+
+        records: Iterable[Tuple[str, str]]
+            Pairs returned by :py:meth:`~dff_node_stats.sketches.SketchSet.to_records`.
+        """
+        result = cls()
+        for key, payload in records:
+            data = json.loads(payload)
+            sketch = _SKETCH_TYPES[data["type"]].from_dict(data)
+            if isinstance(sketch, DDSketch):
+                result.relative_accuracy = sketch.relative_accuracy
+            if key in result.sketches:
+                result.sketches[key].merge(sketch)
+            else:
+                result.sketches[key] = sketch
+        return result
+
+
+def build_duration_sketches(
+    codes: np.ndarray, names: Iterable[str], durations: np.ndarray, relative_accuracy: float = 0.01
+) -> SketchSet:
+    """
+    | Build one :py:class:`~dff_node_stats.sketches.DDSketch` per group of `duration_time` values at once.
+    | The bins of all the groups are counted with a single sort.
+
+    Parameters
+    ----------
+
+    codes: np.ndarray
+        The group code of each value, -1 for the values to skip.
+    names: Iterable[str]
+        The group names, indexed by the codes.
+    durations: np.ndarray
+        The values.
+    relative_accuracy: float
+        The relative error guarantee of the sketches.
+    """
+    names = list(names)
+    sketches = group_duration_sketches(codes, len(names), durations, relative_accuracy)
+    return SketchSet({names[code]: sketch for code, sketch in sketches.items()}, relative_accuracy)
+
+
+def build_context_sketches(
+    codes: np.ndarray, names: Iterable[str], context_codes: np.ndarray, context_ids: Iterable[Any], precision: int = 12
+) -> SketchSet:
+    """
+    | Build one :py:class:`~dff_node_stats.sketches.HyperLogLog` of the contexts per group at once.
+    | Each distinct context is hashed once, and each distinct (group, context) pair is counted once.
+
+    Parameters
+    ----------
+
+    codes: np.ndarray
+        The group code of each row, -1 for the rows to skip.
+    names: Iterable[str]
+        The group names, indexed by the codes.
+    context_codes: np.ndarray
+        The context code of each row, e.g. returned by :py:func:`pandas.factorize`.
+    context_ids: Iterable[Any]
+        The `context_id` values, indexed by the context codes.
+    precision: int
+        The precision of the sketches.
+    """
+    names = list(names)
+    sketches = group_context_sketches(codes, len(names), context_codes, hash_values(context_ids), precision)
+    factory = lambda key: HyperLogLog(precision)
+    return SketchSet({names[code]: sketch for code, sketch in sketches.items()}, factory=factory)
+
+
+def group_duration_sketches(
+    codes: np.ndarray, n_groups: int, durations: np.ndarray, relative_accuracy: float = 0.01
+) -> Dict[int, DDSketch]:
+    """
+    Return a :py:class:`~dff_node_stats.sketches.DDSketch` of the `durations` of each non-empty group, keyed by the
+    group code. See :py:func:`~dff_node_stats.sketches.build_duration_sketches`.
+
+    """
+    template = DDSketch(relative_accuracy)
+    valid = (codes >= 0) & ~np.isnan(durations)
+    codes, durations = codes[valid], durations[valid]
+    positive = durations > template.min_value
+    keys = np.full(len(durations), np.iinfo(np.int64).min, dtype=np.int64)  # the zero bin sorts first
+    keys[positive] = template._keys(durations[positive])
+
+    order = np.lexsort((keys, codes))
+    codes, keys, durations = codes[order], keys[order], durations[order]
+    new_bin = np.ones(len(codes), dtype=bool)
+    new_bin[1:] = (codes[1:] != codes[:-1]) | (keys[1:] != keys[:-1])
+    bin_starts = np.flatnonzero(new_bin)
+    bin_codes, bin_keys = codes[bin_starts], keys[bin_starts]
+    bin_counts = np.diff(np.append(bin_starts, len(codes)))
+
+    result = {}
+    group_bounds = np.searchsorted(codes, np.arange(n_groups + 1), side="left")
+    bin_bounds = np.searchsorted(bin_codes, np.arange(n_groups + 1), side="left")
+    for code in np.flatnonzero(np.diff(group_bounds) > 0):
+        values = durations[group_bounds[code] : group_bounds[code + 1]]
+        sketch = DDSketch(relative_accuracy)
+        group_keys = bin_keys[bin_bounds[code] : bin_bounds[code + 1]]
+        group_counts = bin_counts[bin_bounds[code] : bin_bounds[code + 1]]
+        zero = group_keys == np.iinfo(np.int64).min
+        sketch._add_bins(group_keys[~zero], group_counts[~zero], int(group_counts[zero].sum()))
+        sketch.count, sketch.sum = len(values), float(values.sum())
+        sketch.min, sketch.max = float(values.min()), float(values.max())
+        result[int(code)] = sketch
+    return result
+
+
+def group_context_sketches(
+    codes: np.ndarray, n_groups: int, context_codes: np.ndarray, context_hashes: np.ndarray, precision: int = 12
+) -> Dict[int, HyperLogLog]:
+    """
+    Return a :py:class:`~dff_node_stats.sketches.HyperLogLog` of the contexts of each non-empty group, keyed by the
+    group code. `context_hashes` are the :py:func:`~dff_node_stats.sketches.hash_values` of the contexts,
+    indexed by the context codes. See :py:func:`~dff_node_stats.sketches.build_context_sketches`.
+
+    """
+    valid = (codes >= 0) & (context_codes >= 0)
+    width = max(len(context_hashes), 1)
+    pairs = pd.unique(codes[valid].astype(np.int64) * width + context_codes[valid])
+    registers, ranks = HyperLogLog(precision)._registers_and_ranks(context_hashes[pairs % width])
+
+    # sort the (group, register, rank) triples as single integers and keep the highest rank of each register
+    triples = np.sort(((pairs // width) << precision | registers) << 6 | ranks)
+    last = np.ones(len(triples), dtype=bool)
+    last[:-1] = (triples[1:] >> 6) != (triples[:-1] >> 6)
+    triples = triples[last]
+    pair_codes, registers, ranks = triples >> (6 + precision), (triples >> 6) & ((1 << precision) - 1), triples & 63
+
+    result = {}
+    bounds = np.searchsorted(pair_codes, np.arange(n_groups + 1), side="left")
+    for code in np.flatnonzero(np.diff(bounds) > 0):
+        sketch = HyperLogLog(precision)
+        sketch.registers[registers[bounds[code] : bounds[code + 1]]] = ranks[bounds[code] : bounds[code + 1]]
+        result[int(code)] = sketch
+    return result
+
+
+@requires_columns(["duration_time"])
+@cached_transform
+def get_duration_sketch(df: pd.DataFrame) -> DDSketch:
+    """
+    | Transform function that returns a single duration sketch of all the turns.
+    | The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    """
+    sketch = DDSketch()
+    sketch.update(df["duration_time"].to_numpy(dtype=np.float64))
+    return sketch
+
+
+@requires_columns(["context_id", "flow_label", "node_label", "duration_time"])
+@cached_transform
+def get_node_duration_sketches(df: pd.DataFrame) -> SketchSet:
+    """
+    | Transform function that returns a duration sketch for each node, keyed by "flow_label:node_label".
+    | The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    """
+    transitions = get_transitions(df)
+    return build_duration_sketches(transitions.node_codes, transitions.nodes, transitions.durations)
+
+
+@requires_columns(["context_id", "flow_label", "node_label", "duration_time"])
+@cached_transform
+def get_edge_duration_sketches(df: pd.DataFrame) -> SketchSet:
+    """
+    | Transform function that returns a duration sketch for each transition, keyed by "src->dst".
+    | The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    """
+    transitions = get_transitions(df)
+    codes, names = transitions.edge_codes()
+    return build_duration_sketches(codes, names, transitions.durations)
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+@cached_transform
+def get_node_context_sketches(df: pd.DataFrame) -> SketchSet:
+    """
+    | Transform function that returns a sketch of the distinct contexts for each node, keyed by "flow_label:node_label".
+    | The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    """
+    transitions = get_transitions(df)
+    context_codes, context_ids = pd.factorize(df["context_id"])
+    return build_context_sketches(transitions.node_codes, transitions.nodes, context_codes, context_ids)
+
+
+@requires_columns(["context_id", "flow_label"])
+@cached_transform
+def get_flow_context_sketches(df: pd.DataFrame) -> SketchSet:
+    """
+    | Transform function that returns a sketch of the distinct contexts for each flow, keyed by `flow_label`.
+    | The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    """
+    flow_codes, flows = pd.factorize(df["flow_label"])
+    context_codes, context_ids = pd.factorize(df["context_id"])
+    return build_context_sketches(flow_codes, flows, context_codes, context_ids)
+
+
+EXACT_LIMIT = 100000
+"""
+:py:func:`~dff_node_stats.sketches.count_contexts` counts the contexts exactly for dataframes up to this many rows.
+
+"""
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+def count_contexts(df: pd.DataFrame, by: str = "node", exact: Optional[bool] = None) -> pd.Series:
+    """
+    | Return the number of distinct contexts (unique dialogs) of each node or flow.
+    | The approximate counts are merged from the cached :py:class:`~dff_node_stats.sketches.HyperLogLog` sketches,
+    | with a relative standard error of 1.6%.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe.
+    by: str
+        "node" or "flow".
+    exact: Optional[bool]
+        Whether to count the contexts exactly. By default, the counts are exact for dataframes
+        of up to :py:data:`~dff_node_stats.sketches.EXACT_LIMIT` rows.
+    """
+    if by not in ("node", "flow"):
+        raise DffStatsException(f"Contexts can be counted by node or by flow, got {by}")
+    if exact is None:
+        exact = len(df) <= EXACT_LIMIT
+    if not exact:
+        sketches = get_node_context_sketches(df) if by == "node" else get_flow_context_sketches(df)
+        return sketches.distinct_counts()
+    if by == "node":
+        transitions = get_transitions(df)
+        codes, names = transitions.node_codes, transitions.nodes
+    else:
+        codes, names = pd.factorize(df["flow_label"])
+    context_codes, context_ids = pd.factorize(df["context_id"])
+    valid = (codes >= 0) & (context_codes >= 0)
+    width = max(len(context_ids), 1)
+    pairs = pd.unique(codes[valid].astype(np.int64) * width + context_codes[valid])
+    counts = np.bincount(pairs // width, minlength=len(names))
+    return pd.Series(counts, index=pd.Index(np.asarray(names, dtype=object))).loc[counts > 0]
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+def heavy_hitters(df: pd.DataFrame, by: str = "edge", k: int = 20, capacity: Optional[int] = None) -> SpaceSaving:
+    """
+    | Return a :py:class:`~dff_node_stats.sketches.SpaceSaving` summary of the transitions or the nodes,
+    | keyed by "src->dst" or by node name, with the `k` most frequent ones among its values.
+    | The turns are summarized in batches, so the memory does not depend on the number of distinct
+    | transitions. Use :py:meth:`~dff_node_stats.sketches.SpaceSaving.top` to get the counts.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe.
+    by: str
+        "edge" or "node".
+    k: int
+        The number of values to report.
+    capacity: Optional[int]
+        The capacity of the summary, ten times `k` by default.
+    """
+    if by not in ("edge", "node"):
+        raise DffStatsException(f"Top values can be tracked by edge or by node, got {by}")
+    transitions = get_transitions(df)
+    n_nodes = max(len(transitions.nodes), 1)
+    if by == "edge":
+        src, dst = transitions.edges()
+        keys = src * n_nodes + dst
+    else:
+        keys = transitions.node_codes[transitions.node_codes >= 0]
+    summary = SpaceSaving(capacity or 10 * k)
+    for start in range(0, len(keys), 1 << 16):
+        summary.update(keys[start : start + (1 << 16)])
+    codes = summary.counts.index.to_numpy(dtype=np.int64)
+    nodes = np.asarray(transitions.nodes, dtype=object)
+    names = nodes[codes // n_nodes] + "->" + nodes[codes % n_nodes] if by == "edge" else nodes[codes]
+    summary.counts.index = summary.errors.index = pd.Index(names, dtype=object)
+    return summary
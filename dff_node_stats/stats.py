@@ -12,10 +12,35 @@ Example::
 
     stats.update_actor_handlers(actor, auto_save=False)
 
+| The collected data is available through the :py:attr:`~dff_node_stats.stats.Stats.dataframe` property.
+| A long-lived process can call :py:meth:`~dff_node_stats.stats.Stats.refresh` to pick up the rows
+| saved since the last load without reloading the whole storage.
+| With `sketches=True`, mergeable sketches of the collected turns are kept for each time bucket
+| of :py:data:`~dff_node_stats.stats.SKETCH_BUCKET` and saved from time to time,
+| see :py:meth:`~dff_node_stats.stats.Stats.load_sketches`:
+
+#. "duration/node/{flow_label}:{node_label}" and "duration/edge/{src}->{dst}":
+   a :py:class:`~dff_node_stats.sketches.DDSketch` of `duration_time`, that of the target turn for the transitions.
+#. "contexts/node/{flow_label}:{node_label}", "contexts/flow/{flow_label}" and "contexts/all":
+   a :py:class:`~dff_node_stats.sketches.HyperLogLog` of the contexts.
+#. "top/nodes" and "top/edges": a :py:class:`~dff_node_stats.sketches.SpaceSaving` summary
+   of the most frequent nodes and transitions ("src->dst").
+
+Example::
+
+    stats.load_sketches(since=yesterday, until=today).prefixed("contexts/node/").distinct_counts()
+    stats.load_sketches()["top/edges"].top(20)
+
+| A :py:class:`~dff_node_stats.live.LiveMetrics` instance passed as `live` is fed each collected turn,
+| for the metrics of the last minutes or hours.
+
 """
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import datetime
-from functools import cached_property
+import itertools
+import threading
+import time
+import uuid
 from copy import copy
 
 import pandas as pd
@@ -24,7 +49,34 @@ from df_engine.core import Context, Actor
 from df_engine.core.types import ActorStage
 
 from . import collectors as DSC
-from .savers import Saver
+from .frame import LazyFrame
+from .live import LiveMetrics
+from .savers import Saver, Watermark, LoadCache
+from .savers.saver import WATERMARK_KEY
+from .sketches import DDSketch, HyperLogLog, SketchSet, SpaceSaving
+
+SKETCH_BUCKET = datetime.timedelta(minutes=1)
+"""
+The time bucket of the sketches saved by :py:class:`~dff_node_stats.stats.Stats`.
+A process keeps one set of sketches per bucket and saves it again, replacing the previous save, as the bucket fills,
+so the savers hold one record per key, bucket and process.
+
+"""
+
+SKETCH_BUFFER_ROWS = 10000
+"""
+The number of collected turns that :py:class:`~dff_node_stats.stats.Stats` buffers before adding them to the sketches.
+The turns are added in one batch, off the turn handler, when the sketches are saved or the buffer is full.
+
+"""
+
+OPEN_CONTEXTS = 100000
+"""
+The number of recently active contexts whose last node :py:class:`~dff_node_stats.stats.Stats` keeps
+to find the transitions for the "top/edges" sketch. A context that has been idle for longer
+loses the transition of its next turn.
+
+"""
 
 
 class Stats:
@@ -41,6 +93,26 @@ class Stats:
         Instances of the :py:class:`~dff_node_stats.collectors.Collector` class.
         Their method :py:meth:`~dff_node_stats.collectors.Collector.collect_stats`
         is invoked each turn of the :py:class:`~df_engine.core.actor.Actor` to save the desired information.
+    cache: Optional[:py:class:`~dff_node_stats.savers.cache.LoadCache`]
+        An optional on-disk cache. If the saved data has not changed since the previous run,
+        :py:attr:`~dff_node_stats.stats.Stats.dataframe` is read from the cache instead of the saver.
+    sketches: bool
+        Whether to keep the duration and the context sketches of the nodes while collecting the stats.
+        They are saved by :py:meth:`~dff_node_stats.stats.Stats.save` every `sketch_interval` seconds,
+        when a time bucket ends or when :py:data:`~dff_node_stats.stats.SKETCH_BUFFER_ROWS` turns are buffered,
+        and by :py:meth:`~dff_node_stats.stats.Stats.flush_sketches`.
+    sketch_interval: float
+        The number of seconds between two saves of the sketches of the current time bucket.
+    sketch_accuracy: float
+        The relative error guarantee of the duration sketches.
+    top_capacity: int
+        The number of nodes and transitions monitored by the "top/" sketches.
+        A count is overestimated by at most the number of turns divided by the capacity.
+    live: Optional[:py:class:`~dff_node_stats.live.LiveMetrics`]
+        The sliding-window metrics to update with each collected turn.
+
+    | To find the transitions, the last node of each context is kept in memory
+    | for the :py:data:`~dff_node_stats.stats.OPEN_CONTEXTS` most recently active contexts.
 
     """
 
@@ -48,6 +120,12 @@ class Stats:
         self,
         saver: Saver,
         collectors: Optional[List[DSC.Collector]] = None,
+        cache: Optional[LoadCache] = None,
+        sketches: bool = False,
+        sketch_interval: float = 10.0,
+        sketch_accuracy: float = 0.01,
+        top_capacity: int = 1000,
+        live: Optional[LiveMetrics] = None,
     ) -> None:
         col_default = [DSC.DefaultCollector()]
         collectors = col_default if collectors is None else col_default + collectors
@@ -61,25 +139,192 @@ class Stats:
             parse_dates.extend(collector.parse_dates)
 
         self.saver: Saver = saver
+        self.cache: Optional[LoadCache] = cache
         self.collectors: List[DSC.Collector] = collectors
         self.column_dtypes: Dict[str, str] = column_dtypes
         self.parse_dates: List[str] = parse_dates
         self.dfs: list = []
         self.start_time: Optional[datetime.datetime] = None
+        self.watermark: Optional[Watermark] = None
+        self.version: int = 0
+        self.sketch_accuracy: float = sketch_accuracy
+        self.top_capacity: int = top_capacity
+        self.live: Optional[LiveMetrics] = live
+        self._last_nodes: Dict[str, str] = {}
+        self.sketches: Optional[SketchSet] = self._new_sketches() if sketches else None
+        self.sketch_interval: float = sketch_interval
+        self._sketch_bucket: datetime.datetime = _bucket(datetime.datetime.now())
+        self._sketch_frames: List[pd.DataFrame] = []
+        self._sketch_rows: int = 0
+        self._closed_sketches: List[Tuple[datetime.datetime, SketchSet]] = []
+        self._sketches_saved: float = time.monotonic()
+        self._writer: str = uuid.uuid4().hex
+        self._dataframe: Optional[pd.DataFrame] = None
+        self._lock = threading.Lock()
 
     def __deepcopy__(self, *args, **kwargs):
         return copy(self)
 
-    @cached_property
+    @property
     def dataframe(self) -> pd.DataFrame:
-        return self.saver.load(column_types=self.column_dtypes, parse_dates=self.parse_dates)
+        """
+        The stats loaded from the saver. The data is loaded on first access and cached afterwards.
+        Use :py:meth:`~dff_node_stats.stats.Stats.refresh` to update it.
+        """
+        if self._dataframe is None:
+            self.refresh()
+        return self._dataframe
+
+    def refresh(self) -> pd.DataFrame:
+        """
+        Load the rows that were saved after the last load and append them to the cached dataframe.
+        If the storage has been rewritten since then, the whole dataframe is reloaded.
+        :py:attr:`~dff_node_stats.stats.Stats.version` is increased each time the dataframe changes.
+
+        Returns the newly loaded rows.
+        """
+        with self._lock:
+            if self._dataframe is None and self.cache is not None:
+                cached = self.cache.get(self.saver, self.column_dtypes, self.parse_dates)
+                if cached is not None:
+                    self._dataframe, self.watermark = cached
+                    self.version += 1
+                    return self._dataframe
+
+            delta, watermark = self.saver.load_since(
+                self.watermark, column_types=self.column_dtypes, parse_dates=self.parse_dates
+            )
+            if self._dataframe is None or watermark.start == 0:
+                self._dataframe = delta
+                self.version += 1
+                if self.cache is not None:
+                    self.cache.put(self.saver, delta, watermark, self.column_dtypes, self.parse_dates)
+            elif len(delta) > 0:
+                # the delta may have appended categories: extend those of the cached columns, whose codes stay valid
+                cached = self._dataframe
+                for col, dtype in delta.dtypes.items():
+                    if isinstance(dtype, pd.CategoricalDtype) and col in cached and cached[col].dtype != dtype:
+                        cached = cached.assign(**{col: cached[col].cat.set_categories(dtype.categories)})
+                self._dataframe = pd.concat([cached, delta], ignore_index=True)
+                self.version += 1
+            self.watermark = watermark
+        return delta
+
+    def lazy_dataframe(self) -> LazyFrame:
+        """
+        Return a :py:class:`~dff_node_stats.frame.LazyFrame` that loads the columns from the saver on demand.
+        Unlike :py:attr:`~dff_node_stats.stats.Stats.dataframe`, it does not load the columns that are never accessed.
+        """
+        return LazyFrame(self.saver, self.column_dtypes, self.parse_dates, key=WATERMARK_KEY)
+
+    def load_sketches(
+        self, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None
+    ) -> SketchSet:
+        """
+        Load the sketches saved by all the processes sharing the saver and merge them into one sketch per key.
+        The turns collected since the last save of the sketches are not included,
+        see :py:meth:`~dff_node_stats.stats.Stats.flush_sketches`.
+
+        Parameters
+        ----------
+
+        since: Optional[datetime.datetime]
+            If set, only the batches saved at or after this time are merged.
+        until: Optional[datetime.datetime]
+            If set, only the batches saved before this time are merged.
+        """
+        return self.saver.load_sketches(since, until)
 
     def add_df(self, stats: Dict[str, Any]) -> None:
         self.dfs += [pd.DataFrame(stats)]
+        if self.live is not None and {"flow_label", "node_label", "duration_time"} <= stats.keys():
+            for flow_label, node_label, duration in zip(
+                stats["flow_label"], stats["node_label"], stats["duration_time"]
+            ):
+                self.live.add(flow_label, node_label, duration)
+        if self.sketches is not None and {"context_id", "flow_label", "node_label", "duration_time"} <= stats.keys():
+            bucket = _bucket(datetime.datetime.now())
+            if bucket != self._sketch_bucket:  # the buffered turns belong to the bucket that has ended
+                self._update_sketches()
+                self._closed_sketches.append((self._sketch_bucket, self.sketches))
+                self.sketches, self._sketch_bucket = self._new_sketches(), bucket
+            self._sketch_frames.append(self.dfs[-1])
+            self._sketch_rows += len(self.dfs[-1])
+            if self._sketch_rows >= SKETCH_BUFFER_ROWS:
+                self._update_sketches()
 
     def save(self, *args, **kwargs):
         self.saver.save(self.dfs, column_types=self.column_dtypes, parse_dates=self.parse_dates)
         self.dfs.clear()
+        if self.sketches is None:
+            return
+        due = time.monotonic() - self._sketches_saved >= self.sketch_interval
+        if due or self._closed_sketches or self._sketch_rows >= SKETCH_BUFFER_ROWS:
+            self.flush_sketches()
+
+    def flush_sketches(self) -> None:
+        """
+        Add the buffered turns to the sketches and save the sketches of the current and the ended time buckets,
+        replacing those saved before for the same buckets.
+        A process should call it before exiting, so that the turns collected after the last save are not lost.
+        """
+        if self.sketches is None:
+            return
+        self._update_sketches()
+        for bucket, sketches in self._closed_sketches + [(self._sketch_bucket, self.sketches)]:
+            if len(sketches) > 0:
+                self.saver.save_sketches(sketches, bucket, self._writer)
+        self._closed_sketches.clear()
+        self._sketches_saved = time.monotonic()
+
+    def _update_sketches(self) -> None:
+        """Add the buffered turns to the sketches, updating each sketch once with all the values of its key."""
+        if not self._sketch_frames:
+            return
+        df = pd.concat(self._sketch_frames, ignore_index=True)
+        self._sketch_frames.clear()
+        self._sketch_rows = 0
+        if len(df) == 0:
+            return
+        context_ids = df["context_id"].astype(object).astype(str)
+        flows = df["flow_label"].astype(object).astype(str)
+        nodes = (flows + ":" + df["node_label"].astype(object).astype(str)).astype(object)
+        durations = df["duration_time"]
+        for node, values in durations.groupby(nodes, sort=False):
+            self.sketches.update(f"duration/node/{node}", values)
+        for node, values in context_ids.groupby(nodes, sort=False):
+            self.sketches.update(f"contexts/node/{node}", values)
+        for flow_label, values in context_ids.groupby(flows, sort=False):
+            self.sketches.update(f"contexts/flow/{flow_label}", values)
+        self.sketches.update("contexts/all", context_ids)
+        self.sketches.update("top/nodes", nodes)
+
+        # the first turn of a context in the batch follows the last node it reached in an earlier batch
+        prev_nodes = nodes.groupby(context_ids, sort=False).shift(1)
+        prev_nodes = prev_nodes.fillna(context_ids.map(self._last_nodes)).astype(object)
+        known = prev_nodes.notna()
+        edges = prev_nodes[known] + "->" + nodes[known]
+        if len(edges):
+            self.sketches.update("top/edges", edges)
+        for edge, values in durations[known].groupby(edges, sort=False):
+            self.sketches.update(f"duration/edge/{edge}", values)
+
+        last = pd.DataFrame({"context_id": context_ids, "node": nodes}).drop_duplicates("context_id", keep="last")
+        for context_id, node in zip(last["context_id"], last["node"]):
+            self._last_nodes.pop(context_id, None)
+            self._last_nodes[context_id] = node  # the most recently active context goes last
+        for context_id in list(itertools.islice(self._last_nodes, max(0, len(self._last_nodes) - OPEN_CONTEXTS))):
+            del self._last_nodes[context_id]
+
+    def _new_sketches(self) -> SketchSet:
+        def factory(key: str):
+            if key.startswith("contexts/"):
+                return HyperLogLog()
+            if key.startswith("top/"):
+                return SpaceSaving(self.top_capacity)
+            return DDSketch(self.sketch_accuracy)
+
+        return SketchSet(relative_accuracy=self.sketch_accuracy, factory=factory)
 
     @validate_arguments
     def _update_handlers(self, actor: Actor, stage: ActorStage, handler) -> Actor:
@@ -103,3 +348,8 @@ class Stats:
         for collector in self.collectors:
             stats.update(collector.collect_stats(ctx, actor, start_time=self.start_time))
         self.add_df(stats=stats)
+
+
+def _bucket(moment: datetime.datetime) -> datetime.datetime:
+    """Return the start of the :py:data:`~dff_node_stats.stats.SKETCH_BUCKET` of a time."""
+    return datetime.datetime.min + (moment - datetime.datetime.min) // SKETCH_BUCKET * SKETCH_BUCKET
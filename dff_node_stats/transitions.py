@@ -0,0 +1,170 @@
+"""
+Transitions
+***********
+| This module computes node transitions once for both the API and the visualizers.
+| :py:func:`~dff_node_stats.transitions.get_transitions` encodes each turn as an integer node code
+| and pairs it with the node of the previous turn of the same context, with turns ordered by
+| `history_id` (or `start_time`) inside each context.
+| Counts, probabilities and durations of the transitions are derived from these arrays by
+| :py:class:`~dff_node_stats.transitions.Transitions`.
+
+"""
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.utils import cached_transform, requires_columns
+
+MIXED = "MIXED"
+"""
+The edge type of transitions between different flows.
+
+"""
+
+
+class Transitions(NamedTuple):
+    """
+    Integer-encoded transitions of a stats dataframe. All per-row arrays follow the row order of the dataframe.
+
+    Attributes:
+        flows: Flow labels, indexed by flow codes.
+
+        nodes: Node names ("flow_label:node_label"), indexed by node codes.
+
+        node_flows: The flow code of each node.
+
+        node_codes: The node code of each row, -1 if the labels are missing.
+
+        prev_codes: The node code of the previous turn in the same context, -1 for the first turn.
+
+        durations: The `duration_time` of each row, if it was collected.
+
+    """
+
+    flows: np.ndarray
+    nodes: np.ndarray
+    node_flows: np.ndarray
+    node_codes: np.ndarray
+    prev_codes: np.ndarray
+    durations: Optional[np.ndarray] = None
+
+    @property
+    def has_edge(self) -> np.ndarray:
+        """Boolean mask of the rows that complete a transition."""
+        return (self.prev_codes >= 0) & (self.node_codes >= 0)
+
+    def edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Source and destination node codes of all transitions."""
+        mask = self.has_edge
+        return self.prev_codes[mask], self.node_codes[mask]
+
+    def edge_codes(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the edge code of each row (-1 for rows without a transition)
+        and the "src->dst" names of the edges indexed by these codes.
+        """
+        mask = self.has_edge
+        codes = np.full(len(mask), -1, dtype=np.int64)
+        codes[mask], edges = pd.factorize(self.prev_codes[mask] * len(self.nodes) + self.node_codes[mask])
+        return codes, self._edge_names(edges // len(self.nodes), edges % len(self.nodes))
+
+    def edge_type_codes(self) -> np.ndarray:
+        """
+        Return the edge type of each row as an index into `flows` extended with
+        :py:const:`~dff_node_stats.transitions.MIXED` (-1 for rows without a transition).
+        """
+        mask = self.has_edge
+        src_flows, dst_flows = self.node_flows[self.prev_codes[mask]], self.node_flows[self.node_codes[mask]]
+        codes = np.full(len(mask), -1, dtype=np.int64)
+        codes[mask] = np.where(src_flows == dst_flows, dst_flows, len(self.flows))
+        return codes
+
+    def node_counts(self) -> pd.Series:
+        """The number of turns that reached each node."""
+        counts = np.bincount(self.node_codes[self.node_codes >= 0], minlength=len(self.nodes))
+        return pd.Series(counts, index=self.nodes).sort_values(ascending=False, kind="stable")
+
+    def counts(self) -> pd.Series:
+        """The number of times each transition occurred, indexed by "src->dst"."""
+        src, dst, counts = self._edge_counts()
+        return pd.Series(counts, index=self._edge_names(src, dst)).sort_values(ascending=False, kind="stable")
+
+    def probabilities(self) -> pd.Series:
+        """The probability of each transition given its source node, indexed by "src->dst"."""
+        src, dst, counts = self._edge_counts()
+        outgoing = np.bincount(src, weights=counts, minlength=len(self.nodes))
+        probs = pd.Series(counts / outgoing[src], index=self._edge_names(src, dst))
+        return probs.sort_values(ascending=False, kind="stable")
+
+    def mean_durations(self) -> pd.Series:
+        """The mean `duration_time` of the turns completing each transition, indexed by "src->dst"."""
+        if self.durations is None:
+            raise KeyError("duration_time")
+        codes, names = self.edge_codes()
+        mask = codes >= 0
+        sums = np.bincount(codes[mask], weights=self.durations[mask], minlength=len(names))
+        counts = np.bincount(codes[mask], minlength=len(names))
+        return pd.Series(sums / np.maximum(counts, 1), index=names)
+
+    def _edge_counts(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        src, dst = self.edges()
+        edges, counts = np.unique(src * len(self.nodes) + dst, return_counts=True)
+        return edges // len(self.nodes), edges % len(self.nodes), counts
+
+    def _edge_names(self, src: np.ndarray, dst: np.ndarray) -> pd.Index:
+        return pd.Index(self.nodes[src] + "->" + self.nodes[dst], dtype=object)
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+@cached_transform
+def get_transitions(df: pd.DataFrame) -> Transitions:
+    """
+    Encode the transitions of the stats dataframe.
+    The result is cached in :py:data:`~dff_node_stats.utils.transform_cache` for each dataframe.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The stats dataframe. `history_id`, `start_time` and `duration_time` are used if present.
+    """
+    flow_codes, flows = pd.factorize(df["flow_label"])
+    label_codes, labels = pd.factorize(df["node_label"])
+    flows, labels = np.asarray(flows, dtype=object), np.asarray(labels, dtype=object)
+
+    # a node is a (flow, label) pair: encode it as a single integer and factorize the pairs
+    has_node = (flow_codes >= 0) & (label_codes >= 0)
+    pair_ids = flow_codes.astype(np.int64) * len(labels) + label_codes
+    node_codes = np.full(len(df), -1, dtype=np.int64)
+    node_codes[has_node], pairs = pd.factorize(pair_ids[has_node])
+    node_flows, node_labels = pairs // len(labels), pairs % len(labels)
+    nodes = [f"{flows[flow]}:{labels[label]}" for flow, label in zip(node_flows, node_labels)]
+
+    # previous node of the same context, computed over the turns sorted by context and turn order
+    context_codes, _ = pd.factorize(df["context_id"])
+    order = turn_order(df, context_codes)
+    prev_sorted = np.roll(node_codes[order], 1)
+    context_sorted = context_codes[order]
+    first_turn = np.ones(len(df), dtype=bool)
+    first_turn[1:] = context_sorted[1:] != context_sorted[:-1]
+    prev_sorted[first_turn] = -1
+    prev_codes = np.empty_like(node_codes)
+    prev_codes[order] = prev_sorted
+
+    durations = df["duration_time"].to_numpy(dtype=np.float64) if "duration_time" in df.columns else None
+    return Transitions(flows, np.asarray(nodes, dtype=object), node_flows, node_codes, prev_codes, durations)
+
+
+def turn_order(df: pd.DataFrame, context_codes: np.ndarray) -> np.ndarray:
+    """
+    Return the positions of the rows sorted by context and then by `history_id` (or `start_time`).
+    Rows that cannot be told apart keep their original order.
+
+    """
+    turn_col = next((col for col in ("history_id", "start_time") if col in df.columns), None)
+    if turn_col is None:
+        return np.argsort(context_codes, kind="stable")
+    turns, _ = pd.factorize(df[turn_col], sort=True)  # dense ranks that fit into a single sort key
+    key = context_codes.astype(np.int64) * (turns.max(initial=0) + 1) + turns
+    return np.argsort(key, kind="stable")
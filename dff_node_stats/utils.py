@@ -5,13 +5,24 @@ Utilities for processing statistics inside the module.
 
 #. :py:const:`TransformType <dff_node_stats.utils.TransformType>` defines the signature that the user-created transform functions should comply with.
 #. py:const:`DffStatsException <dff_node_stats.utils.DffStatsException>` should be raised in module-specific error conditions.
+#. :py:class:`CategoryDictionary <dff_node_stats.utils.CategoryDictionary>` keeps the encoding of categorical columns.
+#. :py:data:`transform_cache <dff_node_stats.utils.transform_cache>` keeps the results of the transforms
+   decorated with :py:func:`cached_transform <dff_node_stats.utils.cached_transform>`.
 
 """
+from collections import OrderedDict
 from functools import partial, wraps
-from typing import List, Callable
+from typing import Any, Dict, Hashable, List, Callable, NamedTuple, Optional
+import itertools
+import sys
+import threading
+import weakref
 
+import numpy as np
 import pandas as pd
 
+from .frame import LazyFrame
+
 
 TransformType = Callable[[pd.DataFrame], pd.DataFrame]
 """
@@ -27,9 +38,234 @@ class DffStatsException(Exception):
     pass
 
 
-def transform_once(func: TransformType):
+class CategoryDictionary:
+    """
+    | Keeps the categories of each categorical column seen so far.
+    | Encoding all loaded batches with the same dictionary gives them identical categories,
+    | so that they can be concatenated without falling back to the `object` dtype.
+    | Categories are only appended, so the codes assigned earlier stay valid.
+    | Each saver keeps its own dictionary, which lives as long as the saver does: only the columns
+    | with a small number of distinct values, like the labels, should be declared as categories.
+
+    """
+
+    def __init__(self) -> None:
+        self._categories: Dict[str, pd.Index] = {}
+        self._lock = threading.Lock()
+
+    def categories(self, column: str) -> pd.Index:
+        """Return the categories known for the column."""
+        return self._categories.get(column, pd.Index([], dtype=object))
+
+    def encode(self, df: pd.DataFrame, column_types: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+        """
+        Convert the columns of the "category" type to categoricals that share the categories of the dictionary.
+        Returns a new dataframe, if any column has been converted.
+
+        Parameters
+        ----------
+
+        df: pd.DataFrame
+            The dataframe to convert.
+        column_types: Optional[Dict[str, str]]
+            String names and string pandas types of the columns.
+        """
+        columns = [col for col, _type in (column_types or {}).items() if _type == "category" and col in df.columns]
+        if not columns:
+            return df
+        df = df.copy(deep=False)
+        for col in columns:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values = series.cat.categories
+            else:
+                values = pd.Index(series.dropna().unique())
+            with self._lock:
+                known = self.categories(col)
+                new = values.difference(known)
+                if len(new) > 0:
+                    known = known.append(new)
+                    self._categories[col] = known
+            df[col] = series.astype(pd.CategoricalDtype(known))
+        return df
+
+
+class CacheInfo(NamedTuple):
+    """
+    Statistics of a :py:class:`~dff_node_stats.utils.TransformCache`.
+
+    Attributes:
+        hits: The number of lookups that returned a cached result.
+
+        misses: The number of lookups that had to compute the result.
+
+        evictions: The number of results dropped to stay within the memory limit.
+
+        entries: The number of cached results.
+
+        nbytes: The estimated memory used by the cached results.
+
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    nbytes: int
+
+
+class TransformCache:
+    """
+    | A thread-safe cache of transform results, keyed by the transform and the version of the input data.
+    | Each dataframe gets a version token the first time it is seen, which is never given to another one,
+    | even one reusing the memory of a collected dataframe.
+    | The dataframes passed to the transforms are treated as immutable.
+    | :py:meth:`~dff_node_stats.stats.Stats.refresh` produces a new dataframe when new rows arrive,
+    | so each derived frame is computed once per data version and shared by all plots and API routes.
+    | An entry is dropped as soon as its input dataframe is garbage collected,
+    | and least recently used entries are evicted when the results take more than `max_bytes`.
+    | The cached results are shared, so they should not be modified in place.
+
+    Parameters
+    ----------
+
+    max_bytes: int
+        The memory limit for the cached results. Defaults to 512 MiB.
+    """
+
+    def __init__(self, max_bytes: int = 512 << 20) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._computing: Dict[tuple, threading.Lock] = {}
+        self._versions: Dict[int, tuple] = {}
+        self._tokens = itertools.count()
+        self._lock = threading.RLock()
+        self._hits = self._misses = self._evictions = self._nbytes = 0
+
+    def get_or_compute(self, transform: Callable, df: pd.DataFrame, name: Optional[Hashable] = None) -> Any:
+        """
+        Return the cached result of `transform(df)`, computing it if necessary.
+        Concurrent callers with the same transform and data wait for a single computation.
+
+        Parameters
+        ----------
+
+        transform: Callable
+            The transform function.
+        df: pd.DataFrame
+            The dataframe to apply the transform to, or another object that supports weak references.
+        name: Optional[Hashable]
+            Identifies the transform in the cache instead of the function itself,
+            e.g. for the bound methods or closures that are created for each call.
+        """
+        key = (transform if name is None else name, self.version(df))
+        with self._lock:
+            result = self._lookup(key, df)
+            if result is not None:
+                return result
+            computing = self._computing.setdefault(key, threading.Lock())
+        with computing:
+            with self._lock:
+                result = self._lookup(key, df)
+                if result is not None:
+                    return result
+                self._misses += 1
+            try:
+                result = transform(df)
+                with self._lock:
+                    self._store(key, df, result)
+            finally:
+                with self._lock:
+                    self._computing.pop(key, None)
+        return result
+
+    def version(self, df: pd.DataFrame) -> int:
+        """
+        Return the version token of a dataframe, assigning a new one if it has not been seen.
+
+        Parameters
+        ----------
+
+        df: pd.DataFrame
+            The dataframe.
+        """
+        with self._lock:
+            entry = self._versions.get(id(df))
+            if entry is not None and entry[0]() is df:
+                return entry[1]
+            address, token = id(df), next(self._tokens)
+            reference = weakref.ref(df, lambda _: self._forget(address, token))
+            self._versions[address] = (reference, token)
+            return token
+
+    def info(self) -> CacheInfo:
+        """Return the hit, miss and eviction counters along with the current size of the cache."""
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions, len(self._entries), self._nbytes)
+
+    def clear(self) -> None:
+        """Drop all cached results."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def _lookup(self, key: tuple, df: pd.DataFrame) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0]() is not df:  # the id may belong to a collected dataframe
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry[1]
+
+    def _store(self, key: tuple, df: pd.DataFrame, result: Any) -> None:
+        self._discard(key)
+        nbytes = _nbytes(result)
+        reference = weakref.ref(df, lambda _: self._discard(key))
+        self._entries[key] = (reference, result, nbytes)
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _forget(self, address: int, token: int) -> None:
+        with self._lock:
+            entry = self._versions.get(address)
+            if entry is not None and entry[1] == token:
+                del self._versions[address]
+
+    def _discard(self, key: tuple) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._nbytes -= entry[2]
+
+
+def _nbytes(result: Any) -> int:
+    """Estimate the memory used by a transform result."""
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(index=True, deep=True).sum())
+    if isinstance(result, pd.Series):
+        return int(result.memory_usage(index=True, deep=True))
+    if isinstance(result, pd.Index):
+        return int(result.memory_usage(deep=True))
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, tuple):
+        return sum(_nbytes(item) for item in result)
+    return sys.getsizeof(result)
+
+
+transform_cache = TransformCache()
+"""
+The cache used by :py:func:`~dff_node_stats.utils.cached_transform`.
+
+"""
+
+
+def cached_transform(func: TransformType):
     """
-    Caches the transformations results by columns
+    Caches the transformation results in :py:data:`~dff_node_stats.utils.transform_cache`,
+    so that the transform is computed once per input dataframe.
 
     Parameters
     ----------
@@ -40,20 +276,23 @@ def transform_once(func: TransformType):
 
     @wraps(func)
     def wrapper(dataframe: pd.DataFrame):
-        cols_as_string = ".".join(dataframe.columns)
-        if cols_as_string != wrapper.columns:
-            new_df = func(dataframe)
-            wrapper.columns = ".".join(new_df.columns)
-            return new_df
-        return dataframe
-
-    wrapper.columns = ""
+        return transform_cache.get_or_compute(func, dataframe)
+
     return wrapper
 
 
+transform_once = cached_transform
+"""
+An alias of :py:func:`~dff_node_stats.utils.cached_transform`, kept for backward compatibility.
+
+"""
+
+
 def check_transform(transform: TransformType, exctype: type):
     """
     Applies a specified transform operation to the dataset before the decorated function is executed.
+    A :py:class:`~dff_node_stats.frame.LazyFrame` is materialized with the columns required
+    by both the transform and the decorated function.
 
     Parameters
     ----------
@@ -69,12 +308,15 @@ def check_transform(transform: TransformType, exctype: type):
         def wrapper(*args, **kwargs):
             if len(args) == 0 and len(kwargs) == 0:
                 raise exctype(f"No dataframe found.")
-            df = kwargs.get("df") or args[0]
+            df = kwargs["df"] if "df" in kwargs else args[0]
+            if isinstance(df, LazyFrame):
+                df = df.select([col for col in wrapper.required_columns if col in df.columns])
             if not isinstance(df, pd.DataFrame):
                 raise exctype(f"No dataframe found.")
             df = transform(df)
-            return func(df)
+            return func(df, *args[1:], **{key: value for key, value in kwargs.items() if key != "df"})
 
+        wrapper.required_columns = _merge_columns(transform, func)
         return wrapper
 
     return check_func
@@ -84,6 +326,7 @@ def check_columns(cols: List[str], exctype: type):
     """
     Raises an error, if the columns needed for a transformation
     or for making a plot are missing.
+    A :py:class:`~dff_node_stats.frame.LazyFrame` is materialized with the required columns only.
 
     Parameters
     ----------
@@ -99,7 +342,13 @@ def check_columns(cols: List[str], exctype: type):
         def wrapper(*args, **kwargs):
             if len(args) == 0 and len(kwargs) == 0:
                 raise exctype(f"No dataframe found.")
-            df = kwargs.get("df") or args[0]
+            df = kwargs["df"] if "df" in kwargs else args[0]
+            if isinstance(df, LazyFrame):
+                df = df.select([col for col in wrapper.required_columns if col in df.columns])
+                if "df" in kwargs:
+                    kwargs["df"] = df
+                else:
+                    args = (df,) + args[1:]
             if not isinstance(df, pd.DataFrame):
                 raise exctype(f"No dataframe found.")
             missing = [col for col in cols if col not in df.columns]
@@ -114,11 +363,20 @@ def check_columns(cols: List[str], exctype: type):
                 )
             return func(*args, **kwargs)
 
+        wrapper.required_columns = _merge_columns(cols, func)
         return wrapper
 
     return check_func
 
 
+def _merge_columns(*sources) -> List[str]:
+    """Collect the columns declared by the decorated functions or listed explicitly, preserving the order."""
+    columns = []
+    for source in sources:
+        columns += source if isinstance(source, list) else getattr(source, "required_columns", [])
+    return list(dict.fromkeys(columns))
+
+
 requires_transform = partial(check_transform, exctype=DffStatsException)
 
 requires_columns = partial(check_columns, exctype=DffStatsException)
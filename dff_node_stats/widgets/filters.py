@@ -0,0 +1,168 @@
+"""
+Filters
+---------------------------
+| The filter engine of the dashboards.
+| :py:class:`~dff_node_stats.widgets.filters.FilterIndex` groups the row positions of the dataframe
+| by the values of each filter column once, so that equality and range filters are answered
+| by a lookup in the sorted values instead of a comparison per row.
+| Filters without a `kind` fall back to calling their `comparison_func` on each value.
+
+"""
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from .widget import FilterType
+
+FILTER_KINDS = ["==", "<", "<=", ">", ">="]
+"""
+The kinds of :py:class:`~dff_node_stats.widgets.widget.FilterType` answered from the group index.
+The column value is on the left of the operator and the selected value on the right.
+
+"""
+
+SLICE_CACHE_SIZE = 16
+"""
+The number of filter states whose slices :py:meth:`~dff_node_stats.widgets.filters.FilterIndex.slice` keeps,
+so that going back to a filter state returns the same dataframe and reuses the transforms cached for it.
+
+"""
+
+
+class GroupIndex:
+    """
+    The row positions of a column grouped by value, with the values sorted when they can be.
+
+    Parameters
+    ----------
+
+    column: pd.Series
+        The column to index.
+    """
+
+    def __init__(self, column: pd.Series) -> None:
+        try:
+            codes, values = pd.factorize(column, sort=True)
+            self.ordered = True
+        except TypeError:  # values that cannot be compared to each other only support equality
+            codes, values = pd.factorize(column)
+            self.ordered = False
+        self.values: pd.Index = pd.Index(values)
+        valid = np.flatnonzero(codes >= 0)
+        # the positions of each value are contiguous in `order`, between two consecutive `bounds`
+        self.order: np.ndarray = valid[np.argsort(codes[valid], kind="stable")]
+        self.bounds: np.ndarray = np.searchsorted(codes[self.order], np.arange(len(self.values) + 1))
+
+    def positions(self, kind: str, value: Any) -> Optional[np.ndarray]:
+        """
+        Return the sorted positions of the rows matching the filter,
+        or `None` if the filter cannot be answered from the index.
+
+        Parameters
+        ----------
+
+        kind: str
+            One of :py:data:`~dff_node_stats.widgets.filters.FILTER_KINDS`.
+        value: Any
+            The selected value.
+        """
+        if kind == "==":
+            code = self.values.get_indexer([value])[0]
+            if code < 0:
+                return np.empty(0, dtype=np.intp)
+            return np.sort(self.order[self.bounds[code] : self.bounds[code + 1]])
+        if not self.ordered:
+            return None
+        try:
+            side = "left" if kind in ("<", ">=") else "right"
+            split = self.values.searchsorted(value, side=side)
+        except TypeError:
+            return None
+        below = kind in ("<", "<=")
+        start, stop = (0, split) if below else (split, len(self.values))
+        return np.sort(self.order[self.bounds[start] : self.bounds[stop]])
+
+
+class FilterIndex:
+    """
+    | Answers the filters of a dashboard on its original dataframe.
+    | The group index of a column is built the first time one of its filters is set.
+
+    Parameters
+    ----------
+
+    df: pd.DataFrame
+        The dataframe to filter.
+    filters: List[FilterType]
+        The filters of the dashboard.
+    """
+
+    def __init__(self, df: pd.DataFrame, filters: List["FilterType"]) -> None:
+        self.df = df
+        self.filters = filters
+        self._groups: Dict[str, GroupIndex] = {}
+        self._slices: OrderedDict = OrderedDict()
+
+    def group(self, colname: str) -> GroupIndex:
+        """
+        Return the group index of a column.
+
+        Parameters
+        ----------
+
+        colname: str
+            The name of the column.
+        """
+        if colname not in self._groups:
+            self._groups[colname] = GroupIndex(self.df[colname])
+        return self._groups[colname]
+
+    def positions(self, values: Sequence[Any]) -> Optional[np.ndarray]:
+        """
+        Return the sorted positions of the rows matching all the filters,
+        or `None` if every filter is set to its default value.
+
+        Parameters
+        ----------
+
+        values: Sequence[Any]
+            The selected value of each filter.
+        """
+        result: Optional[np.ndarray] = None
+        for _filter, value in zip(self.filters, values):
+            if value == _filter.default:
+                continue
+            positions = None
+            if _filter.kind is not None:
+                positions = self.group(_filter.colname).positions(_filter.kind, value)
+            if positions is None:
+                column = self.df[_filter.colname]
+                mask = np.fromiter((_filter.comparison_func(x, value) for x in column), dtype=bool, count=len(column))
+                positions = np.flatnonzero(mask)
+            result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+        return result
+
+    def slice(self, values: Sequence[Any]) -> pd.DataFrame:
+        """
+        Return the rows matching all the filters.
+        The whole dataframe is returned if no filter is set or no row matches them.
+
+        Parameters
+        ----------
+
+        values: Sequence[Any]
+            The selected value of each filter.
+        """
+        key = tuple(values)
+        if key in self._slices:
+            self._slices.move_to_end(key)
+            return self._slices[key]
+        positions = self.positions(values)
+        result = self.df if positions is None or len(positions) == 0 else self.df.iloc[positions]
+        self._slices[key] = result
+        if len(self._slices) > SLICE_CACHE_SIZE:
+            self._slices.popitem(last=False)
+        return result
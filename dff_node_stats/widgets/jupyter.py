@@ -5,12 +5,12 @@ Provides the Jupyter version of the :py:class:`~dff_node_stats.widgets.widget.Ab
 
 """
 from typing import List, Optional
-from functools import partial
 
 import plotly.graph_objects as go
 import pandas as pd
 from ipywidgets import widgets
 
+from dff_node_stats.sketches import SketchSet
 from . import visualizers as vs
 from .widget import AbstractDashboard, FilterType
 
@@ -27,9 +27,10 @@ class WidgetDashboard(AbstractDashboard, widgets.VBox):
         df: pd.DataFrame,
         plots: Optional[List[vs.VisualizerType]] = None,
         filters: Optional[List[FilterType]] = None,
+        sketches: Optional[SketchSet] = None,
     ) -> None:
         widgets.VBox.__init__(self)
-        AbstractDashboard.__init__(self, df, plots, filters)
+        AbstractDashboard.__init__(self, df, plots, filters, sketches)
         self._controls = self._construct_controls()
 
     @property
@@ -37,20 +38,7 @@ class WidgetDashboard(AbstractDashboard, widgets.VBox):
         return self._controls
 
     def _slice(self):
-        masks = []
-        for _filter, dropdown in zip(self._filters, self.controls.children):
-            val = dropdown.value
-            if val == _filter.default:
-                masks += [pd.Series(([True] * self._df_cache.shape[0]), copy=False)]
-            else:
-                func_to_apply = partial(_filter.comparison_func, y=val)
-                masks += [self._df_cache[_filter.colname].apply(func_to_apply)]
-        mask = masks[0]
-        for m in masks[1:]:
-            mask = mask & m
-        if mask.sum() == 0:
-            return
-        self._df = self._df_cache.loc[mask]
+        self._df = self._index.slice([dropdown.value for dropdown in self.controls.children])
 
     def _construct_controls(self):
         def handleChange(change):
@@ -78,12 +66,7 @@ class WidgetDashboard(AbstractDashboard, widgets.VBox):
 
     def plots(self):
         box = widgets.VBox()
-        plot_list = []
-        df = self._df.copy()
-        for plot_func in self._plots:
-            plot = plot_func(df)
-            plot_list += [go.FigureWidget(data=plot)]
-        box.children = plot_list
+        box.children = [go.FigureWidget(data=plot) for plot in self.figures()]
         return box
 
     def __call__(self):
@@ -5,11 +5,11 @@ Provides the Streamlit version of the :py:class:`~dff_node_stats.widgets.widget.
 
 """
 from typing import List, Optional
-from functools import partial
 
 import pandas as pd
 import streamlit as st
 
+from dff_node_stats.sketches import SketchSet
 from . import visualizers as vs
 from .widget import AbstractDashboard, FilterType
 
@@ -26,26 +26,14 @@ class StreamlitDashboard(AbstractDashboard):
         df: pd.DataFrame,
         plots: Optional[List[vs.VisualizerType]] = None,
         filters: Optional[List[FilterType]] = None,
+        sketches: Optional[SketchSet] = None,
     ) -> None:
-        super().__init__(df, plots, filters)
+        super().__init__(df, plots, filters, sketches)
         self._df: pd.DataFrame = self._slice(self._df_cache, *self.controls)
 
     @st.cache(allow_output_mutation=True)
     def _slice(self, df_origin: pd.DataFrame, *args):
-        masks = []
-        for _filter, dropdown in zip(self._filters, args):
-            val = dropdown
-            if val == _filter.default:
-                masks += [pd.Series(([True] * df_origin.shape[0]), copy=False)]
-            else:
-                func_to_apply = partial(_filter.comparison_func, y=val)
-                masks += [df_origin[_filter.colname].apply(func_to_apply)]
-        mask = masks[0]
-        for m in masks[1:]:
-            mask = mask & m
-        if mask.sum() == 0:
-            return df_origin
-        return df_origin.loc[mask]
+        return self._index.slice(args)
 
     @property
     def controls(self):
@@ -69,9 +57,7 @@ class StreamlitDashboard(AbstractDashboard):
         return tuple(filters)
 
     def plots(self):
-        df = self._df.copy()
-        for plot_func in self._plots:
-            plot = plot_func(df)
+        for plot in self.figures():
             st.plotly_chart(plot, use_container_width=True)
 
     def __call__(self):
@@ -4,21 +4,41 @@ Visualizers
 | This module implements visualizer functions and visualization utilities.
 | :py:const:`~dff_node_stats.widgets.visualizers.VisualizerType` is a prototype for both ready and custom visualizers.
 | Function :py:func:`~dff_node_stats.widgets.visualizers.colorize` is used to produce a color on each turn of an iterator.
+| Most built-in visualizers have a variant that draws the same plot from a :py:class:`~dff_node_stats.cube.SummaryCube`,
+| see :py:func:`~dff_node_stats.widgets.visualizers.cube_variant`.
+| Those of the sketch metrics also have a variant that draws them from the sketches persisted by
+| :py:class:`~dff_node_stats.stats.Stats`, see :py:func:`~dff_node_stats.widgets.visualizers.sketch_variant`.
 
 """
 import random
-from typing import Callable, Iterable
+from typing import Any, Callable, Dict, Iterable, List, Optional
 from base64 import b64encode
-from io import BytesIO
+from collections import OrderedDict
+import hashlib
+import json
+import threading
 
 import graphviz
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
+from plotly.subplots import make_subplots
 from plotly.colors import qualitative
 from plotly.basedatatypes import BaseFigure
 
-from dff_node_stats.utils import requires_transform, transform_once, requires_columns
+from dff_node_stats.cube import SummaryCube, get_summary_cube, pick_freq
+from dff_node_stats.rollups import rollup
+from dff_node_stats.sequences import get_sequences
+from dff_node_stats.sessions import get_sessions
+from dff_node_stats.sketches import (
+    DDSketch,
+    SketchSet,
+    count_contexts,
+    get_duration_sketch,
+    get_node_duration_sketches,
+)
+from dff_node_stats.transitions import MIXED, get_transitions
+from dff_node_stats.utils import DffStatsException, requires_transform, cached_transform, requires_columns
 
 
 VisualizerType = Callable[[pd.DataFrame], BaseFigure]
@@ -32,6 +52,85 @@ should be successfully visualized.
 
 """
 
+CubeVisualizerType = Callable[[SummaryCube], BaseFigure]
+"""
+The prototype for the variants of the visualizers that draw the plot
+from a :py:class:`~dff_node_stats.cube.SummaryCube`.
+
+"""
+
+
+def cube_variant(variant: CubeVisualizerType):
+    """
+    | Decorator that attaches a cube variant to a visualizer, as its `from_cube` attribute.
+    | The dashboards draw the plot from the summary cube of the dataframe with the variant,
+    | and call the visualizer itself if it has none.
+
+    Example::
+
+        def show_node_number_cube(cube: SummaryCube) -> BaseFigure:
+            return go.Figure(go.Indicator(value=len(cube.nodes)))
+
+        @cube_variant(show_node_number_cube)
+        def show_node_number(df: pd.DataFrame) -> BaseFigure:
+            return go.Figure(go.Indicator(value=len(df.groupby(["flow_label", "node_label"], observed=True))))
+
+    Parameters
+    ----------
+
+    variant: :py:const:`~dff_node_stats.widgets.visualizers.CubeVisualizerType`
+        Draws the same plot as the decorated visualizer from a summary cube.
+    """
+
+    def decorator(func: VisualizerType) -> VisualizerType:
+        func.from_cube = variant
+        return func
+
+    return decorator
+
+
+SketchVisualizerType = Callable[[SketchSet], BaseFigure]
+"""
+The prototype for the variants of the visualizers that draw the plot from the persisted sketches,
+see :py:meth:`~dff_node_stats.stats.Stats.load_sketches`.
+
+"""
+
+
+def sketch_variant(variant: SketchVisualizerType):
+    """
+    | Decorator that attaches a sketch variant to a visualizer, as its `from_sketches` attribute.
+    | The dashboards given the persisted sketches draw the plot from them with the variant
+    | while no filter is set, since the sketches cover all the data.
+
+    Parameters
+    ----------
+
+    variant: :py:const:`~dff_node_stats.widgets.visualizers.SketchVisualizerType`
+        Draws the same plot as the decorated visualizer from the persisted sketches.
+    """
+
+    def decorator(func: VisualizerType) -> VisualizerType:
+        func.from_sketches = variant
+        return func
+
+    return decorator
+
+
+def _sketch_part(sketches: SketchSet, prefix: str) -> SketchSet:
+    """Return the persisted sketches of a metric, raising an error if none was saved."""
+    part = sketches.prefixed(prefix)
+    if len(part) == 0:
+        raise DffStatsException(f"No sketches saved under {prefix}: create the Stats with sketches=True.")
+    return part
+
+
+def _cube_part(part, columns: List[str]):
+    """Return a part of a summary cube, raising the error of the dataframe visualizers if it was not built."""
+    if part is None:
+        raise DffStatsException(f"Required columns missing: {', '.join(columns)}.")
+    return part
+
 
 def generate_random_colors():
     """
@@ -81,13 +180,40 @@ def show_table(df: pd.DataFrame) -> BaseFigure:
     return fig
 
 
+def show_duration_time_cube(cube: SummaryCube) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_duration_time`.
+
+    """
+    return _duration_table(_cube_part(cube.duration, ["duration_time"]))
+
+
+def show_duration_time_sketches(sketches: SketchSet) -> BaseFigure:
+    """
+    The sketch variant of :py:func:`~dff_node_stats.widgets.visualizers.show_duration_time`.
+
+    """
+    return _duration_table(_sketch_part(sketches, "duration/node/").merged())
+
+
+@sketch_variant(show_duration_time_sketches)
+@cube_variant(show_duration_time_cube)
 @requires_columns(["duration_time"])
 def show_duration_time(df: pd.DataFrame) -> BaseFigure:
     """
-    Displays the node timings.
+    | Displays the node timings.
+    | The percentiles come from a :py:class:`~dff_node_stats.sketches.DDSketch` and are within 1% of the exact values.
 
     """
-    dt = df.describe().duration_time
+    return _duration_table(get_duration_sketch(df))
+
+
+def _duration_table(sketch: DDSketch) -> BaseFigure:
+    quantiles = [0.25, 0.5, 0.75, 0.95, 0.99]
+    dt = pd.Series(
+        [sketch.count, sketch.mean, sketch.min] + sketch.quantiles(quantiles).tolist() + [sketch.max],
+        index=["count", "mean", "min"] + [f"{q * 100:g}%" for q in quantiles] + ["max"],
+    )
     fig = go.Figure(
         data=go.Table(
             header=dict(values=list(dt.keys()), align="left"), cells=dict(values=list(dt.values), align="left")
@@ -97,6 +223,19 @@ def show_duration_time(df: pd.DataFrame) -> BaseFigure:
     return fig
 
 
+def show_node_counters_cube(cube: SummaryCube) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_node_counters`.
+
+    """
+    fig = go.Figure().update_layout(title="Node counters")
+    for color, flow_label in colorize(cube.nodes["flow_label"].unique()):
+        subset = cube.nodes[cube.nodes["flow_label"] == flow_label].sort_values("count", ascending=False, kind="stable")
+        fig.add_trace(go.Bar(x=subset["node_label"], y=subset["count"], name=flow_label, marker_color=color))
+    return fig
+
+
+@cube_variant(show_node_counters_cube)
 @requires_columns(["flow_label", "node_label"])
 def show_node_counters(df: pd.DataFrame) -> BaseFigure:
     """
@@ -104,31 +243,42 @@ def show_node_counters(df: pd.DataFrame) -> BaseFigure:
 
     """
     fig = go.Figure().update_layout(title="Node counters")
-    for color, flow_label in colorize(df["flow_label"].unique()):
-        subset = df.loc[df.flow_label == flow_label, "node_label"].value_counts()
+    counts = df.groupby(["flow_label", "node_label"], observed=True).size()
+    for color, flow_label in colorize(df["flow_label"].dropna().unique()):
+        subset = counts[flow_label].sort_values(ascending=False)
         fig.add_trace(go.Bar(x=subset.keys(), y=subset.values, name=flow_label, marker_color=color))
     return fig
 
 
-@requires_columns(["flow_label", "node_label"])
-@transform_once
-def get_nodes_and_edges(df: pd.DataFrame):
+@requires_columns(["context_id", "flow_label", "node_label"])
+@cached_transform
+def get_nodes_and_edges(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Transform function that adds info about nodes and edges to the dataframe
+    | Transform function that returns a copy of the dataframe with info about nodes and edges.
+    | The transitions are computed by :py:func:`~dff_node_stats.transitions.get_transitions`.
+    | Adds the following categorical columns:
+
+    #. `node`: "flow_label:node_label".
+    #. `prev_node`: the node of the previous turn in the same context.
+    #. `edge`: "prev_node->node". Missing for the first turn of a context.
+    #. `edge_type`: the flow label for transitions inside a flow, "MIXED" otherwise.
 
     """
-    for context_id in df.context_id.unique():
-        ctx_index = df.context_id == context_id
-        df.loc[ctx_index, "node"] = df.loc[ctx_index, "flow_label"] + ":" + df.loc[ctx_index, "node_label"]
-        df.loc[ctx_index, "edge"] = (
-            df.loc[ctx_index, "node"].shift(periods=1).combine(df.loc[ctx_index, "node"], lambda *x: list(x))
-        )
-        flow_label = df.loc[ctx_index, "flow_label"]
-        df.loc[ctx_index, "edge_type"] = flow_label.where(flow_label.shift(periods=1) == flow_label, "MIXED")
-    return df
+    transitions = get_transitions(df)
+    edge_codes, edges = transitions.edge_codes()
+
+    result = df.copy(deep=False)
+    result["node"] = pd.Categorical.from_codes(transitions.node_codes, categories=transitions.nodes)
+    result["prev_node"] = pd.Categorical.from_codes(transitions.prev_codes, categories=transitions.nodes)
+    result["edge"] = pd.Categorical.from_codes(edge_codes, categories=edges)
+    result["edge_type"] = pd.Categorical.from_codes(
+        transitions.edge_type_codes(), categories=list(transitions.flows) + [MIXED]
+    )
+    return result
 
 
 @requires_transform(get_nodes_and_edges)
+@requires_columns(["history_id"])
 def show_transition_trace(df: pd.DataFrame) -> BaseFigure:
     """
     Displays information about node traversal in the form of a heatmap.
@@ -141,51 +291,189 @@ def show_transition_trace(df: pd.DataFrame) -> BaseFigure:
     return fig
 
 
-@requires_transform(get_nodes_and_edges)
-def show_transition_graph(df: pd.DataFrame) -> BaseFigure:
+GRAPH_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+"""
+The output formats of :py:func:`~dff_node_stats.widgets.visualizers.show_transition_graph` and their media types.
+
+"""
+
+
+class GraphCache:
     """
-    Displays the graph of node traversal.
+    | Caches the drawings of the transition graphs, so that redrawing an unchanged graph does not run graphviz.
+    | The rendered images are keyed by a hash of the aggregated nodes and edges and the output format.
+    | The layouts are keyed by a hash of the nodes, flows and edges and of the number of digits of the node counts,
+    | which set the size of the node labels: when only the counts change and the labels keep their size,
+    | the graph is rendered at the positions of its last layout, which skips the layout step of `dot`.
 
+    Parameters
+    ----------
+
+    max_entries: int
+        The number of images and of layouts to keep.
     """
-    node_counter = df.node.value_counts()
-    edge_counter = df.edge.value_counts()
-    node2code = {key: f"n{index}" for index, key in enumerate(df.node.unique())}
 
-    graph = graphviz.Digraph()
-    graph.attr(compound="true")
+    def __init__(self, max_entries: int = 32) -> None:
+        self.max_entries = max_entries
+        self._renders: OrderedDict = OrderedDict()
+        self._layouts: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, nodes: pd.DataFrame, edges: pd.DataFrame, output_format: str = "png") -> bytes:
+        """
+        Return the image of the transition graph.
+
+        Parameters
+        ----------
+
+        nodes: pd.DataFrame
+            The nodes to draw, in the layout of :py:attr:`~dff_node_stats.cube.SummaryCube.nodes`.
+        edges: pd.DataFrame
+            The transitions to draw, in the layout of :py:attr:`~dff_node_stats.cube.SummaryCube.edges`.
+        output_format: str
+            One of :py:data:`~dff_node_stats.widgets.visualizers.GRAPH_FORMATS`.
+        """
+        if output_format not in GRAPH_FORMATS:
+            raise DffStatsException(f"Unknown graph format: {output_format}, expected one of {list(GRAPH_FORMATS)}")
+        nodes = nodes.reindex(columns=["flow_label", "node_label", "count", "start"]).fillna({"start": False})
+        edges = edges[["source", "target", "count"]]
+        sizes = nodes.assign(count=nodes["count"].astype(str).str.len())  # the width of the labels, not their text
+        structure = _hash_frames(sizes, edges.drop(columns="count"))
+        key = (_hash_frames(nodes, edges), output_format)
+        with self._lock:
+            if key in self._renders:
+                self._renders.move_to_end(key)
+                return self._renders[key]
+            layout = self._layouts.get(structure)
+
+        if layout is None:
+            layout = _read_layout(json.loads(_transition_digraph(nodes, edges).pipe(format="json")))
+        image = _transition_digraph(nodes, edges, layout).pipe(format=output_format, engine="neato", neato_no_op=2)
+        with self._lock:
+            self._store(self._layouts, structure, layout)
+            self._store(self._renders, key, image)
+        return image
+
+    def clear(self) -> None:
+        """Drop all the cached images and layouts."""
+        with self._lock:
+            self._renders.clear()
+            self._layouts.clear()
+
+    def _store(self, entries: OrderedDict, key: Any, value: Any) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+graph_cache = GraphCache()
+"""
+The cache used by :py:func:`~dff_node_stats.widgets.visualizers.show_transition_graph`.
+
+"""
+
 
-    for color, (i, flow_label) in colorize(enumerate(df["flow_label"].unique())):
-        with graph.subgraph(name=f"cluster{i}") as sub_graph:
-            sub_graph.attr(style="filled", color=color.lower())
-            sub_graph.attr(label=flow_label)
+def _hash_frames(*frames: pd.DataFrame) -> str:
+    digest = hashlib.sha1()
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        digest.update(str(list(frame.columns)).encode())
+    return digest.hexdigest()
+
+
+def _transition_digraph(nodes: pd.DataFrame, edges: pd.DataFrame, layout: Optional[Dict] = None) -> graphviz.Digraph:
+    """
+    Build the graph of the nodes and transitions, with one statement per node and per edge.
+    With a `layout`, the graph, clusters, nodes and edges get its positions, for `neato -n2`.
+    """
+    layout = layout or {}
+    node2code = {node: f"n{index}" for index, node in enumerate(nodes.index)}
+    graph = graphviz.Digraph()
+    graph.attr(compound="true", **layout.get("", {}))
 
+    for color, (i, flow_label) in colorize(enumerate(nodes["flow_label"].unique())):
+        name = f"cluster{i}"
+        with graph.subgraph(name=name) as sub_graph:
+            sub_graph.attr(style="filled", color=color.lower(), label=flow_label, **layout.get(name, {}))
             sub_graph.node_attr.update(style="filled", color="white")
+            flow_nodes = nodes[nodes["flow_label"] == flow_label]
+            for node, node_label, counter, start in zip(
+                flow_nodes.index, flow_nodes["node_label"], flow_nodes["count"], flow_nodes["start"]
+            ):
+                code = node2code[node]
+                shape = {"shape": "Mdiamond"} if start else {}
+                sub_graph.node(code, label=f"{node_label} ({counter=})", **shape, **layout.get(code, {}))
+
+    for in_node, out_node, counter in zip(edges["source"], edges["target"], edges["count"]):
+        codes = (node2code[in_node], node2code[out_node])
+        label = f"(probs={counter / nodes.at[in_node, 'count']:.2f})"
+        graph.edge(*codes, label=label, **layout.get(codes, {}))
+    return graph
+
+
+def _read_layout(data: Dict[str, Any]) -> Dict[Any, Dict[str, str]]:
+    """Read the positions of the graph, clusters, nodes and edges from the json output of graphviz."""
+    layout: Dict[Any, Dict[str, str]] = {"": {"bb": data["bb"]}}
+    names = {}
+    for obj in data.get("objects", []):
+        names[obj["_gvid"]] = obj["name"]
+        if obj["name"].startswith("cluster"):
+            layout[obj["name"]] = {key: obj[key] for key in ("bb", "lp") if key in obj}
+        elif "pos" in obj:
+            layout[obj["name"]] = {key: obj[key] for key in ("pos", "width", "height")}
+    for edge in data.get("edges", []):
+        layout[(names[edge["tail"]], names[edge["head"]])] = {key: edge[key] for key in ("pos", "lp") if key in edge}
+    return layout
+
+
+def show_transition_graph_cube(
+    cube: SummaryCube, top_k: Optional[int] = None, output_format: str = "png"
+) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_transition_graph`.
 
-            for _, (history_id, node, node_label) in df.loc[
-                df.flow_label == flow_label, ("history_id", "node", "node_label")
-            ].iterrows():
-                counter = node_counter[node]
-                label = f"{node_label} ({counter=})"
-                if history_id == -1:
-                    sub_graph.node(node2code[node], label=label, shape="Mdiamond")
-                else:
-                    sub_graph.node(node2code[node], label=label)
-
-    for (in_node, out_node), counter in edge_counter.items():
-        if isinstance(in_node, str):
-            label = f"(probs={counter/node_counter[in_node]:.2f})"
-            graph.edge(node2code[in_node], node2code[out_node], label=label)
-
-    _bytes = graph.pipe(format="png")
-    prefix = "data:image/png;base64,"
-    with BytesIO(_bytes) as stream:
-        base64 = prefix + b64encode(stream.getvalue()).decode("utf-8")
-    fig = go.Figure(go.Image(source=base64))
+    """
+    nodes, edges = cube.nodes, cube.edges
+    if top_k is not None:
+        edges = edges.loc[edges["count"].nlargest(top_k, keep="first").index]
+        nodes = nodes[nodes.index.isin(edges["source"]) | nodes.index.isin(edges["target"])]
+    image = graph_cache.render(nodes, edges, output_format)
+    source = f"data:{GRAPH_FORMATS[output_format]};base64," + b64encode(image).decode("utf-8")
+    fig = go.Figure(go.Image(source=source))
     fig.update_layout(title="Graph of Transitions")
     fig.update_xaxes(showticklabels=False).update_yaxes(showticklabels=False)
     return fig
 
 
+@cube_variant(show_transition_graph_cube)
+@requires_columns(["context_id", "flow_label", "node_label", "history_id"])
+def show_transition_graph(df: pd.DataFrame, top_k: Optional[int] = None, output_format: str = "png") -> BaseFigure:
+    """
+    | Displays the graph of node traversal.
+    | With `top_k`, only the `top_k` most frequent transitions and their nodes are drawn.
+    | The graph is drawn from the aggregated nodes and transitions of the :py:class:`~dff_node_stats.cube.SummaryCube`,
+    | and the image is cached by :py:data:`~dff_node_stats.widgets.visualizers.graph_cache`.
+    | The `output_format` is "png" or "svg".
+
+    """
+    return show_transition_graph_cube(get_summary_cube(df), top_k, output_format)
+
+
+def show_transition_counters_cube(cube: SummaryCube) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_transition_counters`.
+
+    """
+    fig = go.Figure().update_layout(title="Transitions counters")
+    for color, edge_type in colorize(cube.edges["edge_type"].unique()):
+        subset = cube.edges.loc[cube.edges["edge_type"] == edge_type, "count"]
+        subset = subset.sort_values(ascending=False, kind="stable")
+        fig.add_trace(go.Bar(x=subset.keys(), y=subset.values, name=edge_type, marker_color=color))
+    return fig
+
+
+@cube_variant(show_transition_counters_cube)
 @requires_transform(get_nodes_and_edges)
 def show_transition_counters(df: pd.DataFrame) -> BaseFigure:
     """
@@ -194,15 +482,31 @@ def show_transition_counters(df: pd.DataFrame) -> BaseFigure:
     """
     fig = go.Figure().update_layout(title="Transitions counters")
 
-    for color, edge_type in colorize(df["edge_type"].unique()):
+    for color, edge_type in colorize(df["edge_type"].dropna().unique()):
+
+        subset = df.loc[df.edge_type == edge_type, "edge"].value_counts()
+        subset = subset[subset > 0]
+
+        fig.add_trace(go.Bar(x=subset.keys(), y=subset.values, name=edge_type, marker_color=color))
+    return fig
+
 
-        subset = df.loc[df.edge_type == edge_type, "edge"].astype("str").value_counts()
+def show_transition_duration_cube(cube: SummaryCube) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_transition_duration`.
 
+    """
+    _cube_part(cube.duration, ["duration_time"])
+    fig = go.Figure().update_layout(title="Transitions duration [sec]")
+    for color, edge_type in colorize(cube.edges["edge_type"].unique()):
+        subset = cube.edges.loc[cube.edges["edge_type"] == edge_type, "duration_time"]
         fig.add_trace(go.Bar(x=subset.keys(), y=subset.values, name=edge_type, marker_color=color))
     return fig
 
 
+@cube_variant(show_transition_duration_cube)
 @requires_transform(get_nodes_and_edges)
+@requires_columns(["duration_time"])
 def show_transition_duration(df: pd.DataFrame) -> BaseFigure:
     """
     Displays the duration of node transitions.
@@ -210,11 +514,10 @@ def show_transition_duration(df: pd.DataFrame) -> BaseFigure:
     """
     fig = go.Figure().update_layout(title="Transitions duration [sec]")
     edge_time = df[["edge", "edge_type", "duration_time"]]
-    edge_time = edge_time.astype({"edge": "str"})
-    edge_time = edge_time.groupby(["edge", "edge_type"], as_index=False).mean()
+    edge_time = edge_time.groupby(["edge", "edge_type"], as_index=False, observed=True).mean()
     edge_time.index = edge_time.edge
 
-    for color, edge_type in colorize(df["edge_type"].unique()):
+    for color, edge_type in colorize(df["edge_type"].dropna().unique()):
 
         subset = edge_time.loc[edge_time["edge_type"] == edge_type, "duration_time"]
 
@@ -227,3 +530,175 @@ def show_transition_duration(df: pd.DataFrame) -> BaseFigure:
             )
         )
     return fig
+
+
+def show_duration_percentiles_cube(cube: SummaryCube) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_duration_percentiles`.
+
+    """
+    return _percentiles_bars(_cube_part(cube.node_durations, ["duration_time"]))
+
+
+def show_duration_percentiles_sketches(sketches: SketchSet) -> BaseFigure:
+    """
+    The sketch variant of :py:func:`~dff_node_stats.widgets.visualizers.show_duration_percentiles`.
+
+    """
+    return _percentiles_bars(_sketch_part(sketches, "duration/node/"))
+
+
+@sketch_variant(show_duration_percentiles_sketches)
+@cube_variant(show_duration_percentiles_cube)
+@requires_columns(["context_id", "flow_label", "node_label", "duration_time"])
+def show_duration_percentiles(df: pd.DataFrame) -> BaseFigure:
+    """
+    | Displays the p50/p95/p99 `duration_time` of each node.
+    | The percentiles come from mergeable sketches and are within 1% of the exact values.
+
+    """
+    return _percentiles_bars(get_node_duration_sketches(df))
+
+
+def _percentiles_bars(sketches: SketchSet) -> BaseFigure:
+    quantiles = sketches.quantiles([0.5, 0.95, 0.99])
+    fig = go.Figure().update_layout(title="Node duration percentiles [sec]", barmode="group")
+    for color, col in colorize(["p50", "p95", "p99"]):
+        fig.add_trace(go.Bar(x=quantiles.index, y=quantiles[col], name=col, marker_color=color))
+    return fig
+
+
+def show_unique_dialogs_cube(cube: SummaryCube) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_unique_dialogs`.
+
+    """
+    contexts = cube.nodes["contexts"]
+    return _dialogs_bars(contexts[contexts > 0])
+
+
+def show_unique_dialogs_sketches(sketches: SketchSet) -> BaseFigure:
+    """
+    The sketch variant of :py:func:`~dff_node_stats.widgets.visualizers.show_unique_dialogs`.
+
+    """
+    return _dialogs_bars(_sketch_part(sketches, "contexts/node/").distinct_counts())
+
+
+@sketch_variant(show_unique_dialogs_sketches)
+@cube_variant(show_unique_dialogs_cube)
+@requires_columns(["context_id", "flow_label", "node_label"])
+def show_unique_dialogs(df: pd.DataFrame) -> BaseFigure:
+    """
+    | Displays the number of unique dialogs (contexts) that reached each node.
+    | On large data the counts are estimated with HyperLogLog sketches, with a 1.6% standard error.
+
+    """
+    return _dialogs_bars(count_contexts(df, by="node"))
+
+
+def _dialogs_bars(counts: pd.Series) -> BaseFigure:
+    counts = counts.sort_values(ascending=False)
+    fig = go.Figure(go.Bar(x=counts.index, y=counts.values, name="dialogs"))
+    fig.update_layout(title="Unique dialogs per node", yaxis_title="dialogs")
+    return fig
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+def show_top_paths(df: pd.DataFrame, length: int = 3, top_k: int = 20) -> BaseFigure:
+    """
+    Displays the most frequent paths of `length` consecutive nodes.
+
+    """
+    counts = get_sequences(df).ngram_counts(length, top_k).sort_values(kind="stable")
+    fig = go.Figure(go.Bar(x=counts.values, y=counts.index, orientation="h"))
+    fig.update_layout(title=f"Top {length}-step paths")
+    return fig
+
+
+def show_funnel(steps: List[str]) -> VisualizerType:
+    """
+    Returns a visualizer that displays the number of contexts passing each of the `steps` in order.
+
+    Example::
+
+        StreamlitDashboard(df, plots=[show_funnel(["root:start", "animals:what_animal", "animals:tell_fact"])])
+
+    Parameters
+    ----------
+
+    steps: List[str]
+        Node names ("flow_label:node_label") of the funnel steps.
+    """
+
+    @requires_columns(["context_id", "flow_label", "node_label"])
+    def show_funnel_plot(df: pd.DataFrame) -> BaseFigure:
+        counts = get_sequences(df).funnel(steps)
+        fig = go.Figure(go.Funnel(x=counts.values, y=counts.index, textinfo="value+percent initial"))
+        fig.update_layout(title="Funnel")
+        return fig
+
+    return show_funnel_plot
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+def show_dialog_lengths(df: pd.DataFrame) -> BaseFigure:
+    """
+    Displays the distribution of the number of turns per dialog.
+
+    """
+    sessions = get_sessions(df)
+    fig = go.Figure(go.Histogram(x=sessions["turns"], name="dialogs"))
+    fig.update_layout(title="Dialog lengths", xaxis_title="turns", yaxis_title="dialogs")
+    return fig
+
+
+@requires_columns(["context_id", "flow_label", "node_label"])
+def show_drop_off_nodes(df: pd.DataFrame) -> BaseFigure:
+    """
+    Displays the nodes the dialogs ended at, split by whether a fallback node was reached.
+
+    """
+    sessions = get_sessions(df)
+    fig = go.Figure().update_layout(title="Drop-off nodes", barmode="stack")
+    for color, fallback in colorize([False, True]):
+        subset = sessions.loc[sessions["fallback"] == fallback, "last_node"].value_counts()
+        subset = subset[subset > 0]
+        name = "fallback" if fallback else "regular"
+        fig.add_trace(go.Bar(x=subset.keys(), y=subset.values, name=name, marker_color=color))
+    return fig
+
+
+def show_throughput_and_latency_cube(cube: SummaryCube) -> BaseFigure:
+    """
+    The cube variant of :py:func:`~dff_node_stats.widgets.visualizers.show_throughput_and_latency`.
+
+    """
+    return _throughput_plot(_cube_part(cube.series, ["start_time", "duration_time"]), cube.totals, cube.freq)
+
+
+@cube_variant(show_throughput_and_latency_cube)
+@requires_columns(["context_id", "start_time", "duration_time", "flow_label"])
+def show_throughput_and_latency(df: pd.DataFrame, freq: Optional[str] = None) -> BaseFigure:
+    """
+    | Displays the turns per time bucket by flow, the active contexts,
+    | and the p50/p95/p99 `duration_time` over time.
+    | If `freq` is omitted, it is picked by :py:func:`~dff_node_stats.cube.pick_freq`:
+    | the smallest of 1min, 5min, 1h and 1d that gives at most 500 buckets.
+
+    """
+    freq = pick_freq(df["start_time"]) if freq is None else freq
+    return _throughput_plot(rollup(df, freq), rollup(df, freq, by_flow=False), freq)
+
+
+def _throughput_plot(by_flow: pd.DataFrame, total: pd.DataFrame, freq: str) -> BaseFigure:
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, subplot_titles=["Turns", "Duration [sec]"])
+    for color, flow_label in colorize(by_flow["flow_label"].unique()):
+        subset = by_flow[by_flow["flow_label"] == flow_label]
+        fig.add_trace(go.Bar(x=subset["bucket"], y=subset["turns"], name=flow_label, marker_color=color), row=1, col=1)
+    contexts = go.Scatter(x=total["bucket"], y=total["contexts"], name="active contexts", mode="lines")
+    fig.add_trace(contexts, row=1, col=1)
+    for col in ["duration_p50", "duration_p95", "duration_p99"]:
+        fig.add_trace(go.Scatter(x=total["bucket"], y=total[col], name=col[-3:], mode="lines"), row=2, col=1)
+    fig.update_layout(title=f"Throughput and latency per {freq}", barmode="stack")
+    return fig
@@ -11,16 +11,26 @@ Widget
 from typing import Any, Callable, List, Optional, NamedTuple
 
 import pandas as pd
+from plotly.basedatatypes import BaseFigure
 
+from dff_node_stats.cube import SummaryCube, get_summary_cube
+from dff_node_stats.sketches import SketchSet
 from . import visualizers as vs
+from .filters import FilterIndex
 
 default_plots: List[vs.VisualizerType] = [
     vs.show_table,
     vs.show_duration_time,
     vs.show_transition_graph,
     vs.show_node_counters,
+    vs.show_unique_dialogs,
     vs.show_transition_counters,
     vs.show_transition_duration,
+    vs.show_duration_percentiles,
+    vs.show_top_paths,
+    vs.show_dialog_lengths,
+    vs.show_drop_off_nodes,
+    vs.show_throughput_and_latency,
 ]
 
 
@@ -38,16 +48,21 @@ class FilterType(NamedTuple):
 
         default: The default value that will be displayed in the filter.
 
+        kind: One of :py:data:`~dff_node_stats.widgets.filters.FILTER_KINDS`, e.g. "==" or "<=".
+            It states what `comparison_func` computes, so that the filter can be answered from
+            a precomputed index of the column instead of calling `comparison_func` on each row.
+
     """
 
     label: str
     colname: str
     comparison_func: Callable[[Any, Any], bool]
     default: str = "None"
+    kind: Optional[str] = None
 
 
 default_filters: List[FilterType] = [
-    FilterType("Choose context_id", "context_id", lambda x, y: x == y, "None"),
+    FilterType("Choose context_id", "context_id", lambda x, y: x == y, "None", "=="),
 ]
 
 
@@ -65,6 +80,9 @@ class AbstractDashboard:
     filters: Optional[List[FilterType]]
         An optional list of :py:class:`~dff_node_stats.widgets.widget.FilterType` instances that will be used
         to construct additional fiters.
+    sketches: Optional[SketchSet]
+        The sketches persisted for the same data, see :py:meth:`~dff_node_stats.stats.Stats.load_sketches`.
+        While no filter is set, the visualizers with a sketch variant are drawn from them.
     """
 
     def __init__(
@@ -72,11 +90,39 @@ class AbstractDashboard:
         df: pd.DataFrame,
         plots: Optional[List[vs.VisualizerType]] = None,
         filters: Optional[List[FilterType]] = None,
+        sketches: Optional[SketchSet] = None,
     ) -> None:
         self._filters: List[FilterType] = default_filters if filters is None else default_filters + filters
         self._plots: List[vs.VisualizerType] = default_plots if plots is None else default_plots + plots
         self._df_cache = df  # original df used to construct the widget
         self._df = df  # current state
+        self._index = FilterIndex(df, self._filters)
+        self._sketches = sketches
+
+    @property
+    def cube(self) -> SummaryCube:
+        """
+        The :py:class:`~dff_node_stats.cube.SummaryCube` of the current dataframe.
+        It is built once per filter state and shared by all the plots.
+        """
+        return get_summary_cube(self._df)
+
+    def figures(self) -> List[BaseFigure]:
+        """
+        Draw the plots of the current dataframe. The visualizers with a cube variant
+        (see :py:func:`~dff_node_stats.widgets.visualizers.cube_variant`) are drawn from the summary cube,
+        or from the persisted sketches if they have a sketch variant and no filter is set.
+        """
+        figures = []
+        unfiltered = self._sketches is not None and self._df is self._df_cache
+        for plot_func in self._plots:
+            variant = getattr(plot_func, "from_sketches", None)
+            if unfiltered and variant is not None:
+                figures.append(variant(self._sketches))
+                continue
+            variant = getattr(plot_func, "from_cube", None)
+            figures.append(plot_func(self._df) if variant is None else variant(self.cube))
+        return figures
 
     def plots(self):
         raise NotImplementedError
@@ -136,7 +136,7 @@ plot = {
 def main(stats_object: dff_node_stats.Stats, n_iterations: int = 300):
     actor = Actor(plot, start_label=("root", "start"), fallback_label=("root", "fallback"))
 
-    stats_object.update_actor_haupdate_actor_handlersndlers(actor, auto_save=False)
+    stats_object.update_actor_handlers(actor, auto_save=False)
     ctxs = {}
     for i in tqdm.tqdm(range(n_iterations)):
         for j in range(4):
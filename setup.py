@@ -11,6 +11,7 @@ setuptools.setup(
     name="dff_node_stats",
     version="0.1.2",
     scripts=[],
+    entry_points={"console_scripts": ["dff_stats_transfer=dff_node_stats.transfer:main"]},
     author="Denis Kuznetsov",
     author_email="kuznetsov.den.p@gmail.com",
     description="Statistics collection extension for Dialog Flow Framework "
@@ -26,11 +27,11 @@ setuptools.setup(
     ],
     extras_require={
         "api": ["fastapi>=0.68.0", "uvicorn>=0.14.0"],
-        "streamlit": ["streamlit>=1.1.0", "graphviz>=0.17", "plotly>=5.5.0"],
+        "streamlit": ["streamlit>=1.1.0", "graphviz>=0.20", "plotly>=5.5.0"],
         "jupyter": [
             "ipywidgets==7.6.5",
             "traitlets==5.1.1",
-            "graphviz>=0.17",
+            "graphviz>=0.20",
             "plotly>=5.5.0",
         ],
         "dev": [
@@ -40,10 +41,13 @@ setuptools.setup(
             "fastapi>=0.68.0",
             "uvicorn>=0.14.0",
             "streamlit>=1.1.0",
-            "graphviz==0.17",
+            "graphviz==0.20",
             "ipywidgets==7.6.5",
             "traitlets==5.1.1",
             "plotly>=5.5.0",
+            "pyarrow>=6.0.0",
+            "scipy>=1.5.0",
+            "duckdb>=0.7.0",
         ],
         "all": [
             "infi.clickhouse-orm==2.1.1",
@@ -52,13 +56,19 @@ setuptools.setup(
             "fastapi>=0.68.0",
             "uvicorn>=0.14.0",
             "streamlit>=1.1.0",
-            "graphviz==0.17",
+            "graphviz==0.20",
             "ipywidgets==7.6.5",
             "traitlets==5.1.1",
             "plotly>=5.5.0",
+            "pyarrow>=6.0.0",
+            "scipy>=1.5.0",
+            "duckdb>=0.7.0",
         ],
         "pg": ["psycopg2>=2.9.2", "SQLAlchemy==1.4.27"],
         "clickhouse": ["infi.clickhouse-orm==2.1.1"],
+        "cache": ["pyarrow>=6.0.0"],
+        "analytics": ["scipy>=1.5.0"],
+        "duckdb": ["duckdb>=0.7.0"],
     },
     install_requires=[
         "pandas>=1.3.1",
@@ -0,0 +1,5 @@
+HOST="localhost"
+PG_USERNAME=PG_PASSWORD=CH_USERNAME=CH_PASSWORD="x"
+PG_PORT=5432
+CH_PORT=8123
+DATABASE="test"
@@ -1,6 +1,8 @@
 import sys
 from typing import Callable
 
+import numpy as np
+import pandas as pd
 import pytest
 from dff_node_stats import Saver, Stats
 from dff_node_stats import collectors as DSC
@@ -36,6 +38,33 @@ def testing_dataframe(data_generator, testing_saver):
     yield stats_object.dataframe
 
 
+@pytest.fixture
+def dialogs(request):
+    """
+    | A random stats dataframe of 500 turns in 40 contexts, with no node every 17 turns.
+    | Parametrize it indirectly with a dict of options to get a variant:
+    | `missing_nodes=False` keeps every node, `categorical_flows=True` makes the flow labels categorical.
+    """
+    options = getattr(request, "param", {})
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame(
+        {
+            "context_id": rng.integers(0, 40, n).astype(str),
+            "history_id": np.arange(n),
+            "start_time": pd.Timestamp("2022-01-01") + pd.to_timedelta(np.arange(n), unit="s"),
+            "duration_time": rng.random(n),
+            "flow_label": rng.choice(["root", "animals", "news"], n),
+            "node_label": rng.choice(["start", "fallback_node", "what"], n),
+        }
+    )
+    if options.get("categorical_flows", False):
+        df["flow_label"] = pd.Categorical(df["flow_label"])
+    if options.get("missing_nodes", True):
+        df.loc[::17, "node_label"] = np.nan
+    return df
+
+
 @pytest.fixture(scope="session")
 def PG_uri_string():
     return "postgresql://{}:{}@{}:{}/{}".format(
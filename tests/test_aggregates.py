@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dff_node_stats.aggregates import TransitionTable, aggregate_transitions, transition_deltas
+from dff_node_stats.transitions import get_transitions
+
+
+def test_transition_table(dialogs):
+    table = TransitionTable(aggregate_transitions(dialogs))
+    transitions = get_transitions(dialogs)
+    assert table.table["count"].sum() == dialogs["node_label"].notna().sum()
+    assert table.node_counts().to_dict() == transitions.node_counts().to_dict()
+    assert table.transition_counts().to_dict() == transitions.counts().to_dict()
+    expected = transitions.probabilities()
+    assert np.allclose(table.transition_probabilities()[expected.index], expected)
+    expected = transitions.mean_durations()
+    assert np.allclose(table.mean_durations()[expected.index], expected)
+
+
+@pytest.mark.parametrize("batches", [2, 7])
+def test_transition_deltas(dialogs, batches):
+    tables, last_nodes = [], pd.Series(dtype=object)
+    for rows in np.array_split(np.arange(len(dialogs)), batches):
+        deltas, ends = transition_deltas(dialogs.iloc[rows].reset_index(drop=True), last_nodes)
+        tables.append(deltas)
+        last_nodes = pd.concat([last_nodes.drop(ends.index, errors="ignore"), ends])
+    totals = pd.concat(tables).groupby(["source", "target"])[["count", "duration_sum"]].sum()
+    expected = aggregate_transitions(dialogs).set_index(["source", "target"])
+    assert totals["count"].to_dict() == expected["count"].to_dict()
+    assert np.allclose(totals["duration_sum"], expected["duration_sum"])
+    assert last_nodes.sort_index().to_dict() == transition_deltas(dialogs)[1].sort_index().to_dict()
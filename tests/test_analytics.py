@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("scipy")
+
+from dff_node_stats.analytics import get_markov_chain  # noqa: E402
+from dff_node_stats.utils import DffStatsException  # noqa: E402
+
+
+@pytest.fixture
+def chain():
+    dialogs = pd.DataFrame(
+        {
+            "context_id": ["a", "a", "a", "b", "b", "b", "c", "c"],
+            "history_id": [0, 1, 2, 0, 1, 2, 0, 1],
+            "flow_label": ["root"] * 8,
+            "node_label": ["start", "ask", "fallback", "start", "ask", "fact", "start", "fact"],
+        }
+    )
+    return get_markov_chain(dialogs)
+
+
+def test_markov_chain(chain):
+    probs = pd.DataFrame(chain.probabilities().toarray(), index=chain.nodes, columns=chain.nodes)
+    assert probs.loc["root:start", "root:ask"] == pytest.approx(2 / 3)
+    assert probs.loc["root:ask", "root:fallback"] == pytest.approx(0.5)
+    assert sorted(chain.absorbing_nodes()) == ["root:fact", "root:fallback"]
+    assert chain.stationary_distribution().sum() == pytest.approx(1.0)
+
+
+def test_hitting(chain):
+    probs = chain.hitting_probabilities("root:fallback")
+    assert probs["root:start"] == pytest.approx(1 / 3)
+    assert probs["root:fact"] == 0.0
+    steps = chain.expected_steps(["root:fact"])
+    assert steps["root:start"] == pytest.approx(1.5)
+    assert np.isinf(steps["root:fallback"])
+    with pytest.raises(DffStatsException):
+        chain.expected_steps("root:missing")
+
+
+def test_long_chain():
+    waits = 20000
+    dialog = pd.DataFrame(
+        {
+            "context_id": "a",
+            "history_id": np.arange(waits + 2),
+            "flow_label": "root",
+            "node_label": ["start"] + ["wait"] * waits + ["done"],
+        }
+    )
+    chain = get_markov_chain(dialog)
+    assert chain.hitting_probabilities("root:done")["root:start"] == pytest.approx(1.0)
+    assert chain.expected_steps("root:done")["root:start"] == pytest.approx(waits + 1)
+    stationary = chain.stationary_distribution()
+    assert stationary["root:wait"] == pytest.approx(waits / (waits + 2))
@@ -2,10 +2,14 @@ from multiprocessing import Process
 from typing import Dict, List
 import sys
 
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
 import pytest
 import requests
 
-from dff_node_stats.api import api_run
+from dff_node_stats import Saver, Stats
+from dff_node_stats import collectors as DSC
+from dff_node_stats.api import add_default_routes, api_run
 
 
 @pytest.fixture(scope="module")
@@ -77,3 +81,48 @@ def test_default_transition_probs(default_API, host, port):
     for key, value in data.items():
         assert isinstance(key, str)
         assert isinstance(value, float)
+
+
+def test_default_paths(default_API, host, port):
+    response = requests.get(f"http://{host}:{port}/api/v1/stats/paths", params={"length": 2, "top_k": 5})
+    code = response.status_code
+    data = response.json()
+    assert code == 200
+    assert 0 < len(data) <= 5
+    for key, value in data.items():
+        assert key.count("->") == 1
+        assert isinstance(value, int)
+
+
+def test_saved_sketches(data_generator, tmp_path):
+    stats = Stats(
+        saver=Saver("csv://{}".format(tmp_path / "stats.csv")), collectors=[DSC.NodeLabelCollector()], sketches=True
+    )
+    data_generator(stats, 3).save()
+    stats.flush_sketches()
+    sketches = stats.load_sketches()
+    client = TestClient(add_default_routes(FastAPI(), stats.dataframe, sketches))
+    saved = {node: int(count) for node, count in sketches.prefixed("contexts/flow/").distinct_counts().items()}
+    assert client.get("/api/v1/stats/unique-dialogs", params={"by": "flow"}).json() == saved
+    exact = client.get("/api/v1/stats/unique-dialogs", params={"by": "flow", "exact": True}).json()
+    assert exact == stats.dataframe.groupby("flow_label", observed=True)["context_id"].nunique().to_dict()
+    top = client.get("/api/v1/stats/transition-counts", params={"top_k": 3}).json()
+    assert top == {k: int(v) for k, v in sketches["top/edges"].top(3).items()}
+    percentiles = client.get("/api/v1/stats/duration-percentiles", params={"by": "edge"}).json()
+    assert percentiles == sketches.prefixed("duration/edge/").quantiles([0.5, 0.95, 0.99]).to_dict(orient="index")
+
+    client = TestClient(add_default_routes(FastAPI(), stats.dataframe, stats.load_sketches))
+    data_generator(stats, 2).save()
+    stats.flush_sketches()  # loaded on each request
+    saved = stats.load_sketches().prefixed("contexts/flow/").distinct_counts()
+    assert client.get("/api/v1/stats/unique-dialogs", params={"by": "flow"}).json() == saved.to_dict()
+
+
+def test_transition_probs(testing_dataframe):
+    client = TestClient(add_default_routes(FastAPI(), testing_dataframe))
+    counts = client.get("/api/v1/stats/transition-counts").json()
+    probs = client.get("/api/v1/stats/transition-probs").json()
+    assert probs == pytest.approx({k: v / sum(counts.values()) for k, v in counts.items()})
+    top = client.get("/api/v1/stats/transition-probs", params={"top_k": 2}).json()
+    assert top == pytest.approx({k: probs[k] for k in top})
+    assert sorted(top.values()) == pytest.approx(sorted(probs.values())[-2:])
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dff_node_stats import Saver
+from dff_node_stats.chunked import ChunkedAggregator, aggregate_chunks
+from dff_node_stats.sessions import summarize_sessions
+from dff_node_stats.transitions import get_transitions
+from dff_node_stats.utils import DffStatsException
+
+
+@pytest.mark.parametrize("dialogs", [{"missing_nodes": False}], indirect=True)
+@pytest.mark.parametrize("chunksize", [3, 50, 1000])
+def test_aggregate_chunks(dialogs, tmp_path, chunksize):
+    saver = Saver(f"csv://{tmp_path / 'stats.csv'}")
+    saver.save([dialogs])
+    aggregator = aggregate_chunks(saver, chunksize=chunksize)
+    assert aggregator.rows == len(dialogs)
+
+    transitions = get_transitions(dialogs)
+    assert aggregator.node_counts().to_dict() == transitions.node_counts().to_dict()
+    assert aggregator.transition_counts().to_dict() == transitions.counts().to_dict()
+    expected = transitions.probabilities()
+    assert np.allclose(aggregator.transition_probabilities()[expected.index], expected)
+    expected = transitions.mean_durations()
+    assert np.allclose(aggregator.mean_durations()[expected.index], expected)
+
+    sessions = aggregator.sessions()
+    expected = summarize_sessions(dialogs)
+    sessions.index = sessions.index.astype(str)
+    sessions = sessions.loc[expected.index]
+    assert list(sessions.columns) == list(expected.columns)
+    for col in ["turns", "fallback", "n_flows", "start_time"]:
+        assert sessions[col].tolist() == expected[col].tolist()
+    for col in ["first_node", "last_node", "flows"]:
+        assert sessions[col].astype(str).tolist() == expected[col].astype(str).tolist()
+    assert np.allclose(sessions["duration_mean"], expected["duration_mean"])
+
+
+@pytest.mark.parametrize("dialogs", [{"missing_nodes": False}], indirect=True)
+def test_resume(dialogs, tmp_path):
+    saver = Saver(f"csv://{tmp_path / 'stats.csv'}")
+    saver.save([dialogs[:300]])
+    aggregator = aggregate_chunks(saver, chunksize=50)
+    saver.save([dialogs[300:]])
+    resumed = aggregate_chunks(saver, chunksize=50, aggregator=aggregator)
+    assert resumed.rows == len(dialogs)
+    assert resumed.transition_counts().to_dict() == get_transitions(dialogs).counts().to_dict()
+
+    saver.save([dialogs.assign(request_id=1)])  # a new column: the storage is rewritten
+    restarted = aggregate_chunks(saver, chunksize=50, aggregator=resumed)
+    assert restarted.rows == 2 * len(dialogs)
+
+
+def test_missing_columns():
+    with pytest.raises(DffStatsException):
+        ChunkedAggregator().update(pd.DataFrame({"context_id": ["a"]}))
@@ -0,0 +1,74 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+try:
+    from dff_node_stats.widgets import visualizers as vs
+except ImportError:
+    pass
+from dff_node_stats.cube import get_summary_cube, pick_freq
+from dff_node_stats.sketches import count_contexts
+from dff_node_stats.transitions import get_transitions
+
+
+def test_summary_cube(testing_dataframe):
+    cube = get_summary_cube(testing_dataframe)
+    assert get_summary_cube(testing_dataframe) is cube
+    transitions = get_transitions(testing_dataframe)
+    assert (
+        cube.nodes["count"].sort_values(ascending=False, kind="stable").to_dict() == transitions.node_counts().to_dict()
+    )
+    assert cube.nodes["contexts"].to_dict() == count_contexts(testing_dataframe, by="node").to_dict()
+    assert cube.edges["count"].to_dict() == transitions.counts().to_dict()
+    expected = transitions.mean_durations()
+    assert np.allclose(cube.edges["duration_time"].reindex(expected.index), expected)
+    assert cube.totals["turns"].sum() == len(testing_dataframe)
+    assert cube.freq == pick_freq(testing_dataframe["start_time"])
+
+
+def test_summary_cube_without_durations():
+    df = pd.DataFrame(
+        {
+            "context_id": ["a", "a", "b"],
+            "flow_label": ["root", "animals", "root"],
+            "node_label": ["start", "ask", "start"],
+        }
+    )
+    cube = get_summary_cube(df)
+    assert cube.edges.to_dict("index") == {
+        "root:start->animals:ask": {"source": "root:start", "target": "animals:ask", "edge_type": "MIXED", "count": 1}
+    }
+    assert cube.duration is None and cube.series is None
+
+
+@pytest.mark.skipif("plotly" not in sys.modules, reason="plotly not installed")
+@pytest.mark.parametrize(
+    "plottype",
+    [
+        "show_duration_time",
+        "show_node_counters",
+        "show_transition_counters",
+        "show_transition_duration",
+        "show_duration_percentiles",
+        "show_unique_dialogs",
+        "show_throughput_and_latency",
+    ],
+)
+def test_cube_variants(testing_dataframe, plottype):
+    plot_func = getattr(vs, plottype)
+    expected = plot_func(testing_dataframe)
+    result = plot_func.from_cube(get_summary_cube(testing_dataframe))
+    assert result.layout.title.text == expected.layout.title.text
+    assert len(result.data) == len(expected.data)
+    for trace, expected_trace in zip(result.data, expected.data):
+        assert trace.type == expected_trace.type and trace.name == expected_trace.name
+        if trace.type == "table":
+            assert np.allclose(trace.cells.values, expected_trace.cells.values)
+            continue
+        # the order of the bars with equal counts may differ
+        values = pd.Series(np.asarray(trace.y, dtype=float), index=list(trace.x))
+        expected_values = pd.Series(np.asarray(expected_trace.y, dtype=float), index=list(expected_trace.x))
+        assert np.allclose(values, expected_values.reindex(values.index), equal_nan=True)
+        assert sorted(values.index) == sorted(expected_values.index)
@@ -0,0 +1,51 @@
+import operator
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dff_node_stats.widgets.filters import FILTER_KINDS, FilterIndex
+from dff_node_stats.widgets.widget import FilterType
+
+OPERATORS = dict(zip(FILTER_KINDS, [operator.eq, operator.lt, operator.le, operator.gt, operator.ge]))
+
+
+@pytest.fixture(scope="module")
+def filter_dataframe():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "context_id": rng.integers(0, 50, 1000).astype(str),
+            "history_id": rng.integers(0, 20, 1000).astype(float),
+            "node_label": pd.Categorical(rng.choice(["start", "ask", "fallback"], 1000)),
+        }
+    )
+    df.loc[::7, "history_id"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("kind", FILTER_KINDS)
+@pytest.mark.parametrize("colname,value", [("history_id", 7.0), ("history_id", 7.5), ("context_id", "17")])
+def test_filter_kinds(filter_dataframe, kind, colname, value):
+    func = OPERATORS[kind]
+    indexed = FilterIndex(filter_dataframe, [FilterType("", colname, func, "None", kind)])
+    fallback = FilterIndex(filter_dataframe, [FilterType("", colname, func, "None")])
+    expected = filter_dataframe[func(filter_dataframe[colname], value)]
+    assert indexed.positions([value]).tolist() == np.flatnonzero(filter_dataframe.index.isin(expected.index)).tolist()
+    assert indexed.positions([value]).tolist() == fallback.positions([value]).tolist()
+
+
+def test_combined_filters(filter_dataframe):
+    filters = [
+        FilterType("", "context_id", operator.eq, "None", "=="),
+        FilterType("", "history_id", operator.ge, "None", ">="),
+        FilterType("", "node_label", lambda x, y: x.startswith(y), "None"),
+    ]
+    index = FilterIndex(filter_dataframe, filters)
+    df = filter_dataframe
+    expected = df[(df["context_id"] == "3") & (df["history_id"] >= 5) & df["node_label"].str.startswith("a")]
+    assert index.slice(["3", 5.0, "a"]).equals(expected)
+    assert index.slice(["None", 5.0, "None"]).equals(df[df["history_id"] >= 5])
+    assert index.positions(["None", "None", "None"]) is None
+    assert index.slice(["None", "None", "None"]) is df
+    assert index.slice(["missing", "None", "None"]) is df
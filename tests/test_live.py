@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dff_node_stats import Saver, Stats
+from dff_node_stats.live import LiveMetrics
+from dff_node_stats.utils import DffStatsException
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_windows():
+    clock = Clock()
+    live = LiveMetrics(windows=[10, 60], clock=clock)
+    rng = np.random.default_rng(0)
+    turns = []
+    for _ in range(500):
+        clock.now += rng.exponential(0.5)
+        turn = (clock.now, rng.choice(["start", "fallback_node", "what"]), rng.random())
+        live.add("root", turn[1], turn[2])
+        turns.append(turn)
+        if rng.random() < 0.1:
+            for window in [10, 60]:
+                recent = [turn for turn in turns if turn[0] >= np.floor(clock.now) - window + 1]
+                metrics = live.metrics(window, top_k=2)
+                assert metrics.turns == len(recent)
+                assert metrics.turns_per_second == len(recent) / window
+                labels = pd.Series([label for _, label, _ in recent])
+                assert metrics.fallback_rate == pytest.approx((labels == "fallback_node").mean())
+                assert metrics.top_nodes == ("root:" + labels).value_counts().head(2).to_dict()
+                exact = np.quantile([duration for *_, duration in recent], 0.95, method="lower")
+                assert metrics.durations["p95"] == pytest.approx(exact, rel=0.01)
+
+    clock.now += 30
+    assert live.metrics(10).turns == 0 and live.metrics(10).fallback_rate is None
+    assert live.metrics(10).durations == {"p50": None, "p95": None, "p99": None}
+    assert live.metrics(60).turns > 0
+    clock.now += 1000
+    assert live.metrics(60).turns == 0
+    with pytest.raises(DffStatsException):
+        live.metrics(30)
+
+
+def test_stats_feed(tmp_path):
+    clock = Clock()
+    live = LiveMetrics(windows=[300], clock=clock)
+    stats = Stats(saver=Saver(f"csv://{tmp_path / 'stats.csv'}"), live=live)
+    stats.add_df({"flow_label": ["root", "root"], "node_label": ["start", "fallback"], "duration_time": [0.1, 0.2]})
+    metrics = live.metrics(300)
+    assert metrics.turns == 2 and metrics.fallback_rate == 0.5
+    assert metrics.top_nodes == {"root:start": 1, "root:fallback": 1}
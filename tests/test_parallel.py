@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dff_node_stats import Saver
+from dff_node_stats.chunked import ChunkedAggregator
+from dff_node_stats.parallel import (
+    ParallelExecutor,
+    partition_codes,
+    read_shared_frame,
+    share_frame,
+    share_partitions,
+)
+from dff_node_stats.sessions import summarize_sessions
+from dff_node_stats.transitions import get_transitions
+
+pytestmark = pytest.mark.parametrize("dialogs", [{"missing_nodes": False, "categorical_flows": True}], indirect=True)
+
+
+def test_shared_frame(dialogs):
+    partitions = partition_codes(dialogs["context_id"], 3)
+    assert partitions.min() >= 0 and partitions.max() < 3
+    assert dialogs.groupby(partitions)["context_id"].nunique().sum() == dialogs["context_id"].nunique()
+    shm, frame = share_frame(dialogs, partitions)
+    try:
+        parts = [read_shared_frame(frame, partition) for partition in range(3)]
+    finally:
+        shm.close()
+        shm.unlink()
+    assert [len(part) for part in parts] == np.bincount(partitions).tolist()
+    assert parts[1]["flow_label"].dtype == dialogs["flow_label"].dtype
+    expected = dialogs[partitions == 1].reset_index(drop=True)
+    assert parts[1].astype(str).equals(expected.astype(str))
+
+    blocks = list(share_partitions(dialogs, partitions))
+    try:
+        separate = [read_shared_frame(frame) for _, frame in blocks]
+    finally:
+        for shm, _ in blocks:
+            shm.close()
+            shm.unlink()
+    assert all(part.astype(str).equals(other.astype(str)) for part, other in zip(parts, separate))
+
+
+def test_aggregate_and_merge(dialogs):
+    first, second = ChunkedAggregator().update(dialogs[:200]), ChunkedAggregator().update(dialogs[200:])
+    merged = first.merge(second)
+    assert merged.transition_counts().to_dict() == get_transitions(dialogs).counts().to_dict()
+    assert merged.sessions()["turns"].to_dict() == summarize_sessions(dialogs)["turns"].to_dict()
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_executor(dialogs, tmp_path, processes):
+    expected = get_transitions(dialogs).counts().to_dict()
+    with ParallelExecutor(processes=processes, partitions=3) as executor:
+        assert executor.aggregate(dialogs).transition_counts().to_dict() == expected
+        sessions = executor.map(dialogs, summarize_sessions, combine=pd.concat)
+        assert sessions["turns"].to_dict() == summarize_sessions(dialogs)["turns"].to_dict()
+
+        saver = Saver(f"csv://{tmp_path / 'stats.csv'}")
+        saver.save([dialogs])
+        aggregator = executor.aggregate_chunks(saver, chunksize=60)
+        assert aggregator.rows == len(dialogs)
+        assert aggregator.transition_counts().to_dict() == expected
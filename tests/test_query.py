@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("duckdb")
+
+from dff_node_stats import Saver  # noqa: E402
+from dff_node_stats.query import QueryEngine  # noqa: E402
+from dff_node_stats.transitions import get_transitions  # noqa: E402
+from dff_node_stats.utils import DffStatsException  # noqa: E402
+
+
+@pytest.fixture(params=["csv", "parquet", "frame"])
+def engine(request, dialogs, tmp_path):
+    if request.param == "csv":
+        saver = Saver(f"csv://{tmp_path / 'stats.csv'}")
+        saver.save([dialogs])
+        return QueryEngine(saver)
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+        for part, rows in enumerate(np.array_split(np.arange(len(dialogs)), 3)):
+            dialogs.iloc[rows].to_parquet(tmp_path / f"stats_{part}.parquet")
+        return QueryEngine(str(tmp_path / "*.parquet"))
+    return QueryEngine(dialogs)
+
+
+def test_transforms(engine, dialogs):
+    transitions = get_transitions(dialogs)
+    assert engine.node_counts().to_dict() == transitions.node_counts().to_dict()
+    assert engine.transition_counts().to_dict() == transitions.counts().to_dict()
+    expected = transitions.probabilities()
+    assert np.allclose(engine.transition_probabilities()[expected.index], expected)
+    expected = transitions.mean_durations()
+    assert np.allclose(engine.duration_stats(by="edge")["mean"][expected.index], expected)
+
+    stats = engine.duration_stats()
+    assert list(stats.columns) == ["count", "mean", "min", "25%", "50%", "75%", "95%", "99%", "max"]
+    assert stats["count"].sum() == dialogs["node_label"].notna().sum()
+    assert (stats["min"] <= stats["50%"]).all() and (stats["50%"] <= stats["max"]).all()
+
+
+def test_sql(engine):
+    result = engine.sql("SELECT COUNT(*) AS turns FROM dff_stats WHERE flow_label = ?", ["root"])
+    assert result["turns"][0] > 0
+    with pytest.raises(DffStatsException):
+        engine.duration_stats(by="flow")
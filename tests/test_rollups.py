@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dff_node_stats.rollups import add_saved_sketches, bucket_seconds, merge_rollup, rollup
+from dff_node_stats.sketches import DDSketch, HyperLogLog, SketchSet
+
+
+@pytest.fixture
+def turns():
+    return pd.DataFrame(
+        {
+            "context_id": ["a", "b", "a", "a", "b", "b", "a"],
+            "start_time": pd.to_datetime("2022-01-01") + pd.to_timedelta([0, 10, 65, 70, 130, 140, 150], "s"),
+            "duration_time": [1.0, 2.0, 3.0, 4.0, 5.0, np.nan, 1.0],
+            "flow_label": ["root", "root", "animals", "root", "news", "global", "root"],
+        }
+    )
+
+
+def test_rollup(turns):
+    result = rollup(turns, "1min")
+    assert len(result) == 6
+    first = result.iloc[0]
+    assert (first["flow_label"], first["turns"], first["contexts"]) == ("root", 2, 2)
+    assert first["duration_p50"] == pytest.approx(1.5)
+    assert first["duration_p99"] == pytest.approx(1.99)
+
+    total = rollup(turns, "2min", by_flow=False)
+    assert total["turns"].tolist() == [4, 3]
+    assert total["contexts"].tolist() == [2, 2]
+    assert "flow_label" not in total.columns
+
+
+def test_bucket_size():
+    assert bucket_seconds("1h") == 3600
+    with pytest.raises(ValueError):
+        bucket_seconds("10ms")
+
+
+def test_merge_rollup(turns):
+    minutes = rollup(turns, "1min", sketches=True)
+    merged = merge_rollup(minutes, "2min", by_flow=False)
+    exact = rollup(turns, "2min", by_flow=False)
+    assert merged["turns"].tolist() == exact["turns"].tolist()
+    assert merged["contexts"].tolist() == exact["contexts"].tolist()
+    # the sketches return the values of rank floor(q * (n - 1))
+    assert merged["duration_p99"].tolist() == pytest.approx([3.0, 1.0], rel=0.01)
+
+
+def test_add_saved_sketches(turns):
+    exact = rollup(turns, "1min", by_flow=False)
+    batches = []
+    for bucket, group in turns.groupby(turns["start_time"].dt.floor("1min")):
+        sketches = SketchSet(factory=lambda key: HyperLogLog() if key.startswith("contexts/") else DDSketch())
+        sketches.update("contexts/all", group["context_id"])
+        for flow, durations in group.groupby("flow_label")["duration_time"]:
+            sketches.update(f"duration/node/{flow}:start", durations.dropna())
+        batches += [(bucket, key, payload) for key, payload in sketches.to_records()]
+    result = add_saved_sketches(exact, batches, "1min")
+    assert [sketch.count for sketch in result["contexts_sketch"]] == exact["contexts"].tolist()
+    assert [sketch.count for sketch in result["duration_sketch"]] == [2, 2, 2]
+    merged = merge_rollup(result, "2min", by_flow=False)
+    assert merged["contexts"].tolist() == rollup(turns, "2min", by_flow=False)["contexts"].tolist()
@@ -1,5 +1,7 @@
 import sys
+import datetime
 import pathlib
+import threading
 
 try:
     import sqlalchemy
@@ -7,7 +9,15 @@ try:
 except ImportError:
     pass
 import pytest
+import pandas as pd
 from dff_node_stats import Saver, Stats
+from dff_node_stats import collectors as DSC
+from dff_node_stats.aggregates import TransitionTable, aggregate_transitions
+from dff_node_stats.rollups import merge_rollup
+from dff_node_stats.savers import LoadCache
+from dff_node_stats.stats import SKETCH_BUCKET
+from dff_node_stats.transitions import get_transitions
+from dff_node_stats.utils import CategoryDictionary
 
 
 def test_uri():
@@ -34,17 +44,21 @@ def test_saver_registry():
 
 if "sqlalchemy" in sys.modules:
 
+    def connect(uri_string):
+        try:
+            return sqlalchemy.create_engine(uri_string).connect()
+        except (ImportError, sqlalchemy.exc.SQLAlchemyError) as error:
+            pytest.skip(f"Database unavailable: {error}")
+
     @pytest.fixture(scope="session")
     def PG_connection(PG_uri_string):
-        engine = sqlalchemy.create_engine(PG_uri_string)
-        connection = engine.connect()
+        connection = connect(PG_uri_string)
         yield connection
         connection.close()
 
     @pytest.fixture(scope="session")
     def CH_connection(CH_uri_string):
-        engine = sqlalchemy.create_engine(CH_uri_string)
-        connection = engine.connect()
+        connection = connect(CH_uri_string)
         yield connection
         connection.close()
 
@@ -79,3 +93,232 @@ def test_CH_saving(CH_connection, CH_uri_string, data_generator):
     assert int(first[0]) > 0
     df = stats_object.dataframe
     assert set(df.columns) == initial_cols
+
+
+def check_aggregates(saver, data_generator):
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()])
+    for contexts in [3, 2, 4]:  # the first batch builds the tables, the next ones add their deltas
+        data_generator(stats, contexts).save()
+    expected = aggregate_transitions(saver.load())
+    pd.testing.assert_frame_equal(saver.load_aggregates(), expected, check_dtype=False)
+
+
+@pytest.mark.skipif("sqlalchemy" not in sys.modules, reason="Postgres extra not installed")
+def test_PG_load_aggregates(PG_connection, PG_uri_string, data_generator):
+    PG_connection.execute(
+        "DROP TABLE IF EXISTS dff_stats_aggregates, dff_stats_aggregates_transitions, dff_stats_aggregates_last_nodes"
+    )
+    check_aggregates(Saver(PG_uri_string, table="dff_stats_aggregates", aggregates=True), data_generator)
+
+
+@pytest.mark.skipif(
+    ("infi" not in sys.modules or "sqlalchemy" not in sys.modules), reason="Clickhouse extra not installed"
+)
+def test_CH_load_aggregates(CH_connection, CH_uri_string, data_generator):
+    for table in ["dff_stats_aggregates", "dff_stats_aggregates_transitions", "dff_stats_aggregates_last_nodes"]:
+        CH_connection.execute(f"DROP TABLE IF EXISTS {table}")
+    check_aggregates(Saver(CH_uri_string, table="dff_stats_aggregates", aggregates=True), data_generator)
+
+
+def test_incremental_refresh(data_generator, tmp_path):
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    initial_len = len(stats.dataframe)
+    initial_version = stats.version
+    assert initial_len > 0
+
+    data_generator(stats, 2).save()
+    delta = stats.refresh()
+    assert len(delta) > 0
+    assert stats.watermark.start > 0
+    assert len(stats.dataframe) == initial_len + len(delta)
+    assert isinstance(stats.dataframe["node_label"].dtype, pd.CategoricalDtype)
+    assert not isinstance(stats.dataframe["context_id"].dtype, pd.CategoricalDtype)
+    categories = saver.category_dictionary.categories("node_label")
+    assert list(stats.dataframe["node_label"].cat.categories) == list(categories)
+    assert Saver("csv://other.csv").category_dictionary.categories("node_label").empty
+    assert stats.version == initial_version + 1
+    assert len(stats.dataframe) == len(saver.load(column_types=stats.column_dtypes, parse_dates=stats.parse_dates))
+
+    assert len(stats.refresh()) == 0
+    assert stats.version == initial_version + 1
+
+
+def test_refresh_rewritten_file(data_generator, tmp_path):
+    path = tmp_path / "stats.csv"
+    stats = Stats(saver=Saver("csv://{}".format(path)), collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    lines = path.read_bytes().splitlines(keepends=True)
+    assert len(stats.dataframe) == len(lines) - 1
+
+    path.write_bytes(b"".join(lines[:3]))  # truncated
+    assert len(stats.refresh()) == 2 and stats.watermark.start == 0
+    path.write_bytes(b"".join(lines[:1] + lines[:0:-1]))  # rewritten with the same size
+    assert len(stats.refresh()) == len(lines) - 1 and stats.watermark.start == 0
+    assert len(stats.refresh()) == 0
+
+
+def test_lazy_frame_alignment(data_generator, tmp_path):
+    path = tmp_path / "stats.csv"
+    stats = Stats(saver=Saver("csv://{}".format(path)), collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    columns = ["start_time", "context_id", "history_id", "node_label"]
+    expected = stats.dataframe[columns].astype(str)
+    lazy_df = stats.lazy_dataframe()
+    assert len(lazy_df["history_id"]) == len(expected)
+
+    lines = path.read_bytes().splitlines(keepends=True)
+    path.write_bytes(b"".join(lines[:1] + lines[:0:-1]))  # the saver returns the rows in another order
+    data_generator(stats, 1).save()
+    pd.testing.assert_frame_equal(lazy_df[columns].astype(str), expected)
+
+
+def test_load_cache(data_generator, tmp_path):
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    cache = LoadCache(str(tmp_path / "cache"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()], cache=cache)
+    data_generator(stats, 3).save()
+    df = stats.dataframe
+    assert len(list(cache.path.glob("*.feather"))) == 1
+
+    restarted = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()], cache=cache)
+    cached = cache.get(saver, restarted.column_dtypes, restarted.parse_dates)
+    assert cached is not None
+    pd.testing.assert_frame_equal(restarted.dataframe, df)
+    assert restarted.watermark == stats.watermark
+
+    data_generator(stats, 2).save()
+    assert cache.get(saver, restarted.column_dtypes, restarted.parse_dates) is None
+
+
+def test_shared_categories():
+    column_types = {"node_label": "category"}
+    category_dictionary = CategoryDictionary()
+    first = category_dictionary.encode(pd.DataFrame({"node_label": ["start", "fallback"]}), column_types)
+    second = category_dictionary.encode(pd.DataFrame({"node_label": ["start", "ask_about_breed"]}), column_types)
+    first = category_dictionary.encode(first, column_types)
+    assert list(first.node_label.cat.categories) == list(second.node_label.cat.categories)
+    result = pd.concat([first, second], ignore_index=True)
+    assert isinstance(result.node_label.dtype, pd.CategoricalDtype)
+    assert list(result.node_label) == ["start", "fallback", "start", "ask_about_breed"]
+
+
+def test_load_sessions(data_generator, tmp_path):
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    sessions = saver.load_sessions()
+    assert len(sessions) == stats.dataframe["context_id"].nunique()
+    assert sessions["turns"].sum() == len(stats.dataframe)
+    assert {"last_node", "fallback", "flows", "duration_mean"} <= set(sessions.columns)
+
+
+def test_load_rollup(data_generator, tmp_path):
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    result = saver.load_rollup("1h", by_flow=False)
+    assert result["turns"].sum() == len(stats.dataframe)
+    assert {"bucket", "contexts", "duration_p95"} <= set(result.columns)
+    merged = merge_rollup(saver.load_rollup("1min", sketches=True), "1d", by_flow=False)
+    assert merged["turns"].sum() == len(stats.dataframe)
+    assert merged["contexts"].sum() == pytest.approx(stats.dataframe["context_id"].nunique(), rel=0.05)
+
+
+def test_load_contexts(data_generator, tmp_path, monkeypatch):
+    monkeypatch.setattr("dff_node_stats.savers.csv.INDEX_BLOCK_ROWS", 5)
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    df = stats.dataframe
+    context_id = df["context_id"].iloc[-1]
+    timeline = saver.load_context(context_id)
+    expected = df[df["context_id"] == context_id].sort_values("history_id")
+    assert timeline["history_id"].tolist() == expected["history_id"].tolist()
+    assert saver.index_path.exists()
+
+    data_generator(stats, 2).save()
+    ids = stats.refresh()["context_id"].unique()[:2]
+    contexts = saver.load_contexts(ids, column_types={"history_id": "int64", "node_label": "category"})
+    assert list(contexts.columns) == ["history_id", "node_label"]
+    assert len(contexts) == stats.dataframe["context_id"].isin(ids).sum()
+    assert len(saver.load_contexts(["missing"])) == 0
+
+
+def test_sharded_saver(data_generator, tmp_path):
+    def pool_threads():
+        return {thread for thread in threading.enumerate() if thread.name.startswith("ThreadPoolExecutor")}
+
+    threads = pool_threads()
+    saver = Saver("sharded://csv://{}".format(tmp_path / "stats_{shard}.csv"), shards=3)
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    df = stats.dataframe
+    assert len(list(tmp_path.glob("stats_*.csv"))) == 3
+    assert saver.aggregate(chunksize=7).transition_counts().to_dict() == get_transitions(df).counts().to_dict()
+    for code, shard in enumerate(saver.shards):
+        contexts = set(shard.load()["context_id"].astype(str))
+        assert all(saver.shard_codes(contexts) == code)
+
+    data_generator(stats, 2).save()
+    assert len(stats.refresh()) > 0 and stats.watermark.start > 0
+    context_id = df["context_id"].iloc[0]
+    expected = stats.dataframe[stats.dataframe["context_id"] == context_id]
+    assert saver.load_context(context_id)["history_id"].tolist() == expected["history_id"].tolist()
+
+    saver.shards[1].save([stats.dataframe.head(1).assign(request_id=1)])  # rewrites one shard
+    chunks = list(saver.iter_load(chunksize=5, watermark=stats.watermark))
+    assert chunks[0][1].start == 0 and sum(len(chunk) for chunk, _ in chunks) == len(stats.dataframe) + 1
+    assert stats.refresh().shape[0] == len(stats.dataframe) and stats.watermark.start == 0
+    chunks = saver.iter_load(chunksize=5)
+    next(chunks)
+    chunks.close()
+    assert pool_threads() == threads  # the pools of the calls have been shut down
+
+
+def test_load_aggregates(data_generator, tmp_path):
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    table = TransitionTable(saver.load_aggregates())
+    assert table.table["count"].sum() == len(stats.dataframe)
+    assert table.transition_counts().to_dict() == get_transitions(stats.dataframe).counts().to_dict()
+
+
+def test_load_sketches(data_generator, tmp_path, monkeypatch):
+    monkeypatch.setattr("dff_node_stats.savers.csv.SKETCH_COMPACT_BYTES", 0)
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()], sketches=True)
+    data_generator(stats, 3).save()
+    assert len(stats.load_sketches()) == 0  # the sketches are saved every sketch_interval seconds
+    stats.flush_sketches()
+    data_generator(stats, 2).save()
+    stats.flush_sketches()
+    stats.flush_sketches()  # the saves of a time bucket replace each other
+    with saver.sketches_path.open() as file:
+        assert sum(1 for _ in file) == len(saver._latest_sketches())
+    sketches = stats.load_sketches()
+    assert sum(sketch.count for _, sketch in sketches.prefixed("duration/node/").items()) == len(stats.dataframe)
+    assert sketches["contexts/all"].count == pytest.approx(stats.dataframe["context_id"].nunique(), rel=0.05)
+    assert sketches["top/nodes"].total == len(stats.dataframe)
+    expected = get_transitions(stats.dataframe).counts()
+    assert sketches["top/edges"].top().sort_index().to_dict() == expected.sort_index().to_dict()
+    durations = sketches.prefixed("duration/edge/").quantiles([0.5])["count"]
+    assert durations.sort_index().to_dict() == expected.sort_index().to_dict()
+    assert len(stats.load_sketches(since=datetime.datetime.now())) == 0
+
+
+def test_sketch_buckets(data_generator, tmp_path, monkeypatch):
+    bucket = [datetime.datetime(2022, 1, 1)]
+    monkeypatch.setattr("dff_node_stats.stats._bucket", lambda moment: bucket[0])
+    saver = Saver("csv://{}".format(tmp_path / "stats.csv"))
+    stats = Stats(saver=saver, collectors=[DSC.NodeLabelCollector()], sketches=True)
+    first = sum(len(df) for df in data_generator(stats, 3).dfs)
+    bucket[0] += SKETCH_BUCKET
+    data_generator(stats, 2).save()  # the ended bucket is saved right away
+    sketches = stats.load_sketches(until=bucket[0])
+    assert sum(sketch.count for _, sketch in sketches.prefixed("duration/node/").items()) == first
+    stats.flush_sketches()
+    sketches = stats.load_sketches(since=bucket[0]).prefixed("duration/node/")
+    assert sum(sketch.count for _, sketch in sketches.items()) == len(stats.dataframe) - first
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+from dff_node_stats.sequences import get_sequences
+from dff_node_stats.utils import DffStatsException
+
+
+@pytest.fixture
+def sequences():
+    dialogs = pd.DataFrame(
+        {
+            "context_id": ["a", "b", "a", "a", "b", "b", "a", None],
+            "history_id": [0, 0, 2, 1, 1, 2, 3, 0],
+            "flow_label": ["root"] * 8,
+            "node_label": ["start", "start", "ask", "what", "what", "ask", "fact", "start"],
+        }
+    )
+    return get_sequences(dialogs)
+
+
+def test_ngram_counts(sequences):
+    assert sequences.ngram_counts(2).to_dict() == {
+        "root:start->root:what": 2,
+        "root:what->root:ask": 2,
+        "root:ask->root:fact": 1,
+    }
+    assert sequences.ngram_counts(3, top_k=1).to_dict() == {"root:start->root:what->root:ask": 2}
+    assert sequences.ngram_counts(5).empty
+
+
+def test_funnel(sequences):
+    funnel = sequences.funnel(["root:start", "root:ask", "root:fact"])
+    assert funnel.tolist() == [2, 2, 1]
+    assert sequences.funnel(["root:ask", "root:what"]).tolist() == [2, 0]
+    with pytest.raises(DffStatsException):
+        sequences.funnel(["root:missing"])
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.sessions import get_sessions, summarize_sessions
+
+
+def test_sessions():
+    dialogs = pd.DataFrame(
+        {
+            "context_id": ["a", "b", "a", "a", "b", "b", "a"],
+            "history_id": [0, 0, 2, 1, 1, 2, 3],
+            "duration_time": [1.0, 2.0, 3.0, 4.0, 5.0, np.nan, 1.0],
+            "flow_label": ["root", "root", "animals", "root", "news", "global", "root"],
+            "node_label": ["start", "start", "ask", "what", "what", "fallback_node", "fact"],
+        }
+    )
+    sessions = get_sessions(dialogs)
+    assert sessions["turns"].to_dict() == {"a": 4, "b": 3}
+    assert sessions["last_node"].tolist() == ["root:fact", "global:fallback_node"]
+    assert sessions["fallback"].tolist() == [False, True]
+    assert sessions["flows"].tolist() == ["animals,root", "global,news,root"]
+    assert sessions["duration_total"].tolist() == [9.0, 7.0]
+    assert sessions["duration_mean"].tolist() == [2.25, 3.5]
+    assert summarize_sessions(dialogs, fallback_pattern="what")["fallback"].all()
+
+
+def test_empty_sessions():
+    columns = ["context_id", "flow_label", "node_label"]
+    sessions = get_sessions(pd.DataFrame({col: pd.Series([], dtype=object) for col in columns}))
+    assert sessions.empty
@@ -0,0 +1,155 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dff_node_stats.sketches import (
+    BloomFilter,
+    DDSketch,
+    HyperLogLog,
+    SketchSet,
+    SpaceSaving,
+    count_contexts,
+    get_node_duration_sketches,
+    hash_values,
+    heavy_hitters,
+)
+from dff_node_stats.transitions import get_transitions
+
+
+def test_ddsketch_accuracy():
+    values = np.random.default_rng(0).lognormal(0, 2, 10000)
+    sketch = DDSketch(relative_accuracy=0.01)
+    sketch.update(values[:5000])
+    for value in values[5000:]:
+        sketch.add(value)
+    for q in [0, 0.1, 0.5, 0.9, 0.99, 1]:
+        exact = np.quantile(values, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+    assert sketch.count == len(values)
+    assert np.isnan(DDSketch().quantile(0.5))
+
+
+def test_merge_and_serialize():
+    first, second = SketchSet(), SketchSet()
+    first.update("a", [1.0, 2.0, 3.0])
+    second.update("a", [4.0, 0.0])
+    second.update("b", [10.0])
+    merged = SketchSet.from_records(first.to_records() + second.to_records())
+    assert merged["a"].count == 5
+    assert merged["a"].zero_count == 1
+    assert merged["a"].quantile(1) == 4.0
+    assert merged.merged().count == 6
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.05))
+
+
+def test_ddsketch_subtract():
+    values = np.random.default_rng(0).lognormal(0, 2, 2000)
+    first, second = DDSketch(), DDSketch()
+    first.update(values[:1000])
+    second.update(np.append(values[1000:], 0.0))
+    first.merge(second).subtract(second)
+    assert first.count == 1000 and first.zero_count == 0
+    assert first.quantile(0.5) == pytest.approx(np.quantile(values[:1000], 0.5, method="lower"), rel=0.01)
+    assert first.subtract(first).count == 0 and np.isnan(first.quantile(0.5))
+
+
+def test_node_duration_sketches():
+    df = pd.DataFrame(
+        {
+            "context_id": ["a", "a", "b", "b"],
+            "history_id": [0, 1, 0, 1],
+            "flow_label": ["root"] * 4,
+            "node_label": ["start", "ask", "start", "ask"],
+            "duration_time": [1.0, 2.0, 3.0, np.nan],
+        }
+    )
+    quantiles = get_node_duration_sketches(df).quantiles([0.5])
+    assert quantiles.loc["root:start", "count"] == 2
+    assert quantiles.loc["root:start", "p50"] == pytest.approx(1.0, rel=0.01)
+    assert quantiles.loc["root:ask", "count"] == 1
+
+
+def test_hyperloglog():
+    first, second = HyperLogLog(), HyperLogLog()
+    first.update(np.arange(20000))
+    for value in range(10000, 30000):
+        second.add(value)
+    assert first.count == pytest.approx(20000, rel=0.05)
+    restored = HyperLogLog.from_dict(json.loads(json.dumps(first.to_dict())))
+    assert restored.merge(second).count == pytest.approx(30000, rel=0.05)
+    small = HyperLogLog()
+    small.update(["a", "b", "a"])
+    assert small.count == 2
+
+
+def test_count_contexts():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "context_id": rng.integers(0, 5000, 20000).astype(str),
+            "flow_label": rng.choice(["root", "animals"], 20000),
+            "node_label": rng.choice(["start", "fallback"], 20000),
+        }
+    )
+    exact = count_contexts(df, by="flow", exact=True)
+    assert exact["root"] == df.loc[df["flow_label"] == "root", "context_id"].nunique()
+    approximate = count_contexts(df, by="flow", exact=False)
+    assert approximate["root"] == pytest.approx(exact["root"], rel=0.05)
+    assert count_contexts(df, by="node").sum() == df.groupby(["flow_label", "node_label"]).context_id.nunique().sum()
+
+
+def test_space_saving():
+    rng = np.random.default_rng(0)
+    parts = [rng.zipf(1.5, 5000) % 2000 for _ in range(3)]
+    summaries = []
+    for part in parts:
+        summary = SpaceSaving(50)
+        for batch in np.array_split(part, 4):
+            summary.update(batch)
+        summaries.append(summary)
+    merged = SpaceSaving.from_dict(json.loads(json.dumps(summaries[0].to_dict())))
+    for summary in summaries[1:]:
+        merged.merge(summary)
+
+    exact = pd.Series(np.concatenate(parts)).value_counts()
+    assert merged.total == exact.sum()
+    assert merged.floor <= merged.total / merged.capacity
+    counts = exact.reindex(merged.counts.index, fill_value=0)
+    assert (counts <= merged.counts).all() and (merged.counts - merged.errors <= counts).all()
+    assert (exact.drop(merged.counts.index) <= merged.floor).all()
+    assert merged.top(3).index.tolist() == exact.index[:3].tolist()
+
+    online = SpaceSaving(10)
+    for value in ["a", "b", "a"]:
+        online.add(value)
+    assert online.top().to_dict() == {"a": 2, "b": 1}
+
+
+def test_bloom_filter():
+    values = np.arange(5000).astype(str)
+    bloom = BloomFilter(capacity=len(values))
+    bloom.update(values[:2500])
+    bloom.add(values[2500])
+    assert all(value in bloom for value in values[:2501])
+    assert np.mean([value in bloom for value in values[2501:]]) < 0.01
+    restored = BloomFilter.from_dict(json.loads(json.dumps(bloom.to_dict())))
+    assert restored.contains_hashes(hash_values(values[:2501])).all()
+    with pytest.raises(ValueError):
+        bloom.merge(BloomFilter(capacity=10))
+
+
+def test_heavy_hitters():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "context_id": rng.integers(0, 500, 20000).astype(str),
+            "flow_label": "root",
+            "node_label": (rng.zipf(1.5, 20000) % 1000).astype(str),
+        }
+    )
+    transitions = get_transitions(df)
+    assert heavy_hitters(df, k=5).top(5).to_dict() == transitions.counts().head(5).to_dict()
+    assert heavy_hitters(df, "node", k=5).top(5).to_dict() == transitions.node_counts().head(5).to_dict()
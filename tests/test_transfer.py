@@ -0,0 +1,52 @@
+import json
+
+import pandas as pd
+
+from dff_node_stats import Saver, Stats
+from dff_node_stats import collectors as DSC
+from dff_node_stats.transfer import main, transfer
+
+
+def test_transfer(data_generator, tmp_path):
+    stats = Stats(saver=Saver("csv://{}".format(tmp_path / "source.csv")), collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    source_df = stats.saver.load(column_types=stats.column_dtypes, parse_dates=stats.parse_dates)
+
+    destination = Saver("csv://{}".format(tmp_path / "destination.csv"))
+    reports = []
+    result = transfer(
+        stats.saver, destination, stats.column_dtypes, stats.parse_dates, chunksize=5, progress=reports.append
+    )
+    assert result.rows == len(source_df)
+    assert result.chunks == len(reports) > 1
+    destination_df = destination.load(column_types=stats.column_dtypes, parse_dates=stats.parse_dates)
+    pd.testing.assert_frame_equal(destination_df, source_df)
+
+
+def test_transfer_resume(data_generator, tmp_path):
+    stats = Stats(saver=Saver("csv://{}".format(tmp_path / "source.csv")), collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    source_len = len(stats.saver.load(column_types=stats.column_dtypes, parse_dates=stats.parse_dates))
+
+    destination = Saver("csv://{}".format(tmp_path / "destination.csv"))
+    checkpoint = tmp_path / "checkpoint.json"
+    _, first_watermark = next(stats.saver.iter_load(stats.column_dtypes, stats.parse_dates, chunksize=5))
+    checkpoint.write_text(json.dumps(list(first_watermark)))
+
+    result = transfer(stats.saver, destination, chunksize=5, checkpoint=str(checkpoint))
+    assert result.rows == source_len - 5
+    assert len(destination.load(column_types=stats.column_dtypes, parse_dates=stats.parse_dates)) == source_len - 5
+    assert json.loads(checkpoint.read_text())[2] == result.watermark.stop
+
+
+def test_transfer_cli(data_generator, tmp_path, monkeypatch):
+    stats = Stats(saver=Saver("csv://{}".format(tmp_path / "source.csv")), collectors=[DSC.NodeLabelCollector()])
+    data_generator(stats, 3).save()
+    saved = []
+    monkeypatch.setattr("dff_node_stats.savers.csv.CsvSaver.save", lambda self, dfs, **kwargs: saved.extend(dfs))
+
+    source, destination = "csv://{}".format(tmp_path / "source.csv"), "csv://{}".format(tmp_path / "destination.csv")
+    main([source, destination, "--chunksize", "5"])
+    assert sum(len(df) for df in saved) == len(stats.saver.load())
+    assert all(pd.api.types.is_datetime64_any_dtype(df["start_time"]) for df in saved)
+    assert all(isinstance(df["node_label"].dtype, pd.CategoricalDtype) for df in saved)
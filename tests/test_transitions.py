@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from dff_node_stats.transitions import get_transitions
+from dff_node_stats.utils import DffStatsException
+
+
+@pytest.fixture
+def dialogs():
+    return pd.DataFrame(
+        {
+            "context_id": ["a", "b", "a", "a", "b", "b"],
+            "history_id": [0, 0, 2, 1, 1, 2],
+            "duration_time": [1.0, 1.0, 3.0, 2.0, 4.0, 6.0],
+            "flow_label": ["root", "root", "animals", "animals", "animals", "animals"],
+            "node_label": ["start", "start", "what_animal", "have_pets", "have_pets", "ask_about_breed"],
+        }
+    )
+
+
+def test_transition_counts(dialogs):
+    counts = get_transitions(dialogs).counts()
+    assert counts.to_dict() == {
+        "root:start->animals:have_pets": 2,
+        "animals:have_pets->animals:ask_about_breed": 1,
+        "animals:have_pets->animals:what_animal": 1,
+    }
+
+
+def test_transition_probabilities(dialogs):
+    probs = get_transitions(dialogs).probabilities()
+    assert probs["root:start->animals:have_pets"] == 1.0
+    assert probs["animals:have_pets->animals:what_animal"] == 0.5
+
+
+def test_transition_durations(dialogs):
+    durations = get_transitions(dialogs).mean_durations()
+    assert durations["root:start->animals:have_pets"] == 3.0
+    assert durations["animals:have_pets->animals:ask_about_breed"] == 6.0
+
+
+def test_missing_columns():
+    with pytest.raises(DffStatsException):
+        get_transitions(pd.DataFrame(columns=["context_id"]))
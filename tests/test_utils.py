@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from dff_node_stats.utils import TransformCache
+
+
+def test_transform_cache():
+    calls = []
+
+    def transform(df):
+        calls.append(id(df))
+        return df.assign(doubled=df["value"] * 2)
+
+    cache = TransformCache()
+    df = pd.DataFrame({"value": np.arange(10)})
+    first = cache.get_or_compute(transform, df)
+    assert cache.get_or_compute(transform, df) is first
+    assert cache.get_or_compute(transform, df.copy()) is not first
+    assert len(calls) == 2
+    info = cache.info()
+    assert (info.hits, info.misses) == (1, 2)
+
+    del df, first
+    gc.collect()
+    assert cache.info().entries == 0
+
+
+def test_transform_cache_eviction():
+    cache = TransformCache(max_bytes=1000)
+    frames = [pd.DataFrame({"value": np.arange(100)}) for _ in range(3)]
+    for df in frames:
+        cache.get_or_compute(np.asarray, df)
+    info = cache.info()
+    assert info.entries == 1 and info.evictions == 2
+    assert info.nbytes <= 1000
+
+
+def test_transform_cache_concurrency():
+    calls = []
+    lock = threading.Lock()
+
+    def transform(df):
+        with lock:
+            calls.append(id(df))
+        time.sleep(0.05)
+        return df["value"].sum()
+
+    cache = TransformCache()
+    frames = [pd.DataFrame({"value": np.arange(10) + i}) for i in range(4)]
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda i: cache.get_or_compute(transform, frames[i % 4]), range(64)))
+    assert len(calls) == 4
+    assert results == [frames[i % 4]["value"].sum() for i in range(64)]
+
+
+def test_transform_cache_version():
+    cache = TransformCache()
+    versions = set()
+    for i in range(100):  # the ids of the collected frames are reused
+        df = pd.DataFrame({"value": [i]})
+        versions.add(cache.version(df))
+        assert cache.get_or_compute(lambda df: int(df["value"].iloc[0]), df, name="first") == i
+        del df
+    assert len(versions) == 100
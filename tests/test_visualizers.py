@@ -1,13 +1,19 @@
 import pytest
+import json
+import shutil
 import sys
 
 try:
+    import graphviz
     from plotly.basedatatypes import BaseFigure
 except ImportError:
     pass
 from dff_node_stats.widgets import visualizers as vs
 from dff_node_stats.utils import DffStatsException
+import numpy as np
 import pandas as pd
+from dff_node_stats import Saver, Stats
+from dff_node_stats import collectors as DSC
 
 
 def test_colors():
@@ -31,9 +37,119 @@ def test_error_raising():
         (vs.show_transition_graph),
         (vs.show_transition_trace),
         (vs.show_transition_duration),
+        (vs.show_duration_percentiles),
         (vs.show_transition_counters),
+        (vs.show_unique_dialogs),
+        (vs.show_top_paths),
+        (vs.show_dialog_lengths),
+        (vs.show_drop_off_nodes),
+        (vs.show_throughput_and_latency),
     ],
 )
 def test_plots(testing_dataframe, plottype):
     fig = plottype(testing_dataframe)
     assert isinstance(fig, BaseFigure)
+
+
+@pytest.mark.skipif("plotly" not in sys.modules, reason="plotly not installed")
+def test_lazy_plots(data_generator, tmp_path):
+    stats = Stats(
+        saver=Saver("csv://{}".format(tmp_path / "stats.csv")),
+        collectors=[DSC.NodeLabelCollector(), DSC.RequestCollector()],
+    )
+    data_generator(stats, 3).save()
+    lazy_df = stats.lazy_dataframe()
+    assert isinstance(vs.show_transition_duration(lazy_df), BaseFigure)
+    assert isinstance(vs.show_node_counters(lazy_df), BaseFigure)
+    assert "user_request" not in lazy_df.loaded_columns
+    assert len(lazy_df) == len(stats.dataframe)
+
+
+@pytest.mark.skipif("plotly" not in sys.modules, reason="plotly not installed")
+def test_sketch_plots(data_generator, tmp_path):
+    stats = Stats(
+        saver=Saver("csv://{}".format(tmp_path / "stats.csv")), collectors=[DSC.NodeLabelCollector()], sketches=True
+    )
+    data_generator(stats, 3).save()
+    stats.flush_sketches()
+    assert isinstance(vs.show_unique_dialogs.from_sketches(stats.load_sketches()), BaseFigure)
+    assert isinstance(vs.show_duration_percentiles.from_sketches(stats.load_sketches()), BaseFigure)
+    assert isinstance(vs.show_duration_time.from_sketches(stats.load_sketches()), BaseFigure)
+    with pytest.raises(DffStatsException):
+        vs.show_unique_dialogs.from_sketches(stats.load_sketches().prefixed("duration/"))
+
+
+@pytest.mark.skipif("plotly" not in sys.modules, reason="plotly not installed")
+@pytest.mark.skipif(shutil.which("dot") is None, reason="graphviz executables not installed")
+def test_transition_graph_cache(testing_dataframe):
+    vs.graph_cache.clear()
+    png = vs.show_transition_graph(testing_dataframe)
+    assert png.data[0].source.startswith("data:image/png;base64,")
+    svg = vs.show_transition_graph(testing_dataframe, output_format="svg")
+    assert svg.data[0].source.startswith("data:image/svg+xml;base64,")
+    assert vs.show_transition_graph(testing_dataframe, output_format="svg").data[0].source == svg.data[0].source
+    assert len(vs.graph_cache._layouts) == 1 and len(vs.graph_cache._renders) == 2
+    copy = testing_dataframe.assign(context_id=testing_dataframe["context_id"].astype(str) + "_copy")
+    vs.show_transition_graph(pd.concat([testing_dataframe, copy], ignore_index=True))  # the counts change only
+    assert len(vs.graph_cache._layouts) == 1 and len(vs.graph_cache._renders) == 3
+    assert isinstance(vs.show_transition_graph(testing_dataframe, top_k=2), BaseFigure)
+    with pytest.raises(DffStatsException):
+        vs.show_transition_graph(testing_dataframe, output_format="gif")
+
+
+@pytest.mark.skipif("plotly" not in sys.modules, reason="plotly not installed")
+def test_transition_graph_layout_reuse(monkeypatch):
+    calls = []
+
+    def pipe(graph, format=None, engine=None, neato_no_op=None, **kwargs):
+        calls.append((format, engine, neato_no_op))
+        if format == "json":
+            names = [line.split()[0] for line in graph.body if line.strip().startswith("n") and "->" not in line]
+            objects = [{"_gvid": i, "name": name, "pos": f"{i},{i}"} for i, name in enumerate(names)]
+            objects = [dict(obj, width="1", height="0.5") for obj in objects]
+            return json.dumps({"bb": "0,0,10,10", "objects": objects, "edges": []}).encode()
+        assert 'pos="' in graph.source
+        return graph.source.encode()
+
+    def dialogs(number: int) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "context_id": np.repeat(np.arange(number).astype(str), 3),
+                "history_id": np.tile([-1, 0, 1], number),
+                "flow_label": "root",
+                "node_label": np.tile(["start", "ask", "end"], number),
+            }
+        )
+
+    monkeypatch.setattr(graphviz.Digraph, "pipe", pipe)
+    vs.graph_cache.clear()
+    vs.show_transition_graph(dialogs(2))
+    assert calls == [("json", None, None), ("png", "neato", 2)]
+    vs.show_transition_graph(dialogs(2))
+    assert len(calls) == 2  # the image is cached
+    vs.show_transition_graph(dialogs(3))
+    assert calls[2:] == [("png", "neato", 2)]  # only the counts changed: the layout is reused
+    vs.show_transition_graph(dialogs(30))
+    assert calls[3:] == [("json", None, None), ("png", "neato", 2)]  # the labels got wider: a new layout
+
+
+def test_nodes_and_edges():
+    df = pd.DataFrame(
+        {
+            "context_id": ["a", "b", "a", "a", "b"],
+            "history_id": [0, 0, 2, 1, 1],
+            "flow_label": ["root", "root", "animals", "animals", "root"],
+            "node_label": ["start", "start", "what_animal", "have_pets", "fallback"],
+        }
+    )
+    columns = list(df.columns)
+    result = vs.get_nodes_and_edges(df)
+    assert list(df.columns) == columns
+    assert result["node"].tolist()[2] == "animals:what_animal"
+    assert result["edge"].isna().tolist() == [True, True, False, False, False]
+    assert result["edge"].tolist()[2:] == [
+        "animals:have_pets->animals:what_animal",
+        "root:start->animals:have_pets",
+        "root:start->root:fallback",
+    ]
+    assert result["edge_type"].tolist()[2:] == ["animals", "MIXED", "root"]